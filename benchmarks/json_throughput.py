@@ -0,0 +1,83 @@
+"""
+Request and response JSON throughput for payloads from 1 KB to 10 MB
+
+For every installed serializer (json, ujson, orjson) a module echoes the parsed request body through the
+JSON middleware. "request" measures parsing with req.json, "response" serializing with the middleware and
+"roundtrip" a whole request through the WSGI app.
+
+Usage:
+    python benchmarks/json_throughput.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.test import EnvironBuilder  # noqa: E402
+
+from swapy import _utils, serializers  # noqa: E402
+from swapy.middlewares import JsonMiddleware  # noqa: E402
+from swapy.testing import client  # noqa: E402
+from swapy.wrappers import Request  # noqa: E402
+
+SIZES = [('1 KB', 1024), ('10 KB', 10 * 1024), ('100 KB', 100 * 1024), ('1 MB', 1024 * 1024),
+         ('10 MB', 10 * 1024 * 1024)]
+
+
+def payload(size):
+    item = {'id': 12345, 'name': 'swapy', 'tags': ['fast', 'json'], 'score': 1.5, 'active': True}
+    count = max(1, size // len(json.dumps(item)))
+    return {'items': [dict(item, id=i) for i in range(count)]}
+
+
+def measure(f, size, budget=0.5):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        f()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed > budget:
+            return size * count / elapsed / 1024 / 1024
+
+
+def main():
+    names = []
+    for name in ('json', 'ujson', 'orjson'):
+        try:
+            serializers.get(name)
+            names.append(name)
+        except ImportError:
+            pass
+    print('{:>10} {:>8} {:>16} {:>16} {:>16}'.format('serializer', 'payload', 'request MB/s', 'response MB/s',
+                                                    'roundtrip MB/s'))
+    for name in names:
+        module = 'bench_json_{}'.format(name)
+        _utils.json_serializer(module, name)
+        state = _utils.state(module)
+        _utils.register_route(module, '/', ['POST'])(JsonMiddleware(lambda req: req.json))
+        c = client(_utils.build_app(module))
+        for label, size in SIZES:
+            data = json.dumps(payload(size)).encode()
+            environ = EnvironBuilder('/', method='POST', data=data,
+                                     headers={'Content-Type': 'application/json'}).get_environ()
+
+            def parse():
+                environ['wsgi.input'].seek(0)
+                req = Request(environ)
+                req.state = state
+                return req.json
+
+            obj = parse()
+            req = Request(environ)
+            req.state = state
+            encode = JsonMiddleware(lambda r: obj)
+            print('{:>10} {:>8} {:>16.1f} {:>16.1f} {:>16.1f}'.format(
+                name, label, measure(parse, len(data)), measure(lambda: encode(req), len(data)),
+                measure(lambda: c.post('/', data=data), len(data))))
+
+
+if __name__ == '__main__':
+    main()
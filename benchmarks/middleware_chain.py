@@ -0,0 +1,59 @@
+"""
+Per-request overhead of the middleware chain with 0, 3 and 10 middlewares
+
+"before" re-applies every middleware on each request like swapy did before routes were compiled,
+"after" calls the compiled route function which is cached in the route entry.
+
+Usage:
+    python benchmarks/middleware_chain.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from swapy import _utils  # noqa: E402
+from swapy.testing import client  # noqa: E402
+
+
+def passthrough(f):
+    def handle(*args, **kwargs):
+        return f(*args, **kwargs)
+    return handle
+
+
+def handler(req):
+    return 'Hello'
+
+
+def rewrap(middlewares):
+    def handle(*args, **kwargs):
+        target = handler
+        for m in middlewares:
+            target = m(target)
+        return target(*args, **kwargs)
+    return handle
+
+
+def main(number=100000):
+    print('{:>12} {:>14} {:>14} {:>14}'.format('middlewares', 'before (us)', 'after (us)', 'request (us)'))
+    for count in (0, 3, 10):
+        module = 'bench_middlewares_{}'.format(count)
+        middlewares = [passthrough] * count
+        _utils.use(module, *middlewares)
+        _utils.register_route(module, '/', ['GET'])(handler)
+        app = _utils.build_app(module)
+        route = list(_utils.state(module).routes.values())[0]
+
+        before = timeit.timeit(lambda: rewrap(middlewares)(None), number=number)
+        after = timeit.timeit(lambda: route['function'](None), number=number)
+        c = client(app)
+        requests = number // 20
+        request = timeit.timeit(lambda: c.get('/'), number=requests)
+        print('{:>12} {:>14.3f} {:>14.3f} {:>14.3f}'.format(count, before / number * 1e6, after / number * 1e6,
+                                                            request / requests * 1e6))
+
+
+if __name__ == '__main__':
+    main()
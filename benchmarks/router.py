@@ -0,0 +1,53 @@
+"""
+Url matching of the radix router compared to werkzeug's Map for 10, 100 and 1000 routes
+
+Every route has a static prefix and an int argument. The matched paths are spread over all routes.
+
+Usage:
+    python benchmarks/router.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.routing import Map, Rule  # noqa: E402
+
+from swapy.routing import RadixRouter  # noqa: E402
+
+
+def build(count):
+    rules = []
+    for i in range(count):
+        rules.append(Rule('/api/v1/resource{}/<int:id>'.format(i), endpoint='resource{}'.format(i),
+                          methods=['GET'], strict_slashes=False))
+        rules.append(Rule('/api/v1/resource{}'.format(i), endpoint='list{}'.format(i),
+                          methods=['GET'], strict_slashes=False))
+    return Map(rules[:count])
+
+
+def main(number=2000):
+    print('{:>8} {:>16} {:>16} {:>10}'.format('routes', 'werkzeug (us)', 'radix (us)', 'speedup'))
+    for count in (10, 100, 1000):
+        url_map = build(count)
+        router = RadixRouter(url_map)
+        adapter = url_map.bind('localhost')
+        paths = ['/api/v1/resource{}/{}'.format(i, i) for i in range(0, count // 2, max(1, count // 20))]
+
+        def werkzeug_match():
+            for path in paths:
+                adapter.match(path, 'GET')
+
+        def radix_match():
+            for path in paths:
+                router.match(path, 'GET')
+
+        werkzeug_time = timeit.timeit(werkzeug_match, number=number) / (number * len(paths)) * 1e6
+        radix_time = timeit.timeit(radix_match, number=number) / (number * len(paths)) * 1e6
+        print('{:>8} {:>16.3f} {:>16.3f} {:>9.1f}x'.format(count, werkzeug_time, radix_time,
+                                                           werkzeug_time / radix_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Sign and verify throughput of secure cookies
+
+Compares swapy's signed cookies (json and, if installed, msgpack) with werkzeug's pickle based SecureCookie
+for a small session and a larger one. "sign" serializes and signs a cookie value, "verify" checks and loads it.
+The verify of swapy is measured with two rotated keys where the cookie was signed with the older one,
+which is the slowest case.
+
+Usage:
+    python benchmarks/secure_cookie.py
+"""
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from swapy import securecookie  # noqa: E402
+
+SESSIONS = [
+    ('small', {'user_id': 12345, 'csrf': 'a1b2c3d4e5f6', 'visits': 7}),
+    ('large', {'user_id': 12345, 'cart': [{'id': i, 'name': 'item {}'.format(i), 'count': 2} for i in range(40)]})
+]
+
+
+def measure(f, budget=0.5):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        f()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed > budget:
+            return count / elapsed
+
+
+def swapy_cases(data):
+    signer = securecookie.signer('new key')
+    rotated = securecookie.signer(['new key', 'old key'])
+    for name in ('json', 'msgpack'):
+        try:
+            securecookie.payload(name)
+        except ImportError:
+            continue
+        value = securecookie.dumps(data, securecookie.signer('old key'), name)
+        yield ('swapy ' + name, len(value), lambda name=name: securecookie.dumps(data, signer, name),
+               lambda name=name, value=value: securecookie.loads(value, rotated, name))
+
+
+def werkzeug_case(data):
+    # werkzeug warns that pickle will be replaced in 1.0 on every serialize
+    warnings.simplefilter('ignore', UserWarning)
+    from werkzeug.contrib.securecookie import SecureCookie
+    key = b'new key'
+    value = SecureCookie(data, key).serialize()
+    return ('werkzeug pickle', len(value), lambda: SecureCookie(data, key).serialize(),
+            lambda: SecureCookie.unserialize(value, key))
+
+
+def main():
+    print('{:>16} {:>8} {:>10} {:>12} {:>12}'.format('cookie', 'session', 'bytes', 'sign/s', 'verify/s'))
+    for label, data in SESSIONS:
+        for name, size, sign, verify in list(swapy_cases(data)) + [werkzeug_case(data)]:
+            print('{:>16} {:>8} {:>10} {:>12.0f} {:>12.0f}'.format(name, label, size, measure(sign),
+                                                                    measure(verify)))
+
+
+if __name__ == '__main__':
+    main()
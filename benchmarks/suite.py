@@ -0,0 +1,390 @@
+"""
+Benchmark suite for the whole dispatch pipeline
+
+Every scenario is a module with its own routes. The requests are sent through the WSGI interface in-process
+or with --socket through a local server. For every scenario it reports requests per second, the p50 and p99
+latency and the peak of the memory which is allocated during one request in bytes ('peak_alloc_bytes', measured
+in an extra run with tracemalloc). It is no count of allocations, tracemalloc only knows the size of the memory.
+
+The results are saved as JSON, --compare prints the change against an older result file.
+
+Usage:
+    python benchmarks/suite.py
+    python benchmarks/suite.py --socket --only text,json
+    python benchmarks/suite.py --socket --server swapy
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --compare before.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.serving import make_server  # noqa: E402
+from werkzeug.test import EnvironBuilder  # noqa: E402
+
+import swapy  # noqa: E402
+from swapy import _utils, serving  # noqa: E402
+from swapy.middlewares import JsonMiddleware  # noqa: E402
+
+_directory = os.path.dirname(os.path.abspath(__file__))
+_files = tempfile.mkdtemp(prefix='swapy-bench-')
+
+SCENARIOS = []
+
+
+def scenario(name, path='/', method='GET', headers=None, status=200):
+    """
+    Registers a function which sets up the routes of the module of a scenario
+
+    :param name: str
+    :param path: str
+        Path of the benchmarked request
+    :param method: str
+    :param headers: dict | None
+    :param status: int
+        Expected status code
+    """
+    def decorator(f):
+        SCENARIOS.append({'name': name, 'setup': f, 'path': path, 'method': method, 'headers': headers or {},
+                          'status': status})
+        return f
+    return decorator
+
+
+@scenario('text')
+def text(module):
+    _utils.register_route(module, '/', ['GET'])(lambda: 'Hello World')
+
+
+@scenario('json')
+def json_(module):
+    _utils.use(module, JsonMiddleware)
+    _utils.register_route(module, '/', ['GET'])(lambda: {'id': 1, 'name': 'swapy', 'tags': ['a', 'b'], 'ok': True})
+
+
+@scenario('url_args', '/users/42/posts/hello-world')
+def url_args(module):
+    def post(id, name):
+        return '{} {}'.format(id, name)
+    _utils.register_route(module, '/users/<int:id>/posts/<name>', ['GET'])(post)
+
+
+@scenario('not_found', '/missing', status=404)
+def not_found(module):
+    _utils.register_route(module, '/', ['GET'])(lambda: 'Hello World')
+
+
+@scenario('session_off')
+def session_off(module):
+    _utils.session(module, 'memory')
+    _utils.register_route(module, '/', ['GET'])(lambda req: 'Hello World')
+
+
+@scenario('session_on', headers={'Cookie': 'session_id=missing'})
+def session_on(module):
+    _utils.session(module, 'memory')
+
+    def handle(req):
+        req.session['visits'] = req.session.get('visits', 0) + 1
+        return 'Hello World'
+    _utils.register_route(module, '/', ['GET'])(handle)
+
+
+@scenario('secure_cookie')
+def secure_cookie(module):
+    _utils.environment(module, {'secret_key': 'benchmark'})
+
+    def handle(req):
+        req.secure_cookie['visits'] = req.secure_cookie.get('visits', 0) + 1
+        return 'Hello World'
+    _utils.register_route(module, '/', ['GET'])(handle)
+
+
+@scenario('render')
+def render(module):
+    items = [{'name': 'item {}'.format(i), 'value': i * 1.5} for i in range(50)]
+    _utils.register_route(module, '/', ['GET'])(lambda: swapy.render('templates/page.html', title='Items',
+                                                                     items=items))
+
+
+@scenario('file')
+def file(module):
+    path = os.path.join(_files, 'download.bin')
+    with open(path, 'wb') as f:
+        f.write(os.urandom(64 * 1024))
+    _utils.register_route(module, '/', ['GET'])(lambda: swapy.file(path))
+
+
+@scenario('static', '/static/style.css')
+def static(module):
+    directory = os.path.join(_files, 'static')
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'style.css'), 'w') as f:
+        f.write('body { color: #333; }\n' * 200)
+    _utils.state(module).shared.append((directory, '/static'))
+    _utils.register_route(module, '/', ['GET'])(lambda: 'Hello World')
+
+
+@scenario('include', '/api/resource199/7')
+def include(module):
+    included = module + '_api'
+    for i in range(200):
+        _utils.register_route(included, '/resource{}/<int:id>'.format(i), ['GET'])(lambda id: str(id))
+    _utils.include(module, _Module(included), '/api')
+
+
+class _Module:
+    """
+    Stand-in for a module object, include() only needs its name
+    """
+
+    def __init__(self, name):
+        self.__name__ = name
+
+
+def build(entry):
+    """
+    Returns the WSGI app of a scenario
+
+    :param entry: dict
+    :return: function
+    """
+    module = 'bench_{}'.format(entry['name'])
+    entry['setup'](module)
+    return _utils.build_app(module)
+
+
+def in_process(app, entry):
+    """
+    Returns a function which sends the request of the scenario to the app and returns the status code
+
+    :param app: function
+    :param entry: dict
+    :return: function
+    """
+    base = EnvironBuilder(entry['path'], method=entry['method'], headers=entry['headers']).get_environ()
+    status = []
+
+    def start_response(s, headers, exc_info=None):
+        status.append(s)
+
+    def request():
+        environ = dict(base)
+        environ['wsgi.input'] = BytesIO()
+        del status[:]
+        iterable = app(environ, start_response)
+        try:
+            for _ in iterable:
+                pass
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        return int(status[0].split(' ', 1)[0])
+    return request
+
+
+class _QuietHandler(serving.RequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def over_socket(app, entry, server_name='werkzeug'):
+    """
+    Starts a local server for the app and returns a function which sends the request to it
+    werkzeug's server gets a new connection per request, swapy's server one kept alive connection.
+
+    :param app: function
+    :param entry: dict
+    :param server_name: str
+        'werkzeug' or 'swapy'
+    :return: tuple
+        (function, function which stops the server)
+    """
+    if server_name == 'swapy':
+        server = serving.HTTPServer(app, '127.0.0.1', 0, threads=8)
+        server.bind()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        connection = http.client.HTTPConnection('127.0.0.1', server.port)
+
+        def request():
+            connection.request(entry['method'], entry['path'], headers=entry['headers'])
+            response = connection.getresponse()
+            response.read()
+            return response.status
+
+        def stop():
+            connection.close()
+            server.shutdown()
+            thread.join()
+        return request, stop
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=_QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+
+    def request():
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        try:
+            connection.request(entry['method'], entry['path'], headers=entry['headers'])
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+    return request, stop
+
+
+def measure(request, number, warmup):
+    """
+    Sends the requests and returns the results
+
+    :param request: function
+    :param number: int
+    :param warmup: int
+    :return: dict
+    """
+    for _ in range(warmup):
+        request()
+    latencies = []
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(number):
+        before = clock()
+        request()
+        latencies.append(clock() - before)
+    elapsed = clock() - start
+    latencies.sort()
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(number, 200)):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        request()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return {
+        'requests': number,
+        'rps': number / elapsed,
+        'p50_us': latencies[len(latencies) // 2] * 1e6,
+        'p99_us': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6,
+        'peak_alloc_bytes': sorted(peaks)[len(peaks) // 2]
+    }
+
+
+def commit():
+    """
+    Returns the current git commit or None
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=_directory,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path):
+    """
+    Prints the change of every scenario against the results of an older run
+
+    :param results: dict
+    :param path: str
+    """
+    with open(path) as f:
+        old = json.load(f)
+    print()
+    print('Compared to {} ({})'.format(path, old.get('commit')))
+    print('{:<14} {:>10} {:>10} {:>10}'.format('scenario', 'req/s', 'p99', 'peak'))
+    for name, new in results['results'].items():
+        before = old['results'].get(name)
+        if before is None:
+            continue
+        print('{:<14} {:>+9.1f}% {:>+9.1f}% {:>+9.1f}%'.format(
+            name, _change(before['rps'], new['rps']), _change(before['p99_us'], new['p99_us']),
+            _change(_peak(before), _peak(new))))
+
+
+def _peak(result):
+    # Results of older runs have the peak as 'alloc_bytes'
+    return result.get('peak_alloc_bytes', result.get('alloc_bytes', 0))
+
+
+def _change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the swapy dispatch pipeline')
+    parser.add_argument('--requests', type=int, default=5000, help='requests per scenario')
+    parser.add_argument('--warmup', type=int, default=200, help='requests before measuring')
+    parser.add_argument('--socket', action='store_true', help='send the requests through a local server')
+    parser.add_argument('--server', default='werkzeug', choices=('werkzeug', 'swapy'),
+                        help='server of --socket')
+    parser.add_argument('--only', default='', help='comma separated names of scenarios')
+    parser.add_argument('--output', default=None, help='JSON result file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', default=None, help='JSON result file of an older run')
+    args = parser.parse_args(argv)
+
+    only = {name for name in args.only.split(',') if name}
+    results = {
+        'commit': commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'transport': 'socket ({})'.format(args.server) if args.socket else 'wsgi',
+        'results': {}
+    }
+    print('{:<14} {:>10} {:>10} {:>10} {:>12}'.format('scenario', 'req/s', 'p50 (us)', 'p99 (us)', 'peak (B)'))
+    for entry in SCENARIOS:
+        if only and entry['name'] not in only:
+            continue
+        app = build(entry)
+        stop = None
+        if args.socket:
+            request, stop = over_socket(app, entry, args.server)
+        else:
+            request = in_process(app, entry)
+        try:
+            status = request()
+            if status != entry['status']:
+                raise RuntimeError('Scenario "{}" returned {} instead of {}'.format(entry['name'], status,
+                                                                                  entry['status']))
+            result = measure(request, args.requests, args.warmup)
+        finally:
+            if stop is not None:
+                stop()
+        results['results'][entry['name']] = result
+        print('{:<14} {:>10.0f} {:>10.1f} {:>10.1f} {:>12}'.format(entry['name'], result['rps'], result['p50_us'],
+                                                                   result['p99_us'], result['peak_alloc_bytes']))
+
+    output = args.output
+    if output is None:
+        directory = os.path.join(_directory, 'results')
+        os.makedirs(directory, exist_ok=True)
+        output = os.path.join(directory, '{}{}.json'.format(results['commit'] or time.strftime('%Y%m%d%H%M%S'),
+                                                            '-' + args.server if args.socket else ''))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Saved results to {}'.format(output))
+    if args.compare:
+        compare(results, args.compare)
+    return results
+
+
+if __name__ == '__main__':
+    main()
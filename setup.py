@@ -9,5 +9,6 @@ setup(
     url='https://github.com/danieldaeschle/swapy',
     packages=['swapy'],
     install_requires=['werkzeug', 'jinja2'],
+    python_requires='>=3.7',
     license='MIT'
 )
@@ -1,21 +1,21 @@
 import os
+import time
 import mimetypes
 
-from werkzeug.serving import run_simple
-from werkzeug.wsgi import FileWrapper
 from werkzeug.urls import iri_to_uri
 from werkzeug.utils import escape
 
-from jinja2 import FileSystemLoader
-from jinja2.environment import Environment
-
-from . import _utils
+from . import _utils, files, compression, pools, streaming, hooks
 from .wrappers import Response
 
+#: Submodules which are imported at the first access, so 'import swapy' doesn't load the servers and asyncio
+_lazy_modules = ('asgi', 'cache', 'serving')
+
 
 def render(file_path, **kwargs):
     """
     Returns a rendered HTML file
+    The template is compiled once and cached per directory of the calling module
 
     :param file_path: str
         Path to file including filename and extension
@@ -24,12 +24,47 @@ def render(file_path, **kwargs):
     :return: str
         Rendered HTML file
     """
-    module = _utils.caller_frame()
-    path = os.path.dirname(os.path.realpath(module.f_globals['__file__']))
-    env = Environment()
-    env.loader = FileSystemLoader(path)
-    template = env.get_template(file_path)
-    return template.render(kwargs)
+    directory = _utils.template_directory(_utils.caller_frame())
+    template = _utils.template_environment(directory).get_template(file_path)
+    if not hooks.registry['template_rendered']:
+        return template.render(kwargs)
+    start = time.perf_counter()
+    result = template.render(kwargs)
+    hooks.fire('template_rendered', file_path, time.perf_counter() - start)
+    return result
+
+
+def templates(auto_reload=None, bytecode_cache=None, cache_size=None):
+    """
+    Sets the template options
+
+    :param auto_reload: bool | None
+        Reloads changed templates at render
+        run() sets it to the value of debug
+        Default = None (unchanged)
+    :param bytecode_cache: bool | str | None
+        Directory for jinja2's bytecode cache or True to use the temp directory
+        Default = None (unchanged)
+    :param cache_size: int | None
+        Number of compiled templates which are kept in memory per directory, -1 for all
+        Default = None (unchanged)
+    """
+    _utils.templates(auto_reload, bytecode_cache, cache_size)
+
+
+def precompile_templates(extensions=('html', 'htm', 'xml', 'txt', 'j2', 'jinja', 'jinja2')):
+    """
+    Compiles all templates in the directory of the calling module and in all directories which were used by render
+
+    Call it at startup to avoid compiling templates on the first requests.
+
+    :param extensions: list | tuple
+        File extensions of templates
+        Default = ('html', 'htm', 'xml', 'txt', 'j2', 'jinja', 'jinja2')
+    :return: int
+        Number of compiled templates
+    """
+    return _utils.precompile_templates(_utils.template_directory(_utils.caller_frame()), extensions)
 
 
 def redirect(location, code=301):
@@ -56,9 +91,11 @@ def redirect(location, code=301):
     return Response(content, code, {'Location': location, 'Content-Type': 'text/html'})
 
 
-def file(path, name=None):
+def file(path, name=None, cache_control=None):
     """
-    Returns a file response
+    Returns a file response which the browser downloads
+
+    The response supports conditional requests (ETag, Last-Modified) and byte ranges.
 
     :param path: str
         Path to the file
@@ -66,40 +103,128 @@ def file(path, name=None):
         Name of the file which will be returned.
         If it is None the name is like the real file name.
         Default = None
-    :return: :class:`werkzeug.wsgi.FileWrapper`
+    :param cache_control: str | int | None
+        Value of the Cache-Control header or max-age in seconds
+        Default = None
+    :return: :class:`swapy.files.FileResponse`
+    """
+    if not os.path.isabs(path):
+        caller_file = os.path.abspath(_utils.caller_frame().f_globals['__file__'])
+        path = caller_file.replace(os.path.basename(caller_file), path)
+    return files.send_file(path, name, as_attachment=True, cache_control=cache_control)
+
+
+def send_file(path, name=None, as_attachment=False, mimetype=None, cache_control=None, conditional=True):
+    """
+    Returns a file response
+
+    If-None-Match and If-Modified-Since are answered with 304, Range with 206 (multiple ranges as
+    multipart/byteranges) and unsatisfiable ranges with 416.
+
+    :param path: str
+        Path to the file, relative paths are relative to the calling module
+    :param name: str
+        File name for the Content-Disposition header
+        Default = None (the real file name)
+    :param as_attachment: bool
+        Tells the browser to download the file
+        Default = False
+    :param mimetype: str
+        Default = None (guessed from the file name)
+    :param cache_control: str | int | None
+        Value of the Cache-Control header or max-age in seconds
+        Default = None
+    :param conditional: bool
+        Handles conditional and range requests
+        Default = True
+    :return: :class:`swapy.files.FileResponse`
     """
     if not os.path.isabs(path):
         caller_file = os.path.abspath(_utils.caller_frame().f_globals['__file__'])
         path = caller_file.replace(os.path.basename(caller_file), path)
-    f = open(path, 'rb')
-    if f:
-        mime = mimetypes.guess_type(path)[0]
-        size = os.path.getsize(path)
-        filename = os.path.basename(path) if not name else name
-        headers = {'Content-Type': mime, 'Content-Disposition': 'attachment;filename=' + filename,
-                   'Content-Length': size}
-        return FileWrapper(f, 8192), 200, headers
-    raise FileNotFoundError()
+    return files.send_file(path, name, as_attachment, mimetype, cache_control, conditional)
 
 
-def raw_file(path):
+def raw_file(path, stream=False):
     """
     Returns the raw content of a file
 
     :param path: str
         Path to the file
-    :return: str
+    :param stream: bool
+        Returns the content as iterable of byte chunks which never holds the whole file in memory
+        Default = False
+    :return: tuple
+        (content, 200, headers)
     """
     if not os.path.isabs(path):
         caller_file = os.path.abspath(_utils.caller_frame().f_globals['__file__'])
         path = caller_file.replace(os.path.basename(caller_file), path)
-    f = open(path, 'r')
-    if f:
-        mime = mimetypes.guess_type(path)[0]
-        size = os.path.getsize(path)
-        headers = {'Content-Type': mime, 'Content-Length': size}
+    mime = mimetypes.guess_type(path)[0]
+    size = os.path.getsize(path)
+    headers = {'Content-Type': mime, 'Content-Length': size}
+    if stream:
+        return files.FileContent(path, 0, size), 200, headers
+    with open(path, 'r') as f:
         return f.read(), 200, headers
-    raise FileNotFoundError()
+
+
+def stream(iterable, mimetype='application/octet-stream', code=200, headers=None, on_close=None):
+    """
+    Returns a response which sends the items (str or bytes) of an iterable while they are produced
+    The body is never buffered, a generator is closed when the client disconnects.
+
+    Example:
+        def rows():
+            for row in cursor:
+                yield '{},{}\\n'.format(*row)
+        return swapy.stream(rows(), 'text/csv', on_close=cursor.close)
+
+    :param iterable: iterable
+    :param mimetype: str
+        Default = 'application/octet-stream'
+    :param code: int
+        Default = 200
+    :param headers: dict | None
+        Default = None
+    :param on_close: function | None
+        Called when the response is finished or the client disconnected
+        Default = None
+    :return: :class:`swapy.streaming.StreamResponse`
+    """
+    return streaming.stream(iterable, mimetype, code, headers, on_close)
+
+
+def ndjson(iterable, code=200, headers=None, on_close=None):
+    """
+    Returns a response which streams every item as one line of JSON
+    The items are serialized with the JSON serializer of the module
+
+    :param iterable: iterable
+    :param code: int
+        Default = 200
+    :param headers: dict | None
+        Default = None
+    :param on_close: function | None
+        Default = None
+    :return: :class:`swapy.streaming.StreamResponse`
+    """
+    return streaming.ndjson(iterable, code, headers, on_close, _utils.state(_utils.caller()).json)
+
+
+def sse(iterable, headers=None, on_close=None):
+    """
+    Returns a response which streams the items as Server-Sent Events
+    Items are data (str or JSON) or dicts with the keys 'data', 'event', 'id' and 'retry'
+
+    :param iterable: iterable
+    :param headers: dict | None
+        Default = None
+    :param on_close: function | None
+        Default = None
+    :return: :class:`swapy.streaming.StreamResponse`
+    """
+    return streaming.sse(iterable, headers, on_close, _utils.state(_utils.caller()).json)
 
 
 def favicon(path):
@@ -173,6 +298,29 @@ def ssl(host='127.0.0.1', path=None):
     _utils.ssl(_utils.caller(), host, path)
 
 
+def session_store(store='filesystem', **options):
+    """
+    Sets the store for the sessions of this module
+
+    Sessions are only opened if a route accesses req.session.
+    Available stores:
+    - 'filesystem': One pickle file per session in the temp directory
+    - 'memory': In memory LRU with 'max_entries' and 'ttl'
+    - 'sqlite': SQLite database in WAL mode with batched writes ('path', 'ttl', 'batch_size', 'flush_interval')
+    - 'cookie': Signed cookie without any data on the server ('secret_key', 'cookie_name', 'max_age')
+
+    Example:
+        session_store('memory', max_entries=1000, ttl=600)
+
+    :param store: str | dict | :class:`swapy.sessions.SessionStore`
+        Name of the store, a dict with the name as 'store' and the options or a store object
+        Default = 'filesystem'
+    :param options: object
+        Arguments for the store
+    """
+    _utils.session(_utils.caller(), store, **options)
+
+
 def error(f):
     """
     Registers a function as error handler
@@ -199,6 +347,115 @@ def shared(directory, url=None):
     _utils.shared(module, directory, url)
 
 
+def precompress(formats=('gzip', 'br'), min_size=500, level=9):
+    """
+    Writes compressed siblings (.gz and .br if brotli is installed) of the files in the shared directories
+
+    Run it as build step. The shared files are then sent compressed without compressing them per request.
+
+    :param formats: list | tuple
+        Default = ('gzip', 'br')
+    :param min_size: int
+        Smaller files are skipped
+        Default = 500
+    :param level: int
+        Default = 9
+    :return: int
+        Number of written files
+    """
+    module = _utils.caller()
+    state = _utils.state(module)
+    count = compression.precompress([directory for directory, _ in state.shared], formats, min_size, level)
+    if state.static is not None:
+        state.static.refresh()
+    return count
+
+
+def static_url(name):
+    """
+    Returns the url of a shared file with a hash of its content
+    The url changes with the content, so it is sent with a Cache-Control header for one year
+
+    Example:
+        static_url('app.js')  # '/shared/app.3f9c1a2b.js'
+
+    :param name: str
+        Path of the file in a shared directory or its url
+    :return: str
+    """
+    return _utils.static_url(_utils.caller(), name)
+
+
+def static_cache(max_bytes=16 * 1024 * 1024, max_file_size=256 * 1024):
+    """
+    Sets the limits of the memory cache for the shared files of this module
+    The shared directories are indexed when the app is built, call refresh_shared() after files were added
+
+    :param max_bytes: int
+        Size of all cached files
+        Default = 16 MiB
+    :param max_file_size: int
+        Bigger files are always read from the disk
+        Default = 256 KiB
+    """
+    _utils.static_cache(_utils.caller(), max_bytes, max_file_size)
+
+
+def refresh_shared():
+    """
+    Scans the shared directories of this module again and empties the memory cache
+    """
+    _utils.static_index(_utils.caller()).refresh()
+
+
+def pool(name='blocking', max_workers=8, max_queue=64, retry_after=1):
+    """
+    Sets the size of a thread pool for blocking routes
+    Routes use it with on_get(url, blocking=name) or BlockingMiddleware(pool=name)
+    With run() and serve() the server thread waits while the route runs in the pool, so the pool limits the
+    blocking work but doesn't free server threads. asgi_app() awaits blocking routes on the event loop.
+
+    :param name: str
+        Default = 'blocking'
+    :param max_workers: int
+        Number of requests which run at the same time
+        Default = 8
+    :param max_queue: int
+        Number of requests which wait, further requests get a 503 response
+        Default = 64
+    :param retry_after: int
+        Seconds for the Retry-After header of the 503 response
+        Default = 1
+    """
+    pools.configure(name, max_workers, max_queue, retry_after)
+
+
+def pool_stats():
+    """
+    Returns the queue depth, wait times and counters of all pools
+
+    :return: dict
+        Example: {'blocking': {'queued': 0, 'running': 2, 'completed': 10, 'rejected': 0, 'wait_avg': 0.01, ...}}
+    """
+    return pools.stats()
+
+
+def hook(name):
+    """
+    Decorator which adds a function to an instrumentation hook
+    The hooks are global and apply to all modules, see swapy.hooks for their names and arguments
+
+    Example:
+        @hook('response_sent')
+        def log(req, response, duration):
+            print(req.path, response.status_code, duration)
+
+    :param name: str
+    :return: function
+    """
+    return lambda f: hooks.register(name, f)
+
+
 def not_found(f):
     """
     Registers a function as 404 error handler
@@ -219,7 +476,24 @@ def routes():
     return [item[1]['url'] for item in list(_utils.state(module).routes.items())]
 
 
-def on(url='/', methods=('GET', 'POST', 'PUT', 'DELETE')):
+def url_for(endpoint, **values):
+    """
+    Returns the url of a route of this module
+
+    Example:
+        url_for(user, id=5)
+        url_for('app.user:GET', id=5, page=2)  # '/users/5?page=2'
+
+    :param endpoint: str | function
+        Endpoint or function of the route
+    :param values: object
+        Url arguments, others are appended as query string
+    :return: str
+    """
+    return _utils.url_for(_utils.caller(), endpoint, values)
+
+
+def on(url='/', methods=('GET', 'POST', 'PUT', 'DELETE'), blocking=False):
     """
     Route registerer for all http methods
 
@@ -227,49 +501,64 @@ def on(url='/', methods=('GET', 'POST', 'PUT', 'DELETE')):
     :param methods: list | tuple
         HTTP method
         Default = ('GET', 'POST', 'PUT', 'DELETE')
+    :param blocking: bool | str
+        Runs the route in the 'blocking' pool or the pool with the given name
+        Default = False
     :return: function
     """
-    return _utils.register_route(_utils.caller(), url, methods)
+    return _utils.register_route(_utils.caller(), url, methods, blocking)
 
 
-def on_get(url='/'):
+def on_get(url='/', blocking=False):
     """
     Route registerer for GET http method
 
     :param url: str
+    :param blocking: bool | str
+        Runs the route in the 'blocking' pool or the pool with the given name
+        Default = False
     :return: function
     """
-    return _utils.register_route(_utils.caller(), url, methods=['GET'])
+    return _utils.register_route(_utils.caller(), url, methods=['GET'], blocking=blocking)
 
 
-def on_post(url='/'):
+def on_post(url='/', blocking=False):
     """
     Route registerer for POST http method
 
     :param url: str
+    :param blocking: bool | str
+        Runs the route in the 'blocking' pool or the pool with the given name
+        Default = False
     :return: function
     """
-    return _utils.register_route(_utils.caller(), url, methods=['POST'])
+    return _utils.register_route(_utils.caller(), url, methods=['POST'], blocking=blocking)
 
 
-def on_put(url='/'):
+def on_put(url='/', blocking=False):
     """
     Route registerer for PUT http method
 
     :param url: str
+    :param blocking: bool | str
+        Runs the route in the 'blocking' pool or the pool with the given name
+        Default = False
     :return: function
     """
-    return _utils.register_route(_utils.caller(), url, methods=['PUT'])
+    return _utils.register_route(_utils.caller(), url, methods=['PUT'], blocking=blocking)
 
 
-def on_delete(url='/'):
+def on_delete(url='/', blocking=False):
     """
     Route registerer for DELETE http method
 
     :param url: str
+    :param blocking: bool | str
+        Runs the route in the 'blocking' pool or the pool with the given name
+        Default = False
     :return: function
     """
-    return _utils.register_route(_utils.caller(), url, methods=['DELETE'])
+    return _utils.register_route(_utils.caller(), url, methods=['DELETE'], blocking=blocking)
 
 
 def include(module, prefix=''):
@@ -287,7 +576,7 @@ def include(module, prefix=''):
 
 def config(cfg):
     """
-    A short function for all other setting functions like: include, ssl, error, favicon etc.
+    A short function for all other setting functions like: include, ssl, error, favicon, session etc.
     It also handles the entry 'environment' key which can contains 'production' and 'development' or just
         global variables.
     The variables can used by extensions.
@@ -335,10 +624,88 @@ def config(cfg):
             _utils.shared(_utils.caller_frame(), cfg['shared'])
         if cfg.get('environment'):
             _utils.environment(module, cfg['environment'])
+        if cfg.get('session'):
+            _utils.session(module, cfg['session'])
+        if cfg.get('templates'):
+            _utils.templates(**cfg['templates'])
+        if cfg.get('router'):
+            _utils.router(module, cfg['router'])
+        if cfg.get('json'):
+            _utils.json_serializer(module, cfg['json'])
+        if cfg.get('uploads'):
+            _utils.upload_settings(module, **cfg['uploads'])
+        if cfg.get('secure_cookie'):
+            _utils.secure_cookie_settings(module, **cfg['secure_cookie'])
+        if cfg.get('static_cache'):
+            _utils.static_cache(module, **cfg['static_cache'])
+        if cfg.get('pools'):
+            for name, options in cfg['pools'].items():
+                pools.configure(name, **options)
     else:
         raise TypeError('Type {} is not supported as config. Please use a dict.'.format(type(cfg)))
 
 
+def json_serializer(serializer='auto'):
+    """
+    Sets the JSON serializer of this module for req.json and the JSON middleware
+
+    :param serializer: str | :class:`swapy.serializers.JsonSerializer`
+        'auto' uses orjson or ujson if installed and the standard library otherwise
+        'json', 'orjson' or 'ujson' use the given one
+        Default = 'auto'
+    """
+    _utils.json_serializer(_utils.caller(), serializer)
+
+
+def uploads(max_content_length=None, max_form_memory=None, spool_size=512 * 1024, spool_dir=None):
+    """
+    Sets the limits and the spooling of request bodies and uploaded files of this module
+
+    :param max_content_length: int | None
+        Bodies with more bytes are rejected with 413
+        Default = None (no limit)
+    :param max_form_memory: int | None
+        Maximum size of form fields which are no files
+        Default = None (no limit)
+    :param spool_size: int
+        Uploaded files are kept in memory up to this size and written to spool_dir after that
+        Default = 512 KiB
+    :param spool_dir: str | None
+        Default = None (temp directory)
+    """
+    _utils.upload_settings(_utils.caller(), max_content_length=max_content_length, max_form_memory=max_form_memory,
+                           spool_size=spool_size, spool_dir=spool_dir)
+
+
+def secure_cookie(cookie_name='session', serializer='json', max_age=None):
+    """
+    Sets the cookie of req.secure_cookie for this module
+    It is signed with the 'secret_key' of the environment, a list of keys rotates them (the first one signs).
+
+    :param cookie_name: str
+        Default = 'session'
+    :param serializer: str
+        'json' or 'msgpack' (needs msgpack installed)
+        Default = 'json'
+    :param max_age: int | None
+        Seconds after which the cookie expires and is not accepted anymore
+        Default = None (browser session)
+    """
+    _utils.secure_cookie_settings(_utils.caller(), cookie_name=cookie_name, serializer=serializer, max_age=max_age)
+
+
+def router(name='werkzeug'):
+    """
+    Sets the url router of this module
+
+    :param name: str
+        'werkzeug': werkzeug's Map which tries the rules one by one
+        'radix': Radix tree of path segments which is compiled when the app is built (see :mod:`swapy.routing`)
+        Default = 'werkzeug'
+    """
+    _utils.router(_utils.caller(), name)
+
+
 def use(*middlewares_):
     """
     Registers middlewares for global use
@@ -359,7 +726,47 @@ def app():
     return _utils.build_app(_utils.caller())
 
 
-def run(host='127.0.0.1', port=5000, debug=False, module_name=None):
+def freeze(snapshot=None, gc_freeze=True):
+    """
+    Compiles the routes, middleware chains, url matcher and builder and the shared file index of this module once
+    and returns the app. Routes can't be added after that.
+
+    Example:
+        app = swapy.freeze(os.path.join(os.path.dirname(__file__), 'app.snapshot'))
+
+    :param snapshot: str | None
+        JSON file with the index of the shared files and their fingerprints.
+        It is loaded if it was made for the same routes and directories and written otherwise.
+        It should be in a directory which only the app can write, like the directory of the app.
+        Default = None
+    :param gc_freeze: bool
+        Moves all objects out of the garbage collector, so forked workers share their memory
+        Default = True
+    :return: function
+        The app
+    """
+    return _utils.freeze(_utils.caller(), snapshot, gc_freeze)
+
+
+def asgi_app(max_threads=40):
+    """
+    Returns the app as ASGI 3 application
+    async def handlers and async middlewares are awaited on the event loop, sync routes run in a thread pool
+
+    Example:
+        app = swapy.asgi_app()
+        # uvicorn my_app:app
+
+    :param max_threads: int
+        Size of the thread pool for sync routes
+        Default = 40
+    :return: :class:`swapy.asgi.ASGIApp`
+    """
+    from . import asgi
+    return asgi.ASGIApp(_utils.caller(), max_threads)
+
+
+def run(host='127.0.0.1', port=5000, debug=False, module_name=None, workers=None, server='werkzeug', **options):
     """
     Runs the app
 
@@ -371,11 +778,81 @@ def run(host='127.0.0.1', port=5000, debug=False, module_name=None):
         Enables debug output and hot reload
     :param module_name: str
         Starts the app from the specific module if given
-    """
+    :param workers: int | None
+        Serves with the given number of worker processes like serve()
+        Hot reload is not available with workers
+        Default = None (development server)
+    :param server: str
+        'werkzeug': werkzeug's development server
+        'swapy': swapy's multi-threaded HTTP/1.1 server with keep-alive (see :class:`swapy.serving.HTTPServer`)
+            Hot reload and workers are not available with it
+        Default = 'werkzeug'
+    :param options: object
+        Arguments for swapy's server like threads, backlog, keep_alive_timeout, max_header_size or max_body_size
+
+    Example:
+        run(server='swapy', threads=32, keep_alive_timeout=15)
+    """
+    if server not in ('werkzeug', 'swapy'):
+        raise ValueError('Server "{}" is not supported. Please use "werkzeug" or "swapy".'.format(server))
+    if server == 'swapy' and workers:
+        raise ValueError('workers are only supported by the werkzeug server')
+    if options and server != 'swapy':
+        raise TypeError('Server options are only supported by the swapy server')
     module = _utils.caller()
     state = _utils.state(module)
     state.debug = debug
     module = module_name if module_name else _utils.caller()
     if debug and module != '__main__':
         print('Warning: Please do not run apps outside of main')  # TODO Use logger
-    run_simple(host, port, _utils.build_app(module), use_reloader=debug, ssl_context=state.ssl)
+    _utils.templates(auto_reload=debug)
+    from . import serving
+    if server == 'swapy':
+        serving.HTTPServer(_utils.build_app(module), host, port, ssl_context=state.ssl, **options).run()
+        return
+    if workers:
+        serving.PreforkServer(_utils.build_app(module), host, port, workers, ssl_context=state.ssl).run()
+        return
+    from werkzeug.serving import run_simple
+    run_simple(host, port, _utils.build_app(module), use_reloader=debug, ssl_context=state.ssl,
+               request_handler=serving.RequestHandler)
+
+
+def serve(host='127.0.0.1', port=5000, workers=None, max_requests=0, timeout=30, reuse_port=True,
+          module_name=None):
+    """
+    Runs the app in a pre-fork server for production
+    The app is frozen (see freeze()) once and shared by all worker processes.
+
+    :param host: str
+        IP Address where the server serves
+        '0.0.0.0' for public address
+    :param port: int
+    :param workers: int | None
+        Number of worker processes
+        Default = None (number of CPUs)
+    :param max_requests: int
+        Replaces a worker after this number of requests, 0 disables it
+        Default = 0
+    :param timeout: int | float
+        Seconds after which a hanging worker is killed
+        Default = 30
+    :param reuse_port: bool
+        Sets SO_REUSEPORT on the listening socket if the platform supports it
+        Default = True
+    :param module_name: str
+        Starts the app from the specific module if given
+    """
+    module = module_name if module_name else _utils.caller()
+    state = _utils.state(module)
+    _utils.templates(auto_reload=False)
+    from . import serving
+    serving.PreforkServer(_utils.freeze(module), host, port, workers, max_requests, timeout, reuse_port,
+                          ssl_context=state.ssl).run()
+
+
+def __getattr__(name):
+    if name in _lazy_modules:
+        import importlib
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -1,19 +1,35 @@
-import inspect
-import uuid
+import gc
+import json
+import logging
 import os
 import re
+import sys
+import threading
+import time
+from inspect import iscoroutinefunction
+from types import MappingProxyType
 
-from werkzeug.wsgi import responder, SharedDataMiddleware
-from werkzeug.serving import make_ssl_devcert
+from werkzeug.wsgi import responder, get_path_info, ClosingIterator
 from werkzeug.wrappers import Response
-from werkzeug.exceptions import HTTPException, NotFound, InternalServerError
-from werkzeug.routing import Rule, Map
-from werkzeug.contrib.sessions import FilesystemSessionStore
+from werkzeug.exceptions import HTTPException, NotFound, InternalServerError, MethodNotAllowed
+from werkzeug.routing import Rule, Map, RequestRedirect, BuildError
 
+from . import serializers, pools, uploads, hooks, securecookie
+from .files import FileResponse, StaticFiles, StaticIndex, to_wsgi
+from .routing import RadixRouter, UrlBuilder
 from .middlewares import DefaultException
-from .wrappers import Request, response_from
+from .wrappers import Request, response_from, adapt
 
 _modules = {}
+_endpoints = {}
+_urls = {}
+_handlers = {}
+_template_environments = {}
+_template_directories = {}
+_template_options = {'auto_reload': False, 'bytecode_cache': None, 'cache_size': 400}
+_thread_loops = threading.local()
+
+logger = logging.getLogger('swapy')
 
 
 def caller():
@@ -23,7 +39,7 @@ def caller():
     :return: str
         Name of the module
     """
-    return inspect.currentframe().f_back.f_back.f_globals['__name__']
+    return sys._getframe(2).f_globals['__name__']
 
 
 def caller_frame():
@@ -33,7 +49,7 @@ def caller_frame():
     :return: Frame
         Frame of the module
     """
-    return inspect.currentframe().f_back.f_back
+    return sys._getframe(2)
 
 
 def init(module):
@@ -73,11 +89,14 @@ def error_handler(e, module):
     try:
         res = state_.on_error(e)
         if type(res) == tuple:
-            return Response(*res)
+            res = Response(*res)
         else:
-            return Response(res)
+            res = Response(res)
     except TypeError:
         return e
+    if getattr(e, 'retry_after', None) is not None:
+        res.headers['Retry-After'] = str(e.retry_after)
+    return res
 
 
 def error(module, f):
@@ -140,26 +159,247 @@ def shared(frame, directory, url=None):
         directory = os.path.join(os.path.dirname(frame.f_globals['__file__']), directory)
     directory = directory.replace('\\', '/')
     state_.shared.append((directory, url))
+    state_.static = None
+
+
+def static_index(module):
+    """
+    Returns the index of the shared directories of the module, it is built at the first call
+
+    :param module: str
+        Name of the module
+    :return: :class:`swapy.files.StaticIndex`
+    """
+    state_ = state(module)
+    if state_.static is None:
+        state_.static = StaticIndex(state_.shared, **state_.static_cache)
+    return state_.static
+
+
+def static_cache(module, max_bytes=16 * 1024 * 1024, max_file_size=256 * 1024):
+    """
+    Sets the limits of the memory cache for shared files of the module
+
+    :param module: str
+        Name of the module
+    :param max_bytes: int
+    :param max_file_size: int
+    """
+    state_ = state(module)
+    state_.static_cache = {'max_bytes': max_bytes, 'max_file_size': max_file_size}
+    if state_.static is not None:
+        state_.static.max_bytes = max_bytes
+        state_.static.max_file_size = max_file_size
+
+
+def static_url(module, name):
+    """
+    Returns the fingerprinted url of a shared file of the module
+
+    :param module: str
+        Name of the module
+    :param name: str
+    :return: str
+    """
+    return static_index(module).url(name)
+
+
+def template_directory(frame):
+    """
+    Returns the directory of the module of the given frame which is used to look up templates
+    The result is cached per module file so no file system call is needed after the first time
+
+    :param frame: Frame
+        Frame of the module
+    :return: str
+    """
+    module_file = frame.f_globals['__file__']
+    directory = _template_directories.get(module_file)
+    if directory is None:
+        directory = os.path.dirname(os.path.realpath(module_file))
+        _template_directories[module_file] = directory
+    return directory
+
+
+def template_environment(directory):
+    """
+    Returns the cached jinja2 environment for the given template directory
+
+    :param directory: str
+        Absolute path of the directory
+    :return: :class:`jinja2.environment.Environment`
+    """
+    env = _template_environments.get(directory)
+    if env is None:
+        # jinja2 is imported at the first render
+        from jinja2 import FileSystemLoader
+        from jinja2.environment import Environment as TemplateEnvironment
+        env = TemplateEnvironment(loader=FileSystemLoader(directory),
+                                  auto_reload=_template_options['auto_reload'],
+                                  cache_size=_template_options['cache_size'],
+                                  bytecode_cache=_template_options['bytecode_cache'])
+        env = _template_environments.setdefault(directory, env)
+    return env
+
+
+def templates(auto_reload=None, bytecode_cache=None, cache_size=None):
+    """
+    Sets the options for all template environments
+
+    :param auto_reload: bool | None
+        Checks at every render if the template file changed
+        Disabled in production (run without debug) so templates are never stat'ed per request
+    :param bytecode_cache: bool | str | None
+        Directory for the jinja2 bytecode cache or True for the temp directory
+        False disables the cache
+    :param cache_size: int | None
+        Number of compiled templates per directory which are kept in memory
+        -1 keeps all
+    """
+    if auto_reload is not None:
+        _template_options['auto_reload'] = auto_reload
+    if bytecode_cache is not None:
+        from jinja2 import FileSystemBytecodeCache
+        if bytecode_cache is True:
+            bytecode_cache = FileSystemBytecodeCache()
+        elif bytecode_cache is False:
+            bytecode_cache = None
+        else:
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache)
+        _template_options['bytecode_cache'] = bytecode_cache
+    if cache_size is not None:
+        _template_options['cache_size'] = cache_size
+        _template_environments.clear()
+    for env in _template_environments.values():
+        env.auto_reload = _template_options['auto_reload']
+        env.bytecode_cache = _template_options['bytecode_cache']
+
+
+def precompile_templates(directory, extensions):
+    """
+    Loads and compiles all templates of the given directory and all known template directories
+
+    Shared directories (see :func:`shared`) contain static files and are skipped.
+    Files which are no valid templates are skipped with a warning, so static files with '{{' don't stop the start.
+
+    :param directory: str
+        Template directory of the calling module
+    :param extensions: list | tuple
+        File extensions of templates without dot
+    :return: int
+        Number of compiled templates
+    """
+    from jinja2 import TemplateSyntaxError
+    template_environment(directory)
+    shared_dirs = [os.path.normpath(path) for state_ in list(_modules.values()) for path, _ in state_.shared]
+    count = 0
+    for template_dir, env in list(_template_environments.items()):
+        skipped = []
+        for path in shared_dirs:
+            relative = os.path.relpath(path, template_dir).replace(os.sep, '/')
+            if relative == '.':
+                skipped = None
+                break
+            if not relative.startswith('..'):
+                skipped.append(relative + '/')
+        if skipped is None:
+            continue
+        for name in env.list_templates(extensions=extensions):
+            if any(name.startswith(prefix) for prefix in skipped):
+                continue
+            try:
+                env.get_template(name)
+            except (TemplateSyntaxError, UnicodeDecodeError) as e:
+                logger.warning('Template %s in %s was not compiled: %s', name, template_dir, e)
+                continue
+            count += 1
+    return count
 
 
 def find_route(name):
     """
-    Returns the route by name (url)
+    Returns the route by endpoint or url
+    If several modules have a route with the url the first registered one is returned
 
     :param name: str
-        Url of the route
-    :return: Rule | None
-        Route rule from werkzeug
+        Endpoint or url of the route
+    :return: dict | None
+        Route entry of the state
     """
-    global _modules
-    for state_ in _modules.keys():
-        for route in state_.url_map:
-            if route['url'] == name:
-                return route
-    return None
+    route = _endpoints.get(name)
+    if route is None:
+        route = _urls.get(name)
+    return route
+
+
+def endpoint_name(module, f, methods):
+    """
+    Returns the endpoint of a new route from the module, the qualified name of the function and the methods
+    It is the same in every process, e.g. 'app.user:GET,POST'. '#2', '#3', ... is appended if the name is taken.
+
+    :param module: str
+        Name of the module
+    :param f: function
+    :param methods: list | tuple
+    :return: str
+    """
+    base = '{}.{}:{}'.format(module, getattr(f, '__qualname__', type(f).__name__),
+                             ','.join(sorted(method.upper() for method in methods)))
+    name = base
+    number = 2
+    while name in _endpoints:
+        name = '{}#{}'.format(base, number)
+        number += 1
+    return name
+
+
+def endpoints(f):
+    """
+    Returns the endpoints of all routes with the handler f in order of registration
 
+    :param f: function
+    :return: list
+    """
+    return list(_handlers.get(f, ()))
 
-def register_route(module, url='/', methods=('GET', 'POST', 'PUT', 'DELETE')):
+
+def url_for(module, endpoint, values):
+    """
+    Returns the url of a route of the module
+    The url is built by a :class:`swapy.routing.UrlBuilder` which is compiled once from the url map
+
+    :param module: str
+        Name of the module
+    :param endpoint: str | function
+        Endpoint or handler of the route
+    :param values: dict
+        Url arguments, others are appended as query string
+    :return: str
+    """
+    state_ = state(module)
+    if not isinstance(endpoint, str):
+        names = [name for name in _handlers.get(endpoint, ()) if name in state_.routes]
+        if not names:
+            raise BuildError(getattr(endpoint, '__qualname__', endpoint), values, None)
+        endpoint = names[0]
+    builder = state_.builder or compile_builder(module)
+    return builder.build(endpoint, values)
+
+
+def compile_builder(module):
+    """
+    Compiles the url builder of the module from its url map
+
+    :param module: str
+        Name of the module
+    :return: :class:`swapy.routing.UrlBuilder`
+    """
+    state_ = state(module)
+    state_.builder = UrlBuilder(state_.url_map)
+    return state_.builder
+
+
+def register_route(module, url='/', methods=('GET', 'POST', 'PUT', 'DELETE'), blocking=None):
     """
     Adds a route to the module which calls this
 
@@ -170,10 +410,15 @@ def register_route(module, url='/', methods=('GET', 'POST', 'PUT', 'DELETE')):
     :param methods: list | tuple
         HTTP methods as strings
         Default = ('GET', 'POST', 'PUT', 'DELETE')
+    :param blocking: bool | str | None
+        Runs the route in the pool with this name ('blocking' if True), see :mod:`swapy.pools`
+        Default = None
     :return: function
         A decorator which registers a function
     """
     state_ = state(module)
+    if state_.frozen:
+        raise Exception('Module "{}" is frozen. Cannot add route "{}".'.format(module, url))
 
     #  Adjust path
     if not url.startswith('/'):
@@ -182,10 +427,10 @@ def register_route(module, url='/', methods=('GET', 'POST', 'PUT', 'DELETE')):
         url = '/<path:path>'
 
     # Check if rule already exists
-    for route in state_.url_map.iter_rules():
-        if route.rule == url and [method for method in route.methods if method in methods]:
-            raise Exception('Path "{}" already exists in "{}". Cannot add route to module "{}". '
-                            'Maybe you included routes with the same url?'.format(route.rule, module, module))
+    existing = state_.rules.get(url)
+    if existing and [method for method in existing if method in methods]:
+        raise Exception('Path "{}" already exists in "{}". Cannot add route to module "{}". '
+                        'Maybe you included routes with the same url?'.format(url, module, module))
 
     def decorator(f):
         """
@@ -195,39 +440,129 @@ def register_route(module, url='/', methods=('GET', 'POST', 'PUT', 'DELETE')):
         :return: function
             Returns f
         """
-        def handle(*args, **kwargs):
-            target = f
-            for m in state_.middlewares:
-                target = m(target)
-            try:
-                res = target(*args, **kwargs)
-            except TypeError as e:
-                try:
-                    if 'arguments' in str(e):
-                        res = target(**kwargs)
-                    else:
-                        res = target(*args, **kwargs)
-                except BaseException as e:
-                    res = state_.on_error(e)
-            if res:
-                return res
-            else:
-                return ''
-
-        name = str(uuid.uuid4())
+        name = endpoint_name(module, f, methods)
         rule = Rule(url, methods=methods, endpoint=name, strict_slashes=False)
         state_.url_map.add(rule)
-        state_.routes[name] = {
-            'function': handle,
+        state_.rules.setdefault(url, set()).update(rule.methods)
+        state_.router = None
+        state_.builder = None
+        route = state_.routes[name] = {
+            'endpoint': name,
+            'function': None,
+            'coroutine': None,
+            'handler': f,
+            'module': module,
+            'args': set(rule.arguments),
             'on_error': state_.on_error,
             'url': re.sub(r'<(\w*:)?(\w*)>', r':\2', url),
             'docs': f.__doc__,
-            'methods': methods
+            'methods': methods,
+            'blocking': 'blocking' if blocking is True else blocking or None
         }
+        _endpoints[name] = route
+        _urls.setdefault(route['url'], route)
+        _handlers.setdefault(f, []).append(name)
         return f
     return decorator
 
 
+def compile_route(route):
+    """
+    Builds the final callable of a route once
+    The handler gets a call adapter for its signature (see :func:`swapy.wrappers.adapt`) and the middlewares of the
+    module where the route was registered are applied in order of registration.
+    A blocking route runs with its middlewares in its pool, the server thread waits for it meanwhile
+    (asgi_app() awaits it instead, see :func:`swapy.asgi.compile_route`).
+
+    :param route: dict
+        Route entry of a state
+    :return: function
+        The compiled route function which is cached in the route entry
+    """
+    state_ = state(route['module'])
+    target = adapt(route['handler'], route['args'])
+    if iscoroutinefunction(route['handler']):
+        target = run_coroutine(target)
+    for m in state_.middlewares:
+        target = m(target)
+    pool = route.get('blocking')
+
+    def handle(req):
+        try:
+            if pool is None:
+                res = target(req)
+            else:
+                res = pools.get(pool).run(target, req)
+        except TypeError as e:
+            res = state_.on_error(e)
+        if res:
+            return res
+        else:
+            return ''
+
+    route['function'] = handle
+    return handle
+
+
+class _ThreadLoop:
+    """
+    Event loop of a thread for :func:`run_coroutine`, it is closed when the thread ends
+    """
+
+    def __init__(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self.pid = os.getpid()
+
+    def __del__(self):
+        self.loop.close()
+
+
+def run_coroutine(f):
+    """
+    Returns a function which runs the coroutine of the async function f in the event loop of the current thread
+    It serves async handlers in the WSGI app, asgi_app() awaits them natively.
+    Every server thread creates its loop once and reuses it for all requests (a forked process creates a new one).
+
+    :param f: function
+    :return: function
+    """
+    def call(req):
+        thread_loop = getattr(_thread_loops, 'current', None)
+        if thread_loop is None or thread_loop.pid != os.getpid():
+            thread_loop = _thread_loops.current = _ThreadLoop()
+        return thread_loop.loop.run_until_complete(f(req))
+    return call
+
+
+def compile_routes(module):
+    """
+    Compiles all routes of the module which are not compiled yet
+
+    :param module: str
+        Name of the module
+    """
+    state_ = state(module)
+    for route in list(state_.routes.values()):
+        if route['function'] is None:
+            compile_route(route)
+
+
+def invalidate_routes(module):
+    """
+    Drops the compiled functions of all routes which were registered in the given module
+    They will be compiled again at the next request or build
+
+    :param module: str
+        Name of the module
+    """
+    state_ = state(module)
+    for route in list(state_.routes.values()):
+        if route['module'] == module:
+            route['function'] = None
+            route['coroutine'] = None
+
+
 def use(module, *middlewares_):
     """
     Registers middlewares
@@ -239,7 +574,13 @@ def use(module, *middlewares_):
     """
     state_ = state(module)
     for middleware in middlewares_:
-        state_.middlewares.append(middleware)
+        # Middlewares which are marked as outermost (like the profiler) stay the last ones
+        position = len(state_.middlewares)
+        if not getattr(middleware, 'outermost', False):
+            while position and getattr(state_.middlewares[position - 1], 'outermost', False):
+                position -= 1
+        state_.middlewares.insert(position, middleware)
+    invalidate_routes(module)
 
 
 def ssl(module, host='127.0.0.1', path=None):
@@ -258,6 +599,7 @@ def ssl(module, host='127.0.0.1', path=None):
     """
     state_ = state(module)
     if path:
+        from werkzeug.serving import make_ssl_devcert
         state_.ssl = make_ssl_devcert(path, host=host)
     else:
         import importlib
@@ -317,22 +659,124 @@ def include(module, target, prefix=''):
         prefix = '/{}'.format(prefix)
     if prefix == '/':
         prefix = ''
+    if state_.frozen:
+        raise Exception('Module "{}" is frozen. Module "{}" cannot be included.'.format(module, target.__name__))
     routes = state_target.url_map
     for route in routes.iter_rules():
         rule = '{}{}'.format(prefix, route.rule)
-        for r in state_.url_map.iter_rules():
-            if rule == r.rule:
-                raise Exception('Path "{}" already exists in "{}". Module "{}" cannot be included in "{}".'
-                                .format(rule, module, target.__name__, module))
+        if rule in state_.rules:
+            raise Exception('Path "{}" already exists in "{}". Module "{}" cannot be included in "{}".'
+                            .format(rule, module, target.__name__, module))
     for name in state_target.routes.keys():
         state_.routes[name] = state_target.routes[name]
     for route in routes.iter_rules():
         rule = '{}{}'.format(prefix, route.rule)
         new_route = Rule(rule, endpoint=route.endpoint, methods=route.methods, strict_slashes=False)
         state_.url_map.add(new_route)
+        state_.rules.setdefault(rule, set()).update(new_route.methods)
+    state_.router = None
+    state_.builder = None
     state_target.environment = state_.environment
 
 
+def session(module, store='filesystem', **options):
+    """
+    Sets the session store of the module
+
+    :param module: str
+        Name of the module
+    :param store: str | dict | :class:`swapy.sessions.SessionStore`
+        'filesystem', 'memory', 'sqlite', 'cookie', a dict with the name as 'store' and the options or a store object
+        Default = 'filesystem'
+    :param options: object
+        Arguments for the store class
+    """
+    from . import sessions
+    state_ = state(module)
+    state_.session_store = sessions.create(store, **options)
+
+
+def json_serializer(module, serializer='auto'):
+    """
+    Sets the JSON serializer of the module which is used by Request.json and the JSON middleware
+
+    :param module: str
+        Name of the module
+    :param serializer: str | :class:`swapy.serializers.JsonSerializer`
+        'auto', 'json', 'orjson' or 'ujson'
+        Default = 'auto'
+    """
+    state_ = state(module)
+    state_.json = serializers.get(serializer)
+
+
+def upload_settings(module, **settings):
+    """
+    Sets the upload settings of the module
+
+    :param module: str
+        Name of the module
+    :param settings: object
+        'max_content_length', 'max_form_memory', 'spool_size' and/or 'spool_dir'
+    """
+    state_ = state(module)
+    for key in settings:
+        if key not in uploads.defaults:
+            raise ValueError('Upload setting "{}" is not supported. Please use one of: {}'
+                             .format(key, ', '.join(sorted(uploads.defaults))))
+    state_.uploads.update(settings)
+
+
+def secure_cookie_settings(module, **settings):
+    """
+    Sets the secure cookie settings of the module
+
+    :param module: str
+        Name of the module
+    :param settings: object
+        'cookie_name', 'serializer' and/or 'max_age'
+    """
+    state_ = state(module)
+    for key in settings:
+        if key not in securecookie.defaults:
+            raise ValueError('Secure cookie setting "{}" is not supported. Please use one of: {}'
+                             .format(key, ', '.join(sorted(securecookie.defaults))))
+    if 'serializer' in settings:
+        securecookie.payload(settings['serializer'])
+    state_.secure_cookie.update(settings)
+
+
+def router(module, name='werkzeug'):
+    """
+    Sets the url router of the module
+
+    :param module: str
+        Name of the module
+    :param name: str
+        'werkzeug' matches the rules of the werkzeug Map one by one
+        'radix' matches with a :class:`swapy.routing.RadixRouter` which is compiled from the Map
+        Default = 'werkzeug'
+    """
+    if name not in ('werkzeug', 'radix'):
+        raise ValueError('Router "{}" is not supported. Please use "werkzeug" or "radix".'.format(name))
+    state_ = state(module)
+    state_.router_type = name
+    state_.router = None
+
+
+def compile_router(module):
+    """
+    Compiles the radix router of the module from its url map
+
+    :param module: str
+        Name of the module
+    :return: :class:`swapy.routing.RadixRouter`
+    """
+    state_ = state(module)
+    state_.router = RadixRouter(state_.url_map)
+    return state_.router
+
+
 def environment(module, data):
     """
     Sets the environment data to the given module
@@ -345,6 +789,85 @@ def environment(module, data):
     state_.environment.parse(data)
 
 
+def match(module, environ):
+    """
+    Returns the endpoint and the url arguments of the route for the request
+
+    :param module: str
+        Name of the module
+    :param environ: dict
+        WSGI environment
+    :return: tuple
+        (endpoint, args)
+    :raises NotFound: If no route matches
+    :raises MethodNotAllowed: If routes match the url but not the method
+    :raises RequestRedirect: If werkzeug redirects the url
+    """
+    state_ = state(module)
+    if state_.router_type == 'radix':
+        router_ = state_.router or compile_router(module)
+        return router_.match(get_path_info(environ), environ.get('REQUEST_METHOD', 'GET'))
+    return state_.url_map.bind_to_environ(environ).match()
+
+
+def create_request(module, environ):
+    """
+    Returns the request object for the module
+
+    :param module: str
+        Name of the module
+    :param environ: dict
+        WSGI environment
+    :return: :class:`swapy.wrappers.Request`
+    """
+    state_ = state(module)
+    req = Request(environ)
+    req.state = state_
+    req.session_store = state_.session_store
+    return req
+
+
+def make_response(req, result):
+    """
+    Converts the result of a compiled route into a werkzeug response
+
+    :param req: :class:`swapy.wrappers.Request`
+    :param result: object
+        Result of the route
+    :return: :class:`werkzeug.wrappers.Response`
+    """
+    res = response_from(result)
+    if isinstance(res, FileResponse):
+        res = res.prepare(req.environ)
+
+    try:
+        iter(res.content)
+    except TypeError:
+        raise InternalServerError('Result {} of \'{}\' is not a valid response'
+                                  .format(res.content, req.path))
+    ret = to_wsgi(res)
+    if req._secure_cookie is not None and req._secure_cookie.should_save:
+        req._secure_cookie.save_cookie(ret)
+    return ret
+
+
+def commit_session(req, response):
+    """
+    Commits the session of the request into the response if it was opened
+
+    :param req: :class:`swapy.wrappers.Request`
+    :param response: :class:`werkzeug.wrappers.Response`
+    """
+    if req._session is None:
+        return
+    if hooks.registry['session']:
+        start = time.perf_counter()
+        req.session_store.commit(req, req._session, response)
+        hooks.fire('session', req, 'commit', time.perf_counter() - start)
+    else:
+        req.session_store.commit(req, req._session, response)
+
+
 def build_app(module):
     """
     Returns the built app
@@ -355,67 +878,199 @@ def build_app(module):
         The application
     """
     state_ = state(module)
-    session_store = FilesystemSessionStore()
+    compile_routes(module)
+    if state_.router_type == 'radix':
+        compile_router(module)
+
+    hook = hooks.registry
 
     @responder
     def application(environ, _):
-        urls = state_.url_map.bind_to_environ(environ)
-        req = Request(environ)
-        req.state = state_
-        sid = req.cookies.get('session_id')
-        if sid is None:
-            req.session = session_store.new()
-        else:
-            req.session = session_store.get(sid)
+        start = time.perf_counter()
+        req = create_request(module, environ)
 
         def dispatch(endpoint, args):
             try:
                 args = dict(args)
                 req.url_args = args  # TODO docs
-                f = state_.routes[endpoint]['function']
-                res = response_from(f(req))
-
-                try:
-                    iter(res.content)
-                except TypeError:
-                    raise InternalServerError('Result {} of \'{}\' is not a valid response'
-                                              .format(res.content, req.path))
-                ret = Response(res.content, res.code, res.headers, direct_passthrough=True)
-                for cookie in res.cookies.keys():
-                    ret.set_cookie(cookie, res.cookies[cookie])
-                if req.state.environment.get('secret_key') is not None and req.secure_cookie.should_save:
-                    req.secure_cookie.save_cookie(ret)
-                return ret
+                req.endpoint = endpoint
+                route = state_.routes[endpoint]
+                f = route['function'] or compile_route(route)
+                if hook['before_handler']:
+                    hooks.fire('before_handler', req)
+                res = make_response(req, f(req))
             except NotFound as ex:
-                return not_found_handler(ex, module)
+                if hook['exception']:
+                    hooks.fire('exception', req, ex)
+                res = not_found_handler(ex, module)
             except HTTPException as ex:
-                return error_handler(ex, module)
+                if hook['exception']:
+                    hooks.fire('exception', req, ex)
+                res = error_handler(ex, module)
+            if hook['after_handler']:
+                hooks.fire('after_handler', req, res)
+            return res
         try:
-            result = urls.dispatch(dispatch)
+            # asgi_app() matches the route before it hands the request over
+            matched = environ.get('swapy.match')
+            if matched is None:
+                # asgi_app() fired the match hooks already if it tried to match
+                fire = 'swapy.match' not in environ
+                if fire and hook['before_match']:
+                    hooks.fire('before_match', environ)
+                matched = match(module, environ)
+                if fire and hook['after_match']:
+                    hooks.fire('after_match', environ, matched[0], matched[1])
+            result = dispatch(*matched)
+        except RequestRedirect as e:
+            result = e
         except NotFound as e:
             result = not_found_handler(e, module)
-        if req.session.should_save:
-            session_store.save(req.session)
-            result.set_cookie('session_id', req.session.sid)
+        except MethodNotAllowed as e:
+            result = error_handler(e, module)
+        except Exception as e:
+            if hook['exception']:
+                hooks.fire('exception', req, e)
+            raise
+        if isinstance(result, HTTPException):
+            result = result.get_response(environ)
+        commit_session(req, result)
+        if hook['response_sent']:
+            response = result
+
+            def result(environ_, start_response):
+                # Routes send their content directly, so the response can't close it with call_on_close
+                return ClosingIterator(response(environ_, start_response), lambda: hooks.fire(
+                    'response_sent', req, response, time.perf_counter() - start))
         return result
 
     if state_.shared:
-        shares = {}
-        for share in state_.shared:
-            shares[share[1]] = share[0]
-        application = SharedDataMiddleware(application, shares)
+        application = StaticFiles(application, static_index(module), watch=state_.debug)
     return application
 
 
+#: Version of the snapshot format of freeze()
+snapshot_version = 2
+
+
+def route_signature(module):
+    """
+    Returns a summary of the rules of the module which changes if a route is added, removed or changed
+
+    :param module: str
+        Name of the module
+    :return: list
+    """
+    return sorted([rule.rule, rule.endpoint, sorted(rule.methods or ())] for rule in state(module).url_map.iter_rules())
+
+
+def freeze(module, snapshot=None, gc_freeze=True):
+    """
+    Compiles everything the module needs to serve requests once and stops the registration of routes
+
+    The routes with their middleware chains (sync and async), the url matcher, the url builder and the index of
+    the shared files are compiled. With a snapshot file the index of the shared files and their fingerprints are
+    loaded from it instead of scanning and hashing the directories, if the snapshot was made for the same routes
+    and directories. Otherwise the snapshot is written, so the next process can load it.
+    With gc_freeze the Python objects which exist after the freeze are moved out of the garbage collector
+    (gc.freeze), so forked workers share their memory pages instead of copying them.
+
+    :param module: str
+        Name of the module
+    :param snapshot: str | None
+        Path of the snapshot file
+    :param gc_freeze: bool
+    :return: function
+        The application
+    """
+    from . import asgi
+    state_ = state(module)
+    signature = route_signature(module)
+    loaded = False
+    if snapshot is not None and state_.shared:
+        loaded = load_snapshot(module, snapshot, signature)
+    application = build_app(module)
+    state_.url_map.update()
+    if state_.router_type == 'radix' and state_.router is None:
+        compile_router(module)
+    if state_.builder is None:
+        compile_builder(module)
+    for route in list(state_.routes.values()):
+        if route['coroutine'] is None:
+            asgi.compile_route(route)
+    state_.frozen = True
+    if snapshot is not None and not loaded:
+        save_snapshot(module, snapshot, signature)
+    if gc_freeze and hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+    return application
+
+
+def load_snapshot(module, path, signature):
+    """
+    Loads the index of the shared files from a snapshot of freeze()
+
+    :param module: str
+        Name of the module
+    :param path: str
+    :param signature: list
+        Signature of the current routes, see :func:`route_signature`
+    :return: bool
+        False if the snapshot doesn't exist or doesn't fit
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if not isinstance(data, dict) or data.get('version') != snapshot_version or data.get('routes') != signature:
+        return False
+    state_ = state(module)
+    index = StaticIndex(state_.shared, scan=False, **state_.static_cache)
+    if not data.get('static') or not index.load(data['static']):
+        return False
+    state_.static = index
+    return True
+
+
+def save_snapshot(module, path, signature):
+    """
+    Writes the snapshot of freeze(), it is replaced atomically
+    The fingerprints of all shared files are computed before, so processes which load it don't hash them
+
+    :param module: str
+        Name of the module
+    :param path: str
+    :param signature: list
+    """
+    state_ = state(module)
+    if state_.static is not None:
+        for file_path in list(state_.static.files.values()):
+            state_.static.fingerprint(file_path)
+    data = {'version': snapshot_version, 'routes': signature,
+            'static': state_.static.dump() if state_.static is not None else None}
+    temp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(temp, path)
+
+
 class State:
     """
     State for every module
 
     routes: dict
         Contains all registered routes.
-        Example: {'/': {'function': function, 'on_error': function, 'url': str}}
+        'function' is the compiled route (handler wrapped by the middlewares) or None if it is not compiled yet.
+        'coroutine' is the compiled async route of asgi_app(), False for sync routes or None if it is not compiled yet.
+        The keys are the endpoints, see :func:`endpoint_name`.
+        Example: {'app.index:GET': {'endpoint': str, 'function': function, 'coroutine': None, 'handler': function,
+                                    'module': str, 'args': set, 'on_error': function, 'url': str}}
     """
-    _slots__ = ['url_map', 'middlewares', 'on_error', 'on_not_found', 'routes', 'ssl', 'shared', 'environment', 'debug']
+    _slots__ = ['url_map', 'middlewares', 'on_error', 'on_not_found', 'routes', 'ssl', 'shared', 'environment', 'debug',
+                'session_store', 'router_type', 'router', 'builder', 'json', 'uploads', 'static', 'static_cache',
+                'rules', 'frozen', 'secure_cookie']
 
     def __init__(self):
         self.url_map = Map([])
@@ -427,14 +1082,29 @@ class State:
         self.shared = []
         self.environment = Environment(self)
         self.debug = False
+        self.session_store = None
+        self.router_type = 'werkzeug'
+        self.router = None
+        self.builder = None
+        self.json = None
+        self.uploads = dict(uploads.defaults)
+        self.static = None
+        self.static_cache = {}
+        self.rules = {}
+        self.frozen = False
+        self.secure_cookie = dict(securecookie.defaults)
 
 
 class Environment:
     """
     Environment class
     I need it that it can be referenced
+
+    The data of the current runtime ('development' if the state is in debug mode, else 'production') is merged
+    once into a resolved dict which is reused until set, parse or the debug mode changes it.
+    The runtime data is only merged if both development and production are set.
     """
-    _slots__ = ['data', 'development', 'production', '_state']
+    _slots__ = ['data', 'development', 'production', '_state', '_resolved']
 
     def __init__(self, _state, data=None, development=None, production=None):
         self._state = _state
@@ -443,18 +1113,27 @@ class Environment:
         self.data = data
         self.development = development
         self.production = production
+        self._resolved = None
 
     def parse(self, data):
         """
         Parses the environment dict data into this class
+        The given dict is not changed
 
         :param data: dict
         """
-        self.development = data.get('development')
-        self.production = data.get('production')
-        data.pop('development')
-        data.pop('production')
+        data = dict(data)
+        self.development = data.pop('development', None)
+        self.production = data.pop('production', None)
         self.data = data
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Drops the resolved data, it is merged again at the next access
+        Call it after changing data, development or production directly
+        """
+        self._resolved = None
 
     def __getitem__(self, item):
         """
@@ -481,9 +1160,24 @@ class Environment:
         """
         Returns the whole data
 
+        :return: str
+        """
+        return repr(self.runtime_data)
+
+    def _resolve(self):
+        """
+        Returns the resolved data for the current runtime
+
         :return: dict
         """
-        return self.runtime_data
+        debug = self._state.debug
+        resolved = self._resolved
+        if resolved is None or resolved[0] != debug:
+            data = dict(self.data)
+            if self.development and self.production:
+                data.update(self.development if debug else self.production)
+            resolved = self._resolved = (debug, data)
+        return resolved[1]
 
     @property
     def runtime_data(self):
@@ -491,17 +1185,18 @@ class Environment:
         Returns the whole data
 
         :return: dict
+            A copy of the data
+        """
+        return dict(self._resolve())
+
+    def snapshot(self):
+        """
+        Returns a read-only view of the resolved data which can be shared between threads
+        It doesn't change if the environment changes later
+
+        :return: :class:`types.MappingProxyType`
         """
-        data = self.data
-        runtime = 'development' if self._state.debug else 'production'
-        if self.production and self.development:
-            if runtime == 'development':
-                for key in self.development.keys():
-                    data[key] = self.development[key]
-            elif runtime == 'production':
-                for key in self.production.keys():
-                    data[key] = self.production[key]
-        return data
+        return MappingProxyType(dict(self._resolve()))
 
     def get(self, key):
         """
@@ -513,7 +1208,7 @@ class Environment:
         :param key: str
         :return: object
         """
-        return self.runtime_data.get(key)
+        return self._resolve().get(key)
 
     def set(self, key, value, runtime=None):
         """
@@ -539,3 +1234,4 @@ class Environment:
             self.production[key] = value
         else:
             raise AttributeError('Parameter "status" must be None, "production" or "development"')
+        self.invalidate()
@@ -0,0 +1,350 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from werkzeug.exceptions import HTTPException, NotFound, RequestEntityTooLarge
+from werkzeug.wsgi import get_path_info
+
+from . import _utils, hooks, pools
+from .files import StaticFiles
+from .uploads import spooled_file
+from .wrappers import adapt
+
+
+def to_sync(f):
+    """
+    Returns a function which runs the async function f on the event loop of the request and waits for the result
+    It must be called in a thread of the pool, sync middlewares use it to call async functions
+
+    :param f: function
+    :return: function
+    """
+    @wraps(f)
+    def call(req):
+        return asyncio.run_coroutine_threadsafe(f(req), req.environ['swapy.loop']).result()
+    return call
+
+
+def to_async(f):
+    """
+    Returns an async function which runs the sync function f in the thread pool of the request
+
+    :param f: function
+    :return: function
+    """
+    @wraps(f)
+    async def call(req):
+        return await asyncio.get_running_loop().run_in_executor(req.environ['swapy.pool'], f, req)
+    return call
+
+
+def compile_route(route):
+    """
+    Builds the async callable of a route once
+    The route is async if its handler is an async function or one of the middlewares returns an async function.
+    Async middlewares get an async function which receives the request, sync middlewares get a sync function.
+    A middleware is applied again with a converted function if it doesn't match the kind of the inner function.
+    Blocking routes are always async, their handler runs in its pool (see :mod:`swapy.pools`) and is awaited,
+    so it blocks neither the event loop nor a thread of the app while it waits in the queue.
+
+    :param route: dict
+        Route entry of a state
+    :return: function | bool
+        The compiled async route which is cached in the route entry or False if the route is sync
+    """
+    state_ = _utils.state(route['module'])
+    handler = route['handler']
+    call = adapt(handler, route['args'])
+    asynchronous = asyncio.iscoroutinefunction(handler)
+    pool = route.get('blocking')
+    if pool is not None:
+        blocking = _utils.run_coroutine(call) if asynchronous else call
+        asynchronous = True
+
+        @wraps(handler)
+        async def target(req):
+            return await pools.get(pool).run_async(blocking, req)
+    elif asynchronous:
+        @wraps(handler)
+        async def target(req):
+            return await call(req)
+    else:
+        target = call
+    for m in state_.middlewares:
+        wrapped = m(target)
+        if asyncio.iscoroutinefunction(wrapped) != asynchronous:
+            if asynchronous:
+                wrapped = to_async(m(to_sync(target)))
+            else:
+                asynchronous = True
+                wrapped = m(to_async(target))
+        target = wrapped
+    if not asynchronous:
+        route['coroutine'] = False
+        return False
+
+    async def handle(req):
+        try:
+            res = await target(req)
+        except TypeError as e:
+            res = state_.on_error(e)
+        if res:
+            return res
+        else:
+            return ''
+
+    route['coroutine'] = handle
+    return handle
+
+
+def environ_from(scope, body, length):
+    """
+    Returns the WSGI environment of an ASGI http scope
+
+    :param scope: dict
+    :param body: file
+        The request body
+    :param length: int
+        Size of the body
+    :return: dict
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'CONTENT_LENGTH': str(length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['REMOTE_PORT'] = str(scope['client'][1])
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = 'HTTP_' + name
+            environ[key] = '{},{}'.format(environ[key], value) if key in environ else value
+    return environ
+
+
+def call_wsgi(app, environ):
+    """
+    Calls a WSGI app and returns the status, the headers and the first chunk of the body
+
+    :param app: function
+    :param environ: dict
+    :return: tuple
+        (status, headers, first chunk or None, iterator of the remaining chunks, iterable)
+    """
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    iterable = app(environ, start_response)
+    iterator = iter(iterable)
+    first = next(iterator, None)
+    return started[0], started[1], first, iterator, iterable
+
+
+class ASGIApp:
+    """
+    ASGI 3 application which serves the routes of a module
+
+    async def handlers and async middlewares are awaited on the event loop.
+    Sync routes and shared files are served by the WSGI app in a bounded thread pool.
+    For async routes the steps which may block (opening and saving the session, preparing the response and
+    reading its body) run in the thread pool too. req.session is opened before the route if the request has
+    a session cookie.
+    The request body is read completely before the route is called.
+
+    :param module: str
+        Name of the module
+    :param max_threads: int
+        Size of the thread pool
+        Default = 40
+    """
+
+    def __init__(self, module, max_threads=40):
+        self.module = module
+        self.state = _utils.state(module)
+        self.wsgi = _utils.build_app(module)
+        self.pool = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='swapy')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError('ASGI scope type "{}" is not supported'.format(scope['type']))
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            body, length = await self.read_body(receive)
+        except RequestEntityTooLarge as e:
+            response = _utils.error_handler(e, self.module)
+            await self.send_response(send, *call_wsgi(response, {'REQUEST_METHOD': scope['method']}))
+            return
+        environ = environ_from(scope, body, length)
+        environ['swapy.loop'] = loop
+        environ['swapy.pool'] = self.pool
+        handle = False
+        hook = hooks.registry
+        if not isinstance(self.wsgi, StaticFiles) or self.wsgi.find(get_path_info(environ)) is None:
+            if hook['before_match']:
+                hooks.fire('before_match', environ)
+            try:
+                endpoint, args = _utils.match(self.module, environ)
+            except HTTPException:
+                environ['swapy.match'] = None
+            else:
+                if hook['after_match']:
+                    hooks.fire('after_match', environ, endpoint, args)
+                environ['swapy.match'] = (endpoint, args)
+                route = self.state.routes[endpoint]
+                handle = route['coroutine']
+                if handle is None:
+                    handle = compile_route(route)
+        if handle:
+            req, response = await self.dispatch(handle, environ, environ['swapy.match'][1])
+            # The first chunk may read a file
+            await self.send_response(send, *await loop.run_in_executor(self.pool, call_wsgi, response, environ))
+            if hook['response_sent']:
+                hooks.fire('response_sent', req, response, time.perf_counter() - start)
+        else:
+            result = await loop.run_in_executor(self.pool, call_wsgi, self.wsgi, environ)
+            await self.send_response(send, *result)
+
+    async def dispatch(self, handle, environ, args):
+        """
+        Calls an async route and returns the request and the werkzeug response
+
+        :param handle: function
+            The compiled async route
+        :param environ: dict
+        :param args: dict
+            Url arguments
+        :return: tuple
+            (:class:`swapy.wrappers.Request`, :class:`werkzeug.wrappers.Response`)
+        """
+        hook = hooks.registry
+        loop = asyncio.get_running_loop()
+        req = _utils.create_request(self.module, environ)
+        req.url_args = dict(args)
+        req.endpoint = environ['swapy.match'][0]
+        # Server side stores read the session from files or a database, it is opened in the pool if the request
+        # has a session cookie. The default store (created at the first session) uses 'session_id'.
+        if getattr(req.session_store, 'cookie_name', 'session_id') in req.cookies:
+            req._preloaded_session = await loop.run_in_executor(self.pool, req.open_session)
+        if hook['before_handler']:
+            hooks.fire('before_handler', req)
+        try:
+            result = await loop.run_in_executor(self.pool, _utils.make_response, req, await handle(req))
+        except HTTPException as ex:
+            if hook['exception']:
+                hooks.fire('exception', req, ex)
+            if isinstance(ex, NotFound):
+                result = _utils.not_found_handler(ex, self.module)
+            else:
+                result = _utils.error_handler(ex, self.module)
+        except Exception as ex:
+            if hook['exception']:
+                hooks.fire('exception', req, ex)
+            raise
+        if hook['after_handler']:
+            hooks.fire('after_handler', req, result)
+        if isinstance(result, HTTPException):
+            result = result.get_response(environ)
+        if req._session is not None:
+            await loop.run_in_executor(self.pool, _utils.commit_session, req, result)
+        return req, result
+
+    async def read_body(self, receive):
+        """
+        Returns the whole request body as file and its size
+        It is kept in memory up to spool_size bytes and written to a temporary file after that (see swapy.uploads)
+
+        :param receive: function
+        :return: tuple
+            (file, size)
+        :raises RequestEntityTooLarge: If the body exceeds max_content_length
+        """
+        settings = self.state.uploads
+        body = spooled_file(settings)
+        length = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            length += len(chunk)
+            if settings['max_content_length'] is not None and length > settings['max_content_length']:
+                body.close()
+                raise RequestEntityTooLarge()
+            body.write(chunk)
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body, length
+
+    async def send_response(self, send, status, headers, first, iterator, iterable):
+        """
+        Sends the response, the chunks after the first one are read in the thread pool
+
+        :param send: function
+        :param status: str
+        :param headers: list
+        :param first: bytes | None
+        :param iterator: iterator
+            Remaining chunks
+        :param iterable: iterable
+            Body of the WSGI app which is closed at the end
+        """
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        })
+        loop = asyncio.get_running_loop()
+        try:
+            chunk = first
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.pool, next, iterator, None)
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def lifespan(self, receive, send):
+        """
+        Handles the lifespan protocol, the thread pool is shut down at shutdown
+
+        :param receive: function
+        :param send: function
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,339 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from . import _utils
+from .wrappers import Response, response_from, adapt
+
+#: Status codes of responses which are cached
+cacheable_codes = (200, 203, 204, 300, 301, 404, 410)
+
+
+class Entry:
+    """
+    Cached response
+    """
+    __slots__ = ['content', 'code', 'headers', 'size', 'expires', 'endpoint', 'args']
+
+    def __init__(self, response, ttl, endpoint, args):
+        self.content = response.content
+        self.code = response.code
+        self.headers = dict(response.headers)
+        body = self.content.encode('utf-8') if isinstance(self.content, str) else self.content
+        self.size = len(body) + sum(len(k) + len(str(v)) for k, v in self.headers.items()) + 200
+        self.expires = time.monotonic() + ttl
+        self.endpoint = endpoint
+        self.args = args
+
+    def response(self):
+        """
+        Returns a new response with the cached values
+
+        :return: :class:`swapy.wrappers.Response`
+        """
+        return Response(self.content, self.code, dict(self.headers))
+
+
+class ResponseCache:
+    """
+    LRU cache of responses with a limit in bytes
+
+    The least recently used responses are removed if the cached content and headers need more than max_bytes.
+    Entries are indexed by endpoint and url arguments to invalidate them.
+
+    :param max_bytes: int
+        Default = 64 MiB
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._index = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the entry of the key if it isn't expired
+
+        :param key: tuple
+        :return: Entry | None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                self._remove(key)
+            self.misses += 1
+        return None
+
+    def set(self, key, entry):
+        """
+        Stores an entry and removes the least recently used ones if the cache is too big
+
+        :param key: tuple
+        :param entry: Entry
+        """
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._index.setdefault(entry.endpoint, {}).setdefault(entry.args, set()).add(key)
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry.size
+        args = self._index[entry.endpoint]
+        keys = args[entry.args]
+        keys.discard(key)
+        if not keys:
+            del args[entry.args]
+            if not args:
+                del self._index[entry.endpoint]
+
+    def invalidate(self, endpoint, url_args=None):
+        """
+        Removes the entries of an endpoint
+
+        :param endpoint: str
+        :param url_args: dict | None
+            Removes only the entries with these url arguments
+        :return: int
+            Number of removed entries
+        """
+        count = 0
+        with self._lock:
+            index = self._index.get(endpoint, {})
+            items = set(url_args.items()) if url_args else set()
+            for args in [args for args in index if items.issubset(args)]:
+                for key in list(index.get(args, ())):
+                    self._remove(key)
+                    count += 1
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+            self.size = 0
+
+    def flight(self, key, event_class=threading.Event):
+        """
+        Returns the event of a running computation of the key and if the caller has to compute it
+
+        :param key: tuple
+        :param event_class: class
+            :class:`threading.Event` or :class:`asyncio.Event` for coroutines, the key of an asyncio.Event has
+            to contain the event loop
+            Default = threading.Event
+        :return: tuple
+            (event, leader)
+        """
+        with self._lock:
+            event = self._flights.get(key)
+            if event is not None:
+                return event, False
+            event = self._flights[key] = event_class()
+            return event, True
+
+    def land(self, key, event):
+        """
+        Ends the computation of the key and wakes up the waiting requests
+
+        :param key: tuple
+        :param event: :class:`threading.Event` | :class:`asyncio.Event`
+        """
+        with self._lock:
+            self._flights.pop(key, None)
+        event.set()
+
+    def stats(self):
+        """
+        Returns the size and counters of the cache
+
+        :return: dict
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'size': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+#: Cache which is used if cached() doesn't get one
+default = ResponseCache()
+
+
+def _key(req, vary, key):
+    """
+    Returns the cache key of a request
+
+    :param req: :class:`swapy.wrappers.Request`
+    :param vary: tuple
+    :param key: function | None
+    :return: tuple
+    """
+    args = tuple(sorted((req.url_args or {}).items()))
+    custom = key(req) if key is not None else req.query_string
+    return (req.endpoint, args, custom) + tuple(req.headers.get(name) for name in vary)
+
+
+def _no_cache(req):
+    """
+    Returns True if the client doesn't accept a cached response
+
+    :param req: :class:`swapy.wrappers.Request`
+    :return: bool
+    """
+    return 'no-cache' in req.headers.get('Cache-Control', '') or 'no-cache' in req.headers.get('Pragma', '')
+
+
+def _entry(response, ttl, req):
+    """
+    Returns a cache entry for the response or None if it can't be cached
+
+    :param response: :class:`swapy.wrappers.Response`
+    :param ttl: int | float
+    :param req: :class:`swapy.wrappers.Request`
+    :return: Entry | None
+    """
+    if not isinstance(response, Response) or response.code not in cacheable_codes or response.get_cookies() \
+            or not isinstance(response.content, (str, bytes)) or 'Set-Cookie' in response.headers:
+        return None
+    # Responses of routes which read the session or the secure cookie belong to one user
+    if req._session is not None or req._secure_cookie is not None:
+        return None
+    return Entry(response, ttl, req.endpoint, tuple(sorted((req.url_args or {}).items())))
+
+
+def cached(f=None, ttl=30, vary=(), key=None, cache=None):
+    """
+    Caches the responses of a route
+    It can decorate a route function or be used as middleware for all routes of a module.
+
+    Only responses of GET and HEAD requests with a cacheable status, str or bytes content and without cookies
+    are stored. Responses of requests which used req.session or req.secure_cookie are never stored. Concurrent requests for the same key wait for the first one instead of calling the route again.
+    Requests with 'Cache-Control: no-cache' call the route and replace the cached response.
+
+    Example:
+        @on_get('/users/<id>')
+        @cached(ttl=60, vary=['Accept'])
+        def user(id):
+            ...
+
+        use(cached(ttl=10))
+
+    :param f: function
+    :param ttl: int | float
+        Seconds until a response expires
+        Default = 30
+    :param vary: list | tuple
+        Names of the request headers which are part of the key
+        Default = ()
+    :param key: function | None
+        Function which gets the request and returns a hashable part of the key instead of the query string
+        Default = None
+    :param cache: ResponseCache | None
+        Default = None (swapy.cache.default)
+    :return: function
+    """
+    if f is None:
+        return lambda target: cached(target, ttl, vary, key, cache)
+    store = cache if cache is not None else default
+    vary = tuple(vary)
+    call = adapt(f)
+
+    if asyncio.iscoroutinefunction(f):
+        @wraps(f)
+        async def handle_async(req):
+            if req.method not in ('GET', 'HEAD'):
+                return await call(req)
+            k = _key(req, vary, key)
+            if not _no_cache(req):
+                entry = store.get(k)
+                if entry is not None:
+                    return entry.response()
+            # asyncio events only work in their loop, requests of other loops have their own flight
+            flight = (k, asyncio.get_running_loop())
+            event, leader = store.flight(flight, asyncio.Event)
+            if not leader:
+                try:
+                    await asyncio.wait_for(event.wait(), ttl)
+                except asyncio.TimeoutError:
+                    pass
+                entry = store.get(k)
+                if entry is not None:
+                    return entry.response()
+                return await call(req)
+            try:
+                response = response_from(await call(req))
+                entry = _entry(response, ttl, req)
+                if entry is not None:
+                    store.set(k, entry)
+                return response
+            finally:
+                store.land(flight, event)
+        return handle_async
+
+    @wraps(f)
+    def handle(req):
+        if req.method not in ('GET', 'HEAD'):
+            return call(req)
+        k = _key(req, vary, key)
+        if not _no_cache(req):
+            entry = store.get(k)
+            if entry is not None:
+                return entry.response()
+        event, leader = store.flight(k)
+        if not leader:
+            event.wait(ttl)
+            entry = store.get(k)
+            if entry is not None:
+                return entry.response()
+            return call(req)
+        try:
+            response = response_from(call(req))
+            entry = _entry(response, ttl, req)
+            if entry is not None:
+                store.set(k, entry)
+            return response
+        finally:
+            store.land(k, event)
+    return handle
+
+
+def invalidate(route, cache=None, **url_args):
+    """
+    Removes the cached responses of a route
+
+    Example:
+        invalidate(user, id=5)
+
+    :param route: function | str
+        The route function or its endpoint
+    :param cache: ResponseCache | None
+        Default = None (swapy.cache.default)
+    :param url_args: object
+        Removes only the responses for these url arguments
+    :return: int
+        Number of removed responses
+    """
+    store = cache if cache is not None else default
+    if isinstance(route, str):
+        return store.invalidate(route, url_args)
+    count = 0
+    for endpoint in _utils.endpoints(route):
+        count += store.invalidate(endpoint, url_args)
+    return count
+
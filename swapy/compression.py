@@ -0,0 +1,254 @@
+import mimetypes
+import os
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#: Content-Encoding by file extension of precompressed files
+extensions = {'br': '.br', 'gzip': '.gz'}
+
+#: Encodings in order of preference
+encodings = ('br', 'gzip', 'deflate') if brotli is not None else ('gzip', 'deflate')
+
+_compressible = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                 'application/xhtml+xml', 'application/rss+xml', 'application/atom+xml', 'image/svg+xml',
+                 'application/manifest+json', 'application/wasm')
+_skipped_extensions = ('.gz', '.br', '.zip', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.woff', '.woff2', '.mp4',
+                       '.mp3', '.ogg', '.pdf', '.ico', '.eot')
+
+
+def compressible(content_type):
+    """
+    Returns True if responses with this content type should be compressed
+
+    :param content_type: str | None
+    :return: bool
+    """
+    if not content_type:
+        return True
+    content_type = content_type.split(';', 1)[0].strip().lower()
+    return content_type.startswith(_compressible) or content_type.endswith(('+json', '+xml'))
+
+
+def negotiate(accept_encoding, available=encodings):
+    """
+    Returns the best encoding which the client accepts
+
+    :param accept_encoding: str | None
+        Value of the Accept-Encoding header
+    :param available: list | tuple
+        Encodings in order of preference
+    :return: str | None
+    """
+    if not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    for encoding in available:
+        if accept.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+def compressor(encoding, level=6):
+    """
+    Returns a compressor object with compress(data) and flush(mode) methods
+
+    :param encoding: str
+        'br', 'gzip' or 'deflate'
+    :param level: int
+        Compression level from 1 to 9
+    :return: object
+    """
+    if encoding == 'gzip':
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if encoding == 'deflate':
+        return zlib.compressobj(level, zlib.DEFLATED, 15)
+    return _BrotliCompressor(level)
+
+
+class _BrotliCompressor:
+    """
+    Adapts brotli's Compressor to the interface of zlib's compress objects
+    """
+
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=min(11, level + 2))
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self, mode=zlib.Z_FINISH):
+        if mode == zlib.Z_FINISH:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(data, encoding, level=6):
+    """
+    Compresses all data at once
+
+    :param data: bytes
+    :param encoding: str
+    :param level: int
+    :return: bytes
+    """
+    c = compressor(encoding, level)
+    return c.compress(data) + c.flush(zlib.Z_FINISH)
+
+
+class CompressedStream:
+    """
+    Compresses an iterable chunk by chunk
+    Every chunk is flushed so the client receives it immediately, the iterable is closed by close()
+
+    :param iterable: iterable
+        Iterable of bytes or str
+    :param encoding: str
+    :param level: int
+    """
+
+    def __init__(self, iterable, encoding, level=6):
+        self.iterable = iterable
+        self.encoding = encoding
+        self.level = level
+
+    def __iter__(self):
+        c = compressor(self.encoding, self.level)
+        for chunk in self.iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if not chunk:
+                continue
+            data = c.compress(chunk) + c.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield c.flush(zlib.Z_FINISH)
+
+    def close(self):
+        close = getattr(self.iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+def add_vary(headers, value='Accept-Encoding'):
+    """
+    Adds a value to the Vary header of a headers dict
+
+    :param headers: dict
+    :param value: str
+    """
+    vary = headers.get('Vary')
+    if not vary:
+        headers['Vary'] = value
+    elif value.lower() not in [item.strip().lower() for item in vary.split(',')]:
+        headers['Vary'] = '{}, {}'.format(vary, value)
+
+
+def compress_response(response, accept_encoding, min_size=500, level=6):
+    """
+    Compresses the content of a response for the client
+
+    str and bytes are compressed at once if they have at least min_size bytes,
+    other iterables are compressed while they are sent.
+
+    :param response: :class:`swapy.wrappers.Response`
+    :param accept_encoding: str | None
+        Value of the Accept-Encoding header of the request
+    :param min_size: int
+    :param level: int
+    :return: :class:`swapy.wrappers.Response`
+    """
+    headers = response.headers
+    if 'Content-Encoding' in headers or response.code < 200 or response.code in (204, 206, 304) or \
+            not compressible(headers.get('Content-Type')):
+        return response
+    add_vary(headers)
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return response
+    content = response.content
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    if isinstance(content, bytes):
+        if len(content) < min_size:
+            return response
+        response.content = compress(content, encoding, level)
+        headers['Content-Length'] = str(len(response.content))
+    else:
+        try:
+            iter(content)
+        except TypeError:
+            return response
+        response.content = CompressedStream(content, encoding, level)
+        headers.pop('Content-Length', None)
+    headers['Content-Encoding'] = encoding
+    return response
+
+
+def precompress(directories, formats=('gzip', 'br'), min_size=500, level=9):
+    """
+    Writes compressed siblings (.gz, .br) for all compressible files in the directories
+    Existing siblings which are newer than their file are kept
+
+    :param directories: list
+        Absolute paths of directories
+    :param formats: list | tuple
+        'gzip' and/or 'br' ('br' is skipped if brotli is not installed)
+    :param min_size: int
+        Smaller files are not compressed
+    :param level: int
+    :return: int
+        Number of written files
+    """
+    count = 0
+    formats = [encoding for encoding in formats if encoding != 'br' or brotli is not None]
+    for directory in directories:
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                if name.lower().endswith(_skipped_extensions) or not compressible(mimetypes.guess_type(name)[0]) \
+                        or os.path.getsize(path) < min_size:
+                    continue
+                mtime = os.path.getmtime(path)
+                data = None
+                for encoding in formats:
+                    target = path + extensions[encoding]
+                    if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                        continue
+                    if data is None:
+                        with open(path, 'rb') as f:
+                            data = f.read()
+                    with open(target + '.tmp', 'wb') as f:
+                        f.write(compress(data, encoding, level))
+                    os.replace(target + '.tmp', target)
+                    count += 1
+    return count
+
+
+def precompressed(path, accept_encoding):
+    """
+    Returns the newest precompressed sibling of a file which the client accepts
+
+    :param path: str
+    :param accept_encoding: str | None
+    :return: tuple | None
+        (path, encoding)
+    """
+    if not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    for encoding in ('br', 'gzip'):
+        if accept.quality(encoding) <= 0:
+            continue
+        target = path + extensions[encoding]
+        try:
+            if os.path.getmtime(target) >= os.path.getmtime(path):
+                return target, encoding
+        except OSError:
+            pass
+    return None
@@ -0,0 +1,297 @@
+import threading
+import weakref
+from bisect import bisect_left
+
+from werkzeug.exceptions import HTTPException
+
+# noinspection PyProtectedMember
+from swapy import _utils, hooks, pools
+from swapy.wrappers import Response
+
+#: Default upper bounds of the latency buckets in seconds
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+#: Label of requests which matched no route
+unmatched = '<unmatched>'
+
+_buckets = default_buckets
+_local = threading.local()
+_lock = threading.Lock()
+_live = []
+_retired = None
+
+
+class _Stats:
+    """
+    Metrics which are recorded by one thread
+    Every thread writes only its own instance, so recording needs no lock. The export merges all of them.
+    """
+    __slots__ = ['requests', 'latency', 'in_flight', 'sessions', 'templates', 'exceptions']
+
+    def __init__(self):
+        self.requests = {}
+        self.latency = {}
+        self.in_flight = 0
+        self.sessions = {}
+        self.templates = {}
+        self.exceptions = {}
+
+    def merge(self, other):
+        """
+        Adds the values of another instance to this one
+
+        :param other: _Stats
+        """
+        for name in ('requests', 'exceptions'):
+            target = getattr(self, name)
+            for key, value in getattr(other, name).copy().items():
+                target[key] = target.get(key, 0) + value
+        for name in ('latency', 'sessions', 'templates'):
+            target = getattr(self, name)
+            for key, values in getattr(other, name).copy().items():
+                current = target.get(key)
+                if current is None:
+                    target[key] = list(values)
+                else:
+                    target[key] = [a + b for a, b in zip(current, values)]
+        self.in_flight += other.in_flight
+
+
+class _Holder:
+    __slots__ = ['stats', '__weakref__']
+
+    def __init__(self, stats):
+        self.stats = stats
+
+
+def _retire(stats):
+    """
+    Keeps the values of a finished thread
+    """
+    global _retired
+    with _lock:
+        if _retired is None:
+            _retired = _Stats()
+        _retired.merge(stats)
+        _live.remove(stats)
+
+
+def _stats():
+    """
+    Returns the stats of the current thread
+
+    :return: _Stats
+    """
+    holder = getattr(_local, 'holder', None)
+    if holder is None:
+        holder = _local.holder = _Holder(_Stats())
+        with _lock:
+            _live.append(holder.stats)
+        # The holder is released with the thread locals when the thread ends
+        weakref.finalize(holder, _retire, holder.stats)
+    return holder.stats
+
+
+def _observe(histograms, key, value):
+    """
+    Adds a value to a histogram which is stored as [count per bucket..., count above all buckets, sum]
+    """
+    values = histograms.get(key)
+    if values is None:
+        values = histograms[key] = [0] * (len(_buckets) + 2)
+    values[bisect_left(_buckets, value)] += 1
+    values[-1] += value
+
+
+def _label(endpoint):
+    """
+    Returns the label of an endpoint
+    Endpoints are the same in all processes, so the metrics of pre-forked workers can be summed up
+
+    :param endpoint: str | None
+    :return: str
+    """
+    return unmatched if endpoint is None else endpoint
+
+
+def _before_handler(req):
+    req.environ['swapy.metrics.in_flight'] = True
+    _stats().in_flight += 1
+
+
+def _done(req):
+    if req.environ.pop('swapy.metrics.in_flight', False):
+        _stats().in_flight -= 1
+
+
+def _response_sent(req, response, duration):
+    stats = _stats()
+    label = _label(req.endpoint)
+    key = (label, req.method, str(response.status_code))
+    stats.requests[key] = stats.requests.get(key, 0) + 1
+    _observe(stats.latency, (label, req.method), duration)
+
+
+def _exception(req, exception):
+    stats = _stats()
+    key = (_label(req.endpoint), type(exception).__name__)
+    stats.exceptions[key] = stats.exceptions.get(key, 0) + 1
+    if not isinstance(exception, HTTPException):
+        # The request ends without after_handler and response_sent
+        _done(req)
+
+
+def _session(req, action, duration):
+    _observe(_stats().sessions, (action,), duration)
+
+
+def _template_rendered(name, duration):
+    _observe(_stats().templates, (name,), duration)
+
+
+_hooks = {
+    'before_handler': _before_handler,
+    'after_handler': lambda req, response: _done(req),
+    'response_sent': _response_sent,
+    'exception': _exception,
+    'session': _session,
+    'template_rendered': _template_rendered
+}
+
+
+def init(path='/metrics', buckets=default_buckets):
+    """
+    Initializes this extension to a swapy module
+
+    It records the requests of all modules and registers a route which returns them in the Prometheus text format:
+    - swapy_requests_total (endpoint, method, status)
+    - swapy_request_duration_seconds (endpoint, method)
+    - swapy_requests_in_flight
+    - swapy_exceptions_total (endpoint, exception)
+    - swapy_session_duration_seconds (action)
+    - swapy_template_render_seconds (template)
+    - swapy_pool_* (pool)
+
+    :param path: str
+        URL endpoint path for which will be routed
+        Default: '/metrics'
+    :param buckets: tuple
+        Upper bounds of the histogram buckets in seconds
+        Default: default_buckets
+    """
+    global _buckets
+    if not path.startswith('/'):
+        path = '/' + path
+    buckets = tuple(sorted(buckets))
+    if buckets != _buckets:
+        reset()
+        _buckets = buckets
+    for name, f in _hooks.items():
+        if f not in hooks.registry[name]:
+            hooks.register(name, f)
+    module = _utils.caller()
+    _utils.register_route(module, path, ['GET'])(handle)
+
+
+def remove():
+    """
+    Stops recording, the recorded values are kept
+    """
+    for name, f in _hooks.items():
+        hooks.remove(name, f)
+
+
+def reset():
+    """
+    Removes all recorded values
+    """
+    global _retired
+    with _lock:
+        _retired = None
+        for stats in _live:
+            for name in ('requests', 'latency', 'sessions', 'templates', 'exceptions'):
+                getattr(stats, name).clear()
+
+
+def collect():
+    """
+    Returns the merged values of all threads
+
+    :return: _Stats
+    """
+    result = _Stats()
+    with _lock:
+        if _retired is not None:
+            result.merge(_retired)
+        for stats in _live:
+            result.merge(stats)
+    return result
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _counter(lines, name, doc, names, values):
+    lines.append('# HELP {} {}'.format(name, doc))
+    lines.append('# TYPE {} counter'.format(name))
+    for key, value in sorted(values.items()):
+        lines.append('{}{} {}'.format(name, _format_labels(names, key), value))
+
+
+def _histogram(lines, name, doc, names, values):
+    lines.append('# HELP {} {}'.format(name, doc))
+    lines.append('# TYPE {} histogram'.format(name))
+    for key, counts in sorted(values.items()):
+        total = 0
+        for bound, count in zip(_buckets, counts):
+            total += count
+            lines.append('{}_bucket{} {}'.format(name, _format_labels(names, key, 'le="{}"'.format(bound)), total))
+        total += counts[-2]
+        lines.append('{}_bucket{} {}'.format(name, _format_labels(names, key, 'le="+Inf"'), total))
+        lines.append('{}_sum{} {}'.format(name, _format_labels(names, key), repr(float(counts[-1]))))
+        lines.append('{}_count{} {}'.format(name, _format_labels(names, key), total))
+
+
+def export():
+    """
+    Returns all metrics in the Prometheus text format
+
+    :return: str
+    """
+    stats = collect()
+    lines = []
+    _counter(lines, 'swapy_requests_total', 'Number of finished requests', ('endpoint', 'method', 'status'),
+             stats.requests)
+    _histogram(lines, 'swapy_request_duration_seconds', 'Time until the response was sent', ('endpoint', 'method'),
+               stats.latency)
+    lines.append('# HELP swapy_requests_in_flight Number of requests which are handled')
+    lines.append('# TYPE swapy_requests_in_flight gauge')
+    lines.append('swapy_requests_in_flight {}'.format(stats.in_flight))
+    _counter(lines, 'swapy_exceptions_total', 'Number of exceptions raised while requests were handled',
+             ('endpoint', 'exception'), stats.exceptions)
+    _histogram(lines, 'swapy_session_duration_seconds', 'Time to open or commit sessions', ('action',),
+               stats.sessions)
+    _histogram(lines, 'swapy_template_render_seconds', 'Time to render templates', ('template',), stats.templates)
+    pool_stats = pools.stats()
+    for field, kind in (('queued', 'gauge'), ('running', 'gauge'), ('completed', 'counter'),
+                        ('rejected', 'counter')):
+        name = 'swapy_pool_{}'.format(field) + ('_total' if kind == 'counter' else '')
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for pool_name, values in sorted(pool_stats.items()):
+            lines.append('{}{} {}'.format(name, _format_labels(('pool',), (pool_name,)), values[field]))
+    return '\n'.join(lines) + '\n'
+
+
+def handle(req):
+    """
+    Route which returns the metrics
+    """
+    return Response(export(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
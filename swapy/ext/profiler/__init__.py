@@ -0,0 +1,379 @@
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from functools import wraps
+
+from werkzeug.exceptions import Forbidden, BadRequest
+
+# noinspection PyProtectedMember
+from swapy import _utils
+from swapy.wrappers import Request, Response
+
+#: Endpoint of requests which were not dispatched by swapy
+unknown = '<unknown>'
+
+
+class Profiler:
+    """
+    Profiles a sample of the requests and aggregates the results per endpoint
+
+    Modes:
+        'sampling' reads the stacks of the profiled requests every interval seconds from a background thread.
+            It costs nearly nothing in the request and records full stacks for flamegraphs.
+        'cprofile' runs cProfile for the whole request. It is exact but slows the request down.
+            Only one request is profiled at a time, others are skipped.
+
+    The results are kept per process. Workers of the PreforkServer profile their own requests,
+    the sampler thread is started again in every forked process and the admin routes show the results of the
+    worker which handles the request.
+
+    :param rate: float
+        Share of the requests which are profiled (0.0 - 1.0)
+        Default = 0.01
+    :param mode: str
+        'sampling' or 'cprofile'
+        Default = 'sampling'
+    :param interval: float
+        Seconds between two samples
+        Default = 0.005
+    """
+
+    def __init__(self, rate=0.01, mode='sampling', interval=0.005):
+        self.enabled = False
+        self.rate = rate
+        self.mode = mode
+        self.interval = interval
+        self.ignore = set()
+        self._lock = threading.Lock()
+        self._cprofile_lock = threading.Lock()
+        self._active = {}
+        self._requests = {}
+        self._stacks = {}
+        self._stats = {}
+        self._sampler = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """
+        Resets the state of the forked process, threads (and so the sampler) don't survive a fork
+        """
+        self._lock = threading.Lock()
+        self._cprofile_lock = threading.Lock()
+        self._active = {}
+        self._sampler = None
+        if self.enabled:
+            self._start_sampler()
+
+    def _start_sampler(self):
+        """
+        Starts the sampler thread if the mode is 'sampling' and it isn't running
+        """
+        if self.mode == 'sampling' and (self._sampler is None or not self._sampler.is_alive()):
+            self._sampler = threading.Thread(target=self._sample, name='swapy-profiler', daemon=True)
+            self._sampler.start()
+
+    def start(self, rate=None, mode=None, interval=None):
+        """
+        Starts profiling, the arguments replace the current settings
+
+        :param rate: float | None
+        :param mode: str | None
+        :param interval: float | None
+        """
+        if mode is not None and mode not in ('sampling', 'cprofile'):
+            raise ValueError('Mode "{}" is not supported. Please use "sampling" or "cprofile".'.format(mode))
+        with self._lock:
+            if rate is not None:
+                self.rate = min(max(float(rate), 0.0), 1.0)
+            if mode is not None:
+                self.mode = mode
+            if interval is not None:
+                self.interval = float(interval)
+            self.enabled = True
+            self._start_sampler()
+
+    def stop(self):
+        """
+        Stops profiling, the results are kept
+        """
+        self.enabled = False
+
+    def reset(self):
+        """
+        Removes all results
+        """
+        with self._lock:
+            self._requests.clear()
+            self._stacks.clear()
+            self._stats.clear()
+
+    def middleware(self, f):
+        """
+        Middleware which profiles the sampled requests
+        init() adds it as outermost middleware of the module, so the time of all other middlewares is included.
+        It stays outermost if more middlewares are added with use() later.
+
+        :param f: function
+        :return: function
+        """
+        @wraps(f)
+        def handle(*args, **kwargs):
+            if not self.enabled or random.random() >= self.rate:
+                return f(*args, **kwargs)
+            endpoint = unknown
+            if args and isinstance(args[0], Request):
+                endpoint = args[0].endpoint or unknown
+            if endpoint in self.ignore:
+                return f(*args, **kwargs)
+            if self.mode == 'cprofile':
+                return self._profile(endpoint, f, args, kwargs)
+            if self._sampler is None or not self._sampler.is_alive():
+                with self._lock:
+                    self._start_sampler()
+            ident = threading.get_ident()
+            # Frames below this one belong to the server and are not recorded
+            self._active[ident] = (endpoint, sys._getframe())
+            try:
+                return f(*args, **kwargs)
+            finally:
+                del self._active[ident]
+                self._count(endpoint)
+        return handle
+
+    middleware.outermost = True
+
+    def _count(self, endpoint):
+        with self._lock:
+            self._requests[endpoint] = self._requests.get(endpoint, 0) + 1
+
+    def _profile(self, endpoint, f, args, kwargs):
+        """
+        Calls f with cProfile and adds the results to the stats of the endpoint
+        """
+        if not self._cprofile_lock.acquire(False):
+            return f(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                profile.disable()
+        finally:
+            self._cprofile_lock.release()
+            with self._lock:
+                stats = self._stats.get(endpoint)
+                if stats is None:
+                    self._stats[endpoint] = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            self._count(endpoint)
+
+    def _sample(self):
+        """
+        Records the stacks of the profiled requests until profiling is stopped
+        """
+        while self.enabled and self.mode == 'sampling':
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            for ident, (endpoint, marker) in list(self._active.items()):
+                frame = frames.get(ident)
+                names = []
+                while frame is not None and frame is not marker:
+                    names.append(_name(frame.f_code))
+                    frame = frame.f_back
+                if frame is None or not names:
+                    continue
+                stack = ';'.join(reversed(names))
+                with self._lock:
+                    stacks = self._stacks.setdefault(endpoint, {})
+                    stacks[stack] = stacks.get(stack, 0) + 1
+
+    def endpoints(self):
+        """
+        Returns the number of profiled requests per endpoint
+
+        :return: dict
+        """
+        with self._lock:
+            return dict(self._requests)
+
+    def collapsed(self, endpoint=None):
+        """
+        Returns the sampled stacks in the collapsed format of flamegraph.pl and speedscope
+        Every line is 'frame;frame;frame count'. Without an endpoint the endpoints are the root frames.
+
+        :param endpoint: str | None
+        :return: str
+        """
+        with self._lock:
+            items = [(name, dict(stacks)) for name, stacks in self._stacks.items()
+                     if endpoint is None or name == endpoint]
+        lines = []
+        for name, stacks in sorted(items):
+            for stack, count in sorted(stacks.items()):
+                lines.append('{} {}'.format(stack if endpoint is not None else '{};{}'.format(name, stack), count))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def top(self, n=20, endpoint=None):
+        """
+        Returns the functions with the highest total time
+
+        :param n: int
+        :param endpoint: str | None
+            Only the results of this endpoint
+        :return: list
+            (function, own seconds, total seconds, calls) tuples, calls is None in the sampling mode
+        """
+        functions = {}
+        with self._lock:
+            stacks = [dict(s) for name, s in self._stacks.items() if endpoint is None or name == endpoint]
+            stats = [s for name, s in self._stats.items() if endpoint is None or name == endpoint]
+            for sampled in stacks:
+                for stack, count in sampled.items():
+                    names = stack.split(';')
+                    for name in set(names):
+                        _add(functions, name, 0.0, count * self.interval, None)
+                    _add(functions, names[-1], count * self.interval, 0.0, None)
+            for profiled in stats:
+                for (filename, line, function), (_, calls, own, total, _) in profiled.stats.items():
+                    name = _name_of(filename, line, function)
+                    _add(functions, name, own, total, calls)
+        result = [(name,) + tuple(values) for name, values in functions.items()]
+        result.sort(key=lambda item: item[2], reverse=True)
+        return result[:n]
+
+    def report(self, n=20, endpoint=None):
+        """
+        Returns the top-n table as text
+
+        :param n: int
+        :param endpoint: str | None
+        :return: str
+        """
+        lines = ['mode: {}, enabled: {}, rate: {}'.format(self.mode, self.enabled, self.rate), '']
+        for name, count in sorted(self.endpoints().items()):
+            if endpoint is None or name == endpoint:
+                lines.append('{:>8} {}'.format(count, name))
+        lines.append('')
+        lines.append('{:>10} {:>10} {:>8}  {}'.format('total ms', 'own ms', 'calls', 'function'))
+        for name, own, total, calls in self.top(n, endpoint):
+            lines.append('{:>10.2f} {:>10.2f} {:>8}  {}'.format(total * 1000, own * 1000,
+                                                               '-' if calls is None else calls, name))
+        return '\n'.join(lines) + '\n'
+
+
+def _add(functions, name, own, total, calls):
+    values = functions.get(name)
+    if values is None:
+        functions[name] = [own, total, calls]
+        return
+    values[0] += own
+    values[1] += total
+    if calls is not None:
+        values[2] = (values[2] or 0) + calls
+
+
+def _name(code):
+    return _name_of(code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _name_of(filename, line, function):
+    if filename == '~':
+        # Built-in functions of cProfile
+        return function
+    return '{} ({}:{})'.format(function, os.path.basename(filename), line)
+
+
+#: Profiler of all modules which use this extension
+profiler = Profiler()
+
+
+def init(path='/profiler', rate=None, mode=None, interval=None, token=None):
+    """
+    Initializes this extension to a swapy module
+
+    The profiler is started if the environment variable SWAPY_PROFILE contains a rate above 0
+    (SWAPY_PROFILE_MODE sets the mode). It can be controlled at runtime with the admin routes:
+    - GET /profiler (default): Top functions as text (query: n, endpoint)
+    - GET /profiler/flamegraph: Collapsed stacks (query: endpoint)
+    - POST /profiler: Starts or stops the profiler (form or query: enabled, rate, mode, interval)
+    - DELETE /profiler: Removes the results
+
+    The results are per process, with the PreforkServer every worker profiles and shows its own requests.
+    The routes need the token in the X-Profiler-Token header or the token query argument.
+    Without a token (or SWAPY_PROFILE_TOKEN) the routes are not registered, the profiler can still be used
+    from code with swapy.ext.profiler.profiler.
+
+    :param path: str
+        URL endpoint path for which will be routed
+        Default: '/profiler'
+    :param rate: float | None
+    :param mode: str | None
+        'sampling' or 'cprofile'
+    :param interval: float | None
+        Seconds between two samples
+    :param token: str | None
+    """
+    if not path.startswith('/'):
+        path = '/' + path
+    module = _utils.caller()
+    state_ = _utils.state(module)
+    if profiler.middleware not in state_.middlewares:
+        # The last middleware wraps all others
+        _utils.use(module, profiler.middleware)
+    token = token or os.environ.get('SWAPY_PROFILE_TOKEN')
+    if token:
+        handle = _admin(token)
+        _utils.register_route(module, path, ['GET', 'POST', 'DELETE'])(handle)
+        _utils.register_route(module, path + '/flamegraph', ['GET'])(handle)
+        profiler.ignore.update(_utils.endpoints(handle))
+    rate = rate if rate is not None else float(os.environ.get('SWAPY_PROFILE', 0) or 0)
+    mode = mode or os.environ.get('SWAPY_PROFILE_MODE')
+    if rate > 0:
+        profiler.start(rate, mode, interval)
+    elif mode is not None or interval is not None:
+        profiler.mode = mode or profiler.mode
+        profiler.interval = interval or profiler.interval
+
+
+def _admin(token):
+    """
+    Returns the handler of the admin routes
+
+    :param token: str
+    :return: function
+    """
+    def handle(req):
+        given = req.headers.get('X-Profiler-Token') or req.args.get('token') or ''
+        if not hmac.compare_digest(given.encode('utf-8'), token.encode('utf-8')):
+            raise Forbidden()
+        headers = {'Content-Type': 'text/plain; charset=utf-8', 'Cache-Control': 'no-store'}
+        endpoint = req.args.get('endpoint') or None
+        if req.path.rstrip('/').endswith('/flamegraph'):
+            return Response(profiler.collapsed(endpoint), headers=headers)
+        if req.method == 'DELETE':
+            profiler.reset()
+        elif req.method == 'POST':
+            values = req.values
+            try:
+                if values.get('enabled', '1') in ('0', 'false', 'off'):
+                    profiler.stop()
+                else:
+                    profiler.start(values.get('rate'), values.get('mode'), values.get('interval'))
+            except ValueError as e:
+                raise BadRequest(str(e))
+        try:
+            n = int(req.args.get('n', 20))
+        except ValueError:
+            raise BadRequest('n must be a number')
+        return Response(profiler.report(n, endpoint), headers=headers)
+    return handle
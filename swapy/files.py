@@ -0,0 +1,706 @@
+import hashlib
+import mimetypes
+import mmap
+import os
+import re
+import select
+import socket
+import threading
+import uuid
+import zlib
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from werkzeug.http import http_date, parse_range_header, parse_if_range_header, is_resource_modified, quote_etag, \
+    parse_accept_header
+from werkzeug.security import safe_join
+from werkzeug.wrappers import Response as _Response
+from werkzeug.wsgi import get_path_info
+
+from . import compression
+from .wrappers import Response
+
+_metadata = OrderedDict()
+_metadata_lock = threading.Lock()
+_metadata_size = 1024
+
+
+class FileMetadata:
+    """
+    Precomputed header values of a file version
+    """
+    __slots__ = ['path', 'size', 'mtime', 'modified', 'last_modified', 'etag', 'mimetype']
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.modified = datetime.utcfromtimestamp(int(stat.st_mtime))
+        self.last_modified = http_date(int(stat.st_mtime))
+        self.etag = 'swapy-{}-{}-{}'.format(int(stat.st_mtime), stat.st_size,
+                                            zlib.adler32(path.encode('utf-8', 'replace')) & 0xffffffff)
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def metadata(path):
+    """
+    Returns the metadata of the file
+    Only the stat call is done for every request, the header values are cached by (path, mtime, size)
+
+    :param path: str
+        Absolute path of the file
+    :return: FileMetadata
+    :raises FileNotFoundError: If the file doesn't exist
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _metadata_lock:
+        meta = _metadata.get(key)
+        if meta is not None:
+            _metadata.move_to_end(key)
+            return meta
+    meta = FileMetadata(path, stat)
+    with _metadata_lock:
+        _metadata[key] = meta
+        while len(_metadata) > _metadata_size:
+            _metadata.popitem(last=False)
+    return meta
+
+
+class FileContent:
+    """
+    Iterable over the bytes of a file or a part of it
+    The file is opened at the first iteration and closed by close()
+
+    If a socket is set the content is sent with os.sendfile directly from the page cache to the socket
+    after an empty chunk (which makes the server send the headers). Otherwise the file is memory-mapped and
+    iterated in chunks.
+
+    The Content-Length header is computed before the file is opened, so the content is exactly end - start bytes.
+    If the file is shorter by then OSError is raised and the server closes the connection.
+
+    :param path: str
+    :param start: int
+    :param end: int | None
+        Exclusive end, None for the end of the file (use the size of the Content-Length header instead if it is known)
+    """
+
+    chunk_size = 65536
+
+    def __init__(self, path, start=0, end=None):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.socket = None
+        self._file = None
+
+    def __iter__(self):
+        self._file = f = open(self.path, 'rb')
+        size = os.fstat(f.fileno()).st_size
+        end = self.end if self.end is not None else size
+        if size < end:
+            raise OSError('File {} was truncated to {} bytes, {} bytes were expected'.format(self.path, size, end))
+        if self.socket is not None:
+            yield b''
+            _sendfile(self.socket, f, self.start, end - self.start)
+        elif end > self.start:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for position in range(self.start, end, self.chunk_size):
+                    yield mapped[position:min(position + self.chunk_size, end)]
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _sendfile(sock, f, offset, count):
+    """
+    Sends count bytes of the file from offset to the socket without copying them through Python
+
+    :param sock: socket.socket
+    :param f: file
+    :param offset: int
+    :param count: int
+    :raises OSError: If the file ends before count bytes were sent
+    """
+    out = sock.fileno()
+    while count > 0:
+        try:
+            sent = os.sendfile(out, f.fileno(), offset, count)
+        except BlockingIOError:
+            # Sockets with a timeout are non-blocking, it waits until the client read enough
+            poll = select.poll()
+            poll.register(out, select.POLLOUT)
+            timeout = sock.gettimeout()
+            if not poll.poll(None if timeout is None else timeout * 1000):
+                raise socket.timeout('Timed out while sending the file')
+            continue
+        if sent == 0:
+            raise OSError('File {} ended before {} more bytes were sent'.format(f.name, count))
+        offset += sent
+        count -= sent
+
+
+def zero_copy(content, environ):
+    """
+    Returns content which is sent without copying the file through Python if the server supports it
+
+    swapy's server (see :mod:`swapy.serving`) puts the socket as 'swapy.socket' into the environment, so
+    os.sendfile is used for whole files and ranges. Other servers may provide a 'wsgi.file_wrapper' which
+    is used for whole files.
+
+    :param content: FileContent
+    :param environ: dict
+        WSGI environment
+    :return: iterable
+    """
+    if environ['REQUEST_METHOD'] == 'HEAD':
+        return content
+    sock = environ.get('swapy.socket')
+    if sock is not None:
+        content.socket = sock
+        return content
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None and content.start == 0 and \
+            (content.end is None or content.end == os.path.getsize(content.path)):
+        return file_wrapper(open(content.path, 'rb'), content.chunk_size)
+    return content
+
+
+class MultipartContent:
+    """
+    Iterable over a multipart/byteranges body for multiple ranges of a file
+
+    :param path: str
+    :param ranges: list
+        List of (start, end) tuples with exclusive ends
+    :param mimetype: str
+    :param size: int
+        Size of the whole file
+    :param boundary: str
+    """
+
+    def __init__(self, path, ranges, mimetype, size, boundary):
+        self.parts = []
+        for start, end in ranges:
+            head = '--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'.format(
+                boundary, mimetype, start, end - 1, size).encode('latin-1')
+            self.parts.append((head, FileContent(path, start, end)))
+        self.tail = '--{}--\r\n'.format(boundary).encode('latin-1')
+        self.length = sum(len(head) + content.end - content.start + 2 for head, content in self.parts) + \
+            len(self.tail)
+
+    def __iter__(self):
+        for head, content in self.parts:
+            yield head
+            for data in content:
+                yield data
+            yield b'\r\n'
+        yield self.tail
+
+    def close(self):
+        for _, content in self.parts:
+            content.close()
+
+
+class FileResponse(Response):
+    """
+    Response for a file which supports conditional requests (ETag, Last-Modified) and byte ranges
+
+    The file is only opened if the body is sent.
+    :meth:`prepare` has to be called with the WSGI environment of the request before the response is sent.
+    It chooses the fastest way to send the file which the server supports (see :func:`zero_copy`).
+    """
+    __slots__ = ['path', 'metadata', 'conditional']
+
+    def __init__(self, path, headers=None, conditional=True):
+        meta = metadata(path)
+        all_headers = {
+            'Content-Type': meta.mimetype,
+            'Content-Length': str(meta.size),
+            'Accept-Ranges': 'bytes',
+            'Last-Modified': meta.last_modified,
+            'ETag': quote_etag(meta.etag)
+        }
+        if headers:
+            all_headers.update(headers)
+        Response.__init__(self, FileContent(path, 0, meta.size), 200, all_headers)
+        self.path = path
+        self.metadata = meta
+        self.conditional = conditional
+
+    def prepare(self, environ):
+        """
+        Returns the response for the request of the given environment
+        It is a 304 response if the client has the current version, a 206 response for satisfiable ranges,
+        a 416 response for unsatisfiable ranges or the response itself
+
+        :param environ: dict
+            WSGI environment
+        :return: :class:`swapy.wrappers.Response`
+        """
+        if not self.conditional or self.code != 200 or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self._copy(zero_copy(self.content, environ), self.code, self.headers)
+        meta = self.metadata
+        if not is_resource_modified(environ, etag=meta.etag, last_modified=meta.modified):
+            headers = {key: value for key, value in self.headers.items()
+                       if key not in ('Content-Type', 'Content-Length', 'Content-Disposition')}
+            return self._copy('', 304, headers)
+        if 'HTTP_RANGE' in environ and _if_range(environ, meta):
+            return self._range(environ['HTTP_RANGE'], environ)
+        return self._copy(zero_copy(self.content, environ), self.code, self.headers)
+
+    def _range(self, header, environ):
+        """
+        Returns the partial response for the value of a Range header
+
+        :param header: str
+        :param environ: dict
+        :return: :class:`swapy.wrappers.Response`
+        """
+        meta = self.metadata
+        rng = parse_range_header(header)
+        if rng is None or rng.units != 'bytes':
+            return self._copy(zero_copy(self.content, environ), self.code, self.headers)
+        ranges = []
+        for start, end in rng.ranges:
+            if end is None:
+                end = meta.size
+            if start < 0:
+                start = max(meta.size + start, 0)
+            end = min(end, meta.size)
+            if start < end:
+                ranges.append((start, end))
+        headers = dict(self.headers)
+        if not ranges:
+            headers.pop('Content-Type', None)
+            headers.pop('Content-Disposition', None)
+            headers['Content-Range'] = 'bytes */{}'.format(meta.size)
+            headers['Content-Length'] = '0'
+            return self._copy('', 416, headers)
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end - 1, meta.size)
+            headers['Content-Length'] = str(end - start)
+            return self._copy(zero_copy(FileContent(self.path, start, end), environ), 206, headers)
+        boundary = uuid.uuid4().hex
+        content = MultipartContent(self.path, ranges, meta.mimetype, meta.size, boundary)
+        headers['Content-Type'] = 'multipart/byteranges; boundary={}'.format(boundary)
+        headers['Content-Length'] = str(content.length)
+        return self._copy(content, 206, headers)
+
+    def _copy(self, content, code, headers):
+        """
+        Returns a plain response with the cookies of this response
+        """
+        response = Response(content, code, headers)
+        response.set_cookies(self.cookies)
+        return response
+
+
+def _if_range(environ, meta):
+    """
+    Returns True if the Range header should be used
+
+    :param environ: dict
+    :param meta: FileMetadata
+    :return: bool
+    """
+    if 'HTTP_IF_RANGE' not in environ:
+        return True
+    if_range = parse_if_range_header(environ['HTTP_IF_RANGE'])
+    if if_range.etag is not None:
+        return if_range.etag == meta.etag
+    return if_range.date is not None and if_range.date >= meta.modified
+
+
+def send_file(path, name=None, as_attachment=False, mimetype=None, cache_control=None, conditional=True):
+    """
+    Returns a file response
+
+    :param path: str
+        Absolute path of the file
+    :param name: str | None
+        File name for the client
+    :param as_attachment: bool
+        Sends a Content-Disposition header which tells the browser to download the file
+    :param mimetype: str | None
+        Guessed from the file name if it is None
+    :param cache_control: str | int | None
+        Value of the Cache-Control header or max-age in seconds
+    :param conditional: bool
+        Handles If-None-Match, If-Modified-Since, Range and If-Range
+    :return: FileResponse
+    """
+    headers = {}
+    if mimetype:
+        headers['Content-Type'] = mimetype
+    if as_attachment:
+        headers['Content-Disposition'] = 'attachment;filename=' + (name or os.path.basename(path))
+    if cache_control is not None:
+        headers['Cache-Control'] = cache_control if isinstance(cache_control, str) else \
+            'public, max-age={}'.format(cache_control)
+    return FileResponse(path, headers, conditional)
+
+
+def to_wsgi(res):
+    """
+    Converts a swapy response into a werkzeug response
+
+    :param res: :class:`swapy.wrappers.Response`
+    :return: :class:`werkzeug.wrappers.Response`
+    """
+    ret = _Response(res.content, res.code, res.headers, direct_passthrough=True)
+    for cookie in res.cookies.keys():
+        ret.set_cookie(cookie, res.cookies[cookie])
+    return ret
+
+
+#: Cache-Control header of fingerprinted urls, their content never changes
+immutable = 'public, max-age=31536000, immutable'
+
+_fingerprinted = re.compile(r'^(.+)\.([0-9a-f]{8})((?:\.[^./]*)?)$')
+
+
+class HotFile:
+    """
+    File which is kept in memory with its precomputed headers
+    """
+    __slots__ = ['body', 'headers', 'metadata', 'size']
+
+    def __init__(self, body, headers, meta):
+        self.body = body
+        self.headers = headers
+        self.metadata = meta
+        self.size = len(body) + 200
+
+
+#: Size and modification time of an indexed file, FileMetadata accepts it like an os.stat_result
+IndexStat = namedtuple('IndexStat', ['st_size', 'st_mtime'])
+
+
+class StaticIndex:
+    """
+    Index of the files in the shared directories and cache of the hot ones
+
+    The directories are scanned once, so lookups of missing files never touch the file system.
+    Files with up to max_file_size bytes are kept in memory after they were requested until they need more than
+    max_bytes together (least recently used ones are removed first).
+    Call :meth:`refresh` after files were added or changed.
+
+    :param shares: list
+        List of (directory, url) tuples
+    :param max_bytes: int
+        Default = 16 MiB
+    :param max_file_size: int
+        Default = 256 KiB
+    :param scan: bool
+        Scans the directories at once, the index stays empty until refresh() or load() otherwise
+        Default = True
+    """
+
+    def __init__(self, shares, max_bytes=16 * 1024 * 1024, max_file_size=256 * 1024, scan=True):
+        # Longer urls are added last, so they win if the shares overlap
+        self.shares = sorted(((url.rstrip('/') + '/', directory) for directory, url in shares),
+                             key=lambda share: len(share[0]))
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.files = {}
+        self.stats = {}
+        self._hashes = {}
+        self._cache = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if scan:
+            self.refresh()
+
+    def refresh(self):
+        """
+        Scans the shared directories again and empties the cache
+        """
+        files = {}
+        stats = {}
+        for url, directory in self.shares:
+            for root, _, names in os.walk(directory, followlinks=True):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files[url + os.path.relpath(path, directory).replace(os.sep, '/')] = path
+                    stats[path] = IndexStat(stat.st_size, stat.st_mtime)
+        with self._lock:
+            self.files = files
+            self.stats = stats
+            self._hashes = {}
+            self._cache.clear()
+            self._size = 0
+
+    def dump(self):
+        """
+        Returns the index and the computed fingerprints for a snapshot
+        It contains only JSON types, the stats are [size, mtime] lists
+
+        :return: dict
+        """
+        with self._lock:
+            return {'shares': [list(share) for share in self.shares], 'files': dict(self.files),
+                    'stats': {path: list(stat) for path, stat in self.stats.items()}, 'hashes': dict(self._hashes)}
+
+    def load(self, data):
+        """
+        Replaces the index with the one of a snapshot (see :meth:`dump`)
+
+        :param data: dict
+        :return: bool
+            False if the snapshot was made for other shared directories
+        """
+        if data.get('shares') != [list(share) for share in self.shares]:
+            return False
+        try:
+            files = {str(url): str(path) for url, path in data['files'].items()}
+            stats = {str(path): IndexStat(int(stat[0]), float(stat[1])) for path, stat in data['stats'].items()}
+            hashes = {str(path): str(value) for path, value in data['hashes'].items()}
+        except (KeyError, TypeError, ValueError, IndexError, AttributeError):
+            return False
+        if set(files.values()) - set(stats):
+            return False
+        with self._lock:
+            self.files = files
+            self.stats = stats
+            self._hashes = hashes
+            self._cache.clear()
+            self._size = 0
+        return True
+
+    def resolve(self, path):
+        """
+        Returns the file of an url path and if the url is fingerprinted
+
+        :param path: str
+        :return: tuple
+            (file path or None, fingerprinted)
+        """
+        path = '/' + path.lstrip('/')
+        file_path = self.files.get(path)
+        if file_path is not None:
+            return file_path, False
+        m = _fingerprinted.match(path)
+        if m is not None:
+            file_path = self.files.get(m.group(1) + m.group(3))
+            if file_path is not None and self.fingerprint(file_path) == m.group(2):
+                return file_path, True
+        return None, False
+
+    def fingerprint(self, path):
+        """
+        Returns the first 8 hex digits of the SHA-256 hash of a file
+
+        :param path: str
+        :return: str
+        """
+        fingerprint = self._hashes.get(path)
+        if fingerprint is None:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    digest.update(chunk)
+            fingerprint = self._hashes[path] = digest.hexdigest()[:8]
+        return fingerprint
+
+    def url(self, name):
+        """
+        Returns the fingerprinted url of a shared file
+
+        :param name: str
+            Url of the file ('/shared/app.js') or its path in a shared directory ('app.js')
+        :return: str
+            Example: '/shared/app.3f9c1a2b.js'
+        :raises ValueError: If the file isn't in a shared directory
+        """
+        url = '/' + name.lstrip('/')
+        if url not in self.files:
+            for prefix, _ in reversed(self.shares):
+                if prefix + name.lstrip('/') in self.files:
+                    url = prefix + name.lstrip('/')
+                    break
+            else:
+                raise ValueError('File "{}" is not in a shared directory'.format(name))
+        directory, _, filename = url.rpartition('/')
+        stem, extension = os.path.splitext(filename)
+        if not stem:
+            stem, extension = extension, ''
+        return '{}/{}.{}{}'.format(directory, stem, self.fingerprint(self.files[url]), extension)
+
+    def variant(self, path, accept_encoding):
+        """
+        Returns the newest precompressed sibling of a file which the client accepts
+        Like :func:`swapy.compression.precompressed` but with the stats of the index
+
+        :param path: str
+        :param accept_encoding: str | None
+        :return: tuple
+            (path, encoding) where encoding is None for the file itself
+        """
+        if accept_encoding:
+            accept = parse_accept_header(accept_encoding)
+            for encoding in ('br', 'gzip'):
+                target = path + compression.extensions[encoding]
+                stat = self.stats.get(target)
+                if stat is not None and accept.quality(encoding) > 0 and \
+                        stat.st_mtime >= self.stats[path].st_mtime:
+                    return target, encoding
+        return path, None
+
+    def metadata(self, path):
+        """
+        Returns the metadata of an indexed file without a stat call
+
+        :param path: str
+        :return: FileMetadata
+        """
+        return FileMetadata(path, self.stats[path])
+
+    def get(self, key):
+        """
+        Returns a cached file
+
+        :param key: tuple
+        :return: HotFile | None
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """
+        Caches a file and removes the least recently used ones if the cache is too big
+
+        :param key: tuple
+        :param entry: HotFile
+        """
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._cache[key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes:
+                self._size -= self._cache.popitem(last=False)[1].size
+
+
+class StaticFiles:
+    """
+    WSGI middleware which serves the shared directories with conditional and range requests
+    Requests for other urls or missing files are passed to the application
+    Precompressed siblings (.br, .gz, see :func:`swapy.compression.precompress`) are sent if the client accepts them
+
+    Files are looked up in a :class:`StaticIndex`. Small files are sent from its memory cache, others from the disk.
+    Fingerprinted urls (see :func:`swapy.static_url`) are sent with a Cache-Control header for one year.
+    With watch the files are checked for changes and files which are not indexed are looked up on the disk.
+
+    :param app: function
+        WSGI application
+    :param shares: list | StaticIndex
+        List of (directory, url) tuples or the index of them
+    :param cache_control: str | int | None
+        Default = 43200 (12 hours)
+    :param watch: bool
+        Default = False
+    """
+
+    def __init__(self, app, shares, cache_control=43200, watch=False):
+        self.app = app
+        self.index = shares if isinstance(shares, StaticIndex) else StaticIndex(shares)
+        self.cache_control = cache_control
+        self.watch = watch
+
+    def find(self, path, fingerprinted=False):
+        """
+        Returns the absolute file path for the url path or None
+
+        :param path: str
+        :param fingerprinted: bool
+            Returns (file path, fingerprinted) if True
+        :return: str | tuple | None
+        """
+        result = self.index.resolve(path)
+        if result[0] is None and self.watch:
+            path = '/' + path.lstrip('/')
+            for url, directory in reversed(self.index.shares):
+                if path.startswith(url):
+                    file_path = safe_join(directory, path[len(url):])
+                    if file_path is not None and os.path.isfile(file_path):
+                        result = (file_path, False)
+                        break
+        return result if fingerprinted else result[0]
+
+    def __call__(self, environ, start_response):
+        path, fingerprinted = self.find(get_path_info(environ), True)
+        if path is None or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self.app(environ, start_response)
+        cache_control = immutable if fingerprinted else self.cache_control
+        try:
+            if self.watch or path not in self.index.stats:
+                compressed = compression.precompressed(path, environ.get('HTTP_ACCEPT_ENCODING'))
+                source, encoding = compressed if compressed is not None else (path, None)
+                entry = self.index.get((source, encoding))
+                meta = metadata(source)
+            else:
+                source, encoding = self.index.variant(path, environ.get('HTTP_ACCEPT_ENCODING'))
+                entry = self.index.get((source, encoding))
+                meta = entry.metadata if entry is not None else self.index.metadata(source)
+            if meta.size <= self.index.max_file_size and 'HTTP_RANGE' not in environ:
+                return self._send_cached(environ, start_response, path, (source, encoding), entry, meta,
+                                         cache_control)
+            if encoding is None:
+                res = send_file(source, cache_control=cache_control)
+            else:
+                res = send_file(source, mimetype=metadata(path).mimetype, cache_control=cache_control)
+                res.headers['Content-Encoding'] = encoding
+            if compression.compressible(res.headers['Content-Type']):
+                compression.add_vary(res.headers)
+            res = res.prepare(environ)
+        except FileNotFoundError:
+            return self.app(environ, start_response)
+        return to_wsgi(res)(environ, start_response)
+
+    def _send_cached(self, environ, start_response, path, key, entry, meta, cache_control):
+        """
+        Sends a small file from the memory cache of the index
+        The file is read into the cache if it isn't cached or changed
+        """
+        source, encoding = key
+        if entry is None or entry.metadata.etag != meta.etag:
+            with open(source, 'rb') as f:
+                body = f.read()
+            mimetype = meta.mimetype if encoding is None else mimetypes.guess_type(path)[0] or \
+                'application/octet-stream'
+            headers = {
+                'Content-Type': mimetype,
+                'Content-Length': str(len(body)),
+                'Accept-Ranges': 'bytes',
+                'Last-Modified': meta.last_modified,
+                'ETag': quote_etag(meta.etag)
+            }
+            if encoding is not None:
+                headers['Content-Encoding'] = encoding
+            if compression.compressible(mimetype):
+                compression.add_vary(headers)
+            entry = HotFile(body, list(headers.items()), meta)
+            self.index.set(key, entry)
+        headers = list(entry.headers)
+        if cache_control is not None:
+            headers.append(('Cache-Control', cache_control if isinstance(cache_control, str) else
+                            'public, max-age={}'.format(cache_control)))
+        if not is_resource_modified(environ, etag=meta.etag, last_modified=meta.modified):
+            start_response('304 NOT MODIFIED', [(key_, value) for key_, value in headers
+                                                if key_ not in ('Content-Type', 'Content-Length')])
+            return []
+        start_response('200 OK', headers)
+        return [] if environ['REQUEST_METHOD'] == 'HEAD' else [entry.body]
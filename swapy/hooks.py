@@ -0,0 +1,61 @@
+#: Functions of every hook in order of registration
+#:
+#: before_match(environ): Before the route of a request is matched
+#: after_match(environ, endpoint, args): After a route matched
+#: before_handler(req): Before the route function (with its middlewares) is called
+#: after_handler(req, response): After the route returned, response is the werkzeug response
+#: response_sent(req, response, duration): After the response was sent, duration in seconds since the request started
+#: exception(req, exception): If an exception was raised while the request was handled
+#: session(req, action, duration): After the session was opened ('open') or saved ('commit')
+#: template_rendered(name, duration): After a template was rendered by swapy.render
+#: worker_exit(): Before a worker process of the PreforkServer exits, atexit functions don't run in workers
+registry = {
+    'before_match': [],
+    'after_match': [],
+    'before_handler': [],
+    'after_handler': [],
+    'response_sent': [],
+    'exception': [],
+    'session': [],
+    'template_rendered': [],
+    'worker_exit': []
+}
+
+
+def register(name, f):
+    """
+    Adds a function to a hook
+
+    :param name: str
+    :param f: function
+    :return: function
+        Returns f
+    """
+    if name not in registry:
+        raise ValueError('Hook "{}" does not exist. Please use one of: {}'.format(name, ', '.join(sorted(registry))))
+    registry[name].append(f)
+    return f
+
+
+def remove(name, f):
+    """
+    Removes a function from a hook
+
+    :param name: str
+    :param f: function
+    """
+    if f in registry[name]:
+        registry[name].remove(f)
+
+
+def fire(name, *args):
+    """
+    Calls the functions of a hook
+    Callers check registry[name] before, so hooks without functions cost nothing
+
+    :param name: str
+    :param args: object
+        Arguments for the functions
+    """
+    for f in registry[name]:
+        f(*args)
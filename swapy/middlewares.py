@@ -1,6 +1,9 @@
 import json
+import types
+from functools import wraps
 from werkzeug.exceptions import HTTPException, abort
-from .wrappers import response_from
+from .wrappers import Request, response_from, adapt
+from . import compression, serializers, pools, streaming
 
 
 def json_exception(error):
@@ -37,16 +40,28 @@ def default_exception(error):
 def json_middleware(f):
     """
     Returns every output from an route which has the JSON middleware to a JSON string
-    
+    The output is indented in debug mode and compact otherwise.
+    It uses the JSON serializer of the module if the route receives the request.
+    Generators are streamed as newline delimited JSON, streamed responses are returned unchanged.
+
     :param f: function
         The route
     :return: function
     """
+    @wraps(f)
     def handle(*args, **kwargs):
         result = f(*args, **kwargs)
         response = response_from(result)
+        if isinstance(response, streaming.StreamResponse):
+            return response
+        if args and isinstance(args[0], Request):
+            serializer, pretty = args[0].serializer, args[0].state.debug
+        else:
+            serializer, pretty = serializers.default, False
+        if isinstance(response.content, types.GeneratorType):
+            return streaming.ndjson(response.content, response.code, response.headers, serializer=serializer)
         try:
-            response.content = json.dumps(response.content, indent=4)
+            response.content = serializer.dumps(response.content, pretty)
         except TypeError:
             return response
         response.headers['Content-Type'] = 'application/json'
@@ -61,6 +76,7 @@ def html_middleware(f):
     :param f: function
     :return: function
     """
+    @wraps(f)
     def handle(*args, **kwargs):
         result = f(*args, **kwargs)
         response = response_from(result)
@@ -72,12 +88,16 @@ def html_middleware(f):
 def cors_middleware(f):
     """
     Appends CORS headers to each response from a route
+    The returned function always receives the request
 
     :param f: function
     :return: function
     """
+    call = adapt(f)
+
+    @wraps(f)
     def handle(req):
-        result = f(req)
+        result = call(req)
         response = response_from(result)
         if req.method == 'OPTIONS':
             return '200 OK', 200, {'Content-Type': 'text/plain'}
@@ -99,6 +119,7 @@ def expect_keys_middleware(f):
     :param f: function
     :return: function
     """
+    @wraps(f)
     def handle(*args, **kwargs):
         try:
             result = f(*args, **kwargs)
@@ -109,6 +130,64 @@ def expect_keys_middleware(f):
     return handle
 
 
+def compression_middleware(f=None, min_size=500, level=6):
+    """
+    Compresses the responses of a route with brotli (if installed), gzip or deflate
+    The encoding is chosen by the Accept-Encoding header of the request
+
+    Strings and bytes are only compressed if they have at least min_size bytes.
+    Other iterables are compressed chunk by chunk while they are sent.
+    The returned function always receives the request.
+
+    Example:
+        use(CompressionMiddleware)
+        use(CompressionMiddleware(min_size=1024, level=9))
+
+    :param f: function
+    :param min_size: int
+        Default = 500
+    :param level: int
+        Compression level from 1 to 9
+        Default = 6
+    :return: function
+    """
+    if f is None:
+        return lambda target: compression_middleware(target, min_size, level)
+    call = adapt(f)
+
+    @wraps(f)
+    def handle(req):
+        response = response_from(call(req))
+        if hasattr(response, 'prepare'):
+            return response
+        return compression.compress_response(response, req.headers.get('Accept-Encoding'), min_size, level)
+    return handle
+
+
+def blocking_middleware(f=None, pool='blocking'):
+    """
+    Runs the routes in a thread pool with limited size, see :mod:`swapy.pools`
+    Requests are rejected with 503 and a Retry-After header if the pool is saturated.
+
+    Example:
+        use(BlockingMiddleware)
+        use(BlockingMiddleware(pool='reports'))
+
+    :param f: function
+    :param pool: str
+        Name of the pool
+        Default = 'blocking'
+    :return: function
+    """
+    if f is None:
+        return lambda target: blocking_middleware(target, pool)
+
+    @wraps(f)
+    def handle(*args, **kwargs):
+        return pools.get(pool).run(f, *args, **kwargs)
+    return handle
+
+
 # Aliases for the function in camel case
 JsonException = json_exception
 DefaultException = default_exception
@@ -116,3 +195,5 @@ JsonMiddleware = json_middleware
 HtmlMiddleware = html_middleware
 CorsMiddleware = cors_middleware
 ExpectKeysMiddleware = expect_keys_middleware
+CompressionMiddleware = compression_middleware
+BlockingMiddleware = blocking_middleware
@@ -0,0 +1,191 @@
+import threading
+import time
+
+from werkzeug.exceptions import ServiceUnavailable
+
+
+class Saturated(ServiceUnavailable):
+    """
+    503 error if a pool has no free place for a request
+    The client should retry after retry_after seconds
+    """
+
+    def __init__(self, pool, retry_after=1):
+        ServiceUnavailable.__init__(self, 'The pool "{}" is saturated. Please try again later.'.format(pool))
+        self.retry_after = retry_after
+
+    def get_headers(self, environ=None):
+        headers = ServiceUnavailable.get_headers(self, environ)
+        headers.append(('Retry-After', str(self.retry_after)))
+        return headers
+
+
+class Pool:
+    """
+    Thread pool for blocking routes
+
+    A pool runs max_workers calls at the same time and lets max_queue calls wait.
+    Further calls are rejected at once with :class:`Saturated` instead of holding a server thread.
+
+    In the WSGI app the server thread of a request waits until its call is done, so the pool bounds the
+    blocking work but doesn't free server threads. asgi_app() awaits the call (see :meth:`run_async`),
+    the event loop keeps serving other requests meanwhile.
+
+    :param name: str
+    :param max_workers: int
+        Default = 8
+    :param max_queue: int
+        Default = 64
+    :param retry_after: int
+        Seconds for the Retry-After header of rejected requests
+        Default = 1
+    """
+
+    def __init__(self, name, max_workers=8, max_queue=64, retry_after=1):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='swapy-{}'.format(name))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def run(self, f, *args, **kwargs):
+        """
+        Calls f in the pool and waits for its result
+        The calling thread is blocked while f waits in the queue and runs
+
+        :param f: function
+        :return: object
+            Result of f
+        :raises Saturated: If all workers are busy and the queue is full
+        """
+        return self._submit(f, args, kwargs).result()
+
+    async def run_async(self, f, *args, **kwargs):
+        """
+        Calls f in the pool and awaits its result, the event loop keeps running while f waits and runs
+
+        :param f: function
+        :return: object
+            Result of f
+        :raises Saturated: If all workers are busy and the queue is full
+        """
+        import asyncio
+        return await asyncio.wrap_future(self._submit(f, args, kwargs))
+
+    def _submit(self, f, args, kwargs):
+        """
+        Queues the call of f if the pool has a free place
+
+        :param f: function
+        :param args: tuple
+        :param kwargs: dict
+        :return: :class:`concurrent.futures.Future`
+        :raises Saturated: If all workers are busy and the queue is full
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise Saturated(self.name, self.retry_after)
+            self._pending += 1
+        queued = time.monotonic()
+
+        def task():
+            waited = time.monotonic() - queued
+            with self._lock:
+                self._running += 1
+                self._wait_total += waited
+                if waited > self._wait_max:
+                    self._wait_max = waited
+            try:
+                return f(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._pending -= 1
+
+        try:
+            return self._executor.submit(task)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    def stats(self):
+        """
+        Returns the current state of the pool
+
+        :return: dict
+            'queued' and 'running' calls, 'completed' and 'rejected' calls since the start,
+            'wait_avg' and 'wait_max' in seconds
+        """
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queued': self._pending - self._running,
+                'running': self._running,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'wait_avg': self._wait_total / self._completed if self._completed else 0.0,
+                'wait_max': self._wait_max
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
+
+
+pools = {}
+_lock = threading.Lock()
+
+
+def configure(name='blocking', max_workers=8, max_queue=64, retry_after=1):
+    """
+    Creates or replaces the pool with the given name
+
+    :param name: str
+    :param max_workers: int
+    :param max_queue: int
+    :param retry_after: int
+    :return: Pool
+    """
+    pool = Pool(name, max_workers, max_queue, retry_after)
+    with _lock:
+        old = pools.get(name)
+        pools[name] = pool
+    if old is not None:
+        old.shutdown(False)
+    return pool
+
+
+def get(name='blocking'):
+    """
+    Returns the pool with the given name, it is created with the default sizes if it doesn't exist
+
+    :param name: str
+    :return: Pool
+    """
+    pool = pools.get(name)
+    if pool is None:
+        with _lock:
+            pool = pools.get(name)
+            if pool is None:
+                pool = pools[name] = Pool(name)
+    return pool
+
+
+def stats():
+    """
+    Returns the stats of all pools by their name
+
+    :return: dict
+    """
+    return {name: pool.stats() for name, pool in list(pools.items())}
@@ -0,0 +1,307 @@
+import re
+
+from werkzeug.exceptions import NotFound, MethodNotAllowed
+from werkzeug.routing import parse_rule, ValidationError, PathConverter, BuildError
+from werkzeug.urls import url_encode
+
+
+class Node:
+    """
+    Node of the radix tree for one path segment
+
+    static: dict
+        Children for static segments by their text
+    dynamic: list
+        Children for segments with converters as (weight, regex, node, groups), sorted by weight
+    path: list
+        Rules whose last part is a path converter which consumes all remaining segments as (regex, node)
+    rules: list
+        Rules which end at this node as (rule, names)
+    """
+    __slots__ = ['static', 'dynamic', 'path', 'rules']
+
+    def __init__(self):
+        self.static = {}
+        self.dynamic = []
+        self.path = []
+        self.rules = []
+
+    def child(self, kind, key, weight=0):
+        """
+        Returns the child node for the given segment and creates it if it doesn't exist
+
+        :param kind: str
+            'static', 'dynamic' or 'path'
+        :param key: str
+            Text of a static segment or regex of a dynamic segment
+        :param weight: int
+            Weight of the converter, lower weights are matched first
+        :return: Node
+        """
+        if kind == 'static':
+            node = self.static.get(key)
+            if node is None:
+                node = self.static[key] = Node()
+            return node
+        children = self.dynamic if kind == 'dynamic' else self.path
+        for item in children:
+            if item[1].pattern == key:
+                return item[2]
+        node = Node()
+        regex = re.compile(key)
+        children.append((weight, regex, node, tuple(sorted(regex.groupindex, key=regex.groupindex.get))))
+        children.sort(key=lambda item: item[0])
+        return node
+
+
+class RadixRouter:
+    """
+    Matches urls with a radix tree of path segments which is compiled from a werkzeug Map
+
+    Static segments are looked up in a dict and win over dynamic segments.
+    Dynamic segments are tried in order of the converter weight like werkzeug does (int, float, default, path).
+    Matching costs O(length of the path) instead of a regex per rule.
+    Rules with a path converter inside a segment (e.g. '/file-<path:p>') are matched by werkzeug's regex.
+    Like all swapy rules trailing slashes are optional.
+
+    :param url_map: :class:`werkzeug.routing.Map`
+    """
+
+    def __init__(self, url_map):
+        self.root = Node()
+        self.fallback = []
+        for rule in url_map.iter_rules():
+            self.add(rule)
+
+    def add(self, rule):
+        """
+        Adds a werkzeug rule to the tree
+
+        :param rule: :class:`werkzeug.routing.Rule`
+        """
+        segments = _segments(rule)
+        if segments is None:
+            self.fallback.append(rule)
+            return
+        node = self.root
+        names = []
+        for segment in segments:
+            if len(segment) == 1 and segment[0][0] is None:
+                node = node.child('static', segment[0][1])
+                continue
+            converters = [rule._converters[part[1]] for part in segment if part[0] is not None]
+            names.extend(part[1] for part in segment if part[0] is not None)
+            if len(segment) == 1 and isinstance(converters[0], PathConverter):
+                node = node.child('path', converters[0].regex)
+                continue
+            regex = ''.join(re.escape(part[1]) if part[0] is None else '(?P<v{}>{})'.format(i, converter.regex)
+                            for i, (part, converter) in enumerate(_zip_converters(segment, converters)))
+            node = node.child('dynamic', regex, max(converter.weight for converter in converters))
+        node.rules.append((rule, tuple(names)))
+
+    def match(self, path, method):
+        """
+        Returns the endpoint and the converted url arguments for the path
+
+        :param path: str
+            The path of the request (PATH_INFO)
+        :param method: str
+            HTTP method
+        :return: tuple
+            (endpoint, args)
+        :raises NotFound: If no rule matches the path
+        :raises MethodNotAllowed: If rules match the path but not the method
+        """
+        method = method.upper()
+        path = '/' + path.lstrip('/')
+        allowed = set()
+        if len(path) > 1 and path.endswith('/'):
+            path = path[:-1]
+        if not path.endswith('/') or path == '/':
+            segments = path[1:].split('/') if path != '/' else []
+            for rules, values in _search(self.root, segments, 0, ()):
+                for rule, names in rules:
+                    args = _convert(rule, names, values)
+                    if args is None:
+                        continue
+                    if rule.methods is not None and method not in rule.methods:
+                        allowed.update(rule.methods)
+                        continue
+                    return rule.endpoint, args
+        for rule in self.fallback:
+            args = rule.match(u'|' + path, method)
+            if args is None:
+                continue
+            if rule.methods is not None and method not in rule.methods:
+                allowed.update(rule.methods)
+                continue
+            return rule.endpoint, args
+        if allowed:
+            raise MethodNotAllowed(valid_methods=list(allowed))
+        raise NotFound()
+
+
+class UrlBuilder:
+    """
+    Builds the urls of endpoints from templates which are compiled once from a werkzeug Map
+
+    A template is the list of the static parts and the converters of a rule, so building an url is
+    a dict lookup and a join. If an endpoint has several rules the first one is used.
+
+    :param url_map: :class:`werkzeug.routing.Map`
+    """
+
+    def __init__(self, url_map):
+        self.templates = {}
+        for rule in url_map.iter_rules():
+            if rule.endpoint not in self.templates:
+                self.templates[rule.endpoint] = _template(rule)
+
+    def build(self, endpoint, values):
+        """
+        Returns the url of an endpoint
+
+        :param endpoint: str
+        :param values: dict
+            Url arguments, values which are no arguments of the rule are appended as query string
+        :return: str
+        :raises BuildError: If the endpoint doesn't exist or an argument is missing
+        """
+        template = self.templates.get(endpoint)
+        if template is None:
+            raise BuildError(endpoint, values, None)
+        parts, names = template
+        url = []
+        try:
+            for part in parts:
+                if part.__class__ is str:
+                    url.append(part)
+                else:
+                    url.append(part[1].to_url(values[part[0]]))
+        except KeyError:
+            raise BuildError(endpoint, values, None)
+        url = ''.join(url) or '/'
+        query = {key: value for key, value in values.items() if key not in names and value is not None}
+        if query:
+            url = '{}?{}'.format(url, url_encode(query))
+        return url
+
+
+def _template(rule):
+    """
+    Returns the parts of a rule for :class:`UrlBuilder`
+
+    :param rule: :class:`werkzeug.routing.Rule`
+    :return: tuple
+        (parts, names) where parts are static strings or (name, converter)
+    """
+    parts = []
+    for converter, _, variable in parse_rule(rule.rule):
+        if converter is None:
+            if parts and parts[-1].__class__ is str:
+                parts[-1] += variable
+            else:
+                parts.append(variable)
+        else:
+            parts.append((variable, rule._converters[variable]))
+    return parts, frozenset(rule.arguments)
+
+
+def _segments(rule):
+    """
+    Splits a rule into its path segments
+    Every segment is a list of parts (converter, text) where converter is None for static text
+    and text is the variable name otherwise
+
+    :param rule: :class:`werkzeug.routing.Rule`
+    :return: list | None
+        None if the rule can't be stored in the tree
+    """
+    text = rule.rule if rule.is_leaf else rule.rule.rstrip('/')
+    if not text.startswith('/'):
+        return None
+    segments = [[]]
+    for converter, _, variable in parse_rule(text[1:]):
+        if converter is None:
+            parts = variable.split('/')
+            for i, part in enumerate(parts):
+                if i > 0:
+                    segments.append([])
+                if part:
+                    segments[-1].append((None, part))
+        else:
+            segments[-1].append((converter, variable))
+    if segments == [[]]:
+        return []
+    for i, segment in enumerate(segments):
+        if not segment:
+            return None
+        paths = [part for part in segment if part[0] is not None and isinstance(rule._converters[part[1]],
+                                                                                 PathConverter)]
+        if paths and (len(segment) > 1 or i != len(segments) - 1):
+            return None
+    return segments
+
+
+def _zip_converters(segment, converters):
+    """
+    Yields the parts of a segment together with their converter (None for static parts)
+    """
+    converters = iter(converters)
+    for part in segment:
+        yield part, None if part[0] is None else next(converters)
+
+
+def _search(node, segments, index, values):
+    """
+    Yields the rules of all nodes which match the remaining segments in order of priority
+
+    :param node: Node
+    :param segments: list
+    :param index: int
+        Index of the next segment
+    :param values: tuple
+        Raw values of the dynamic segments which are matched so far
+    """
+    if index == len(segments):
+        if node.rules:
+            yield node.rules, values
+        return
+    segment = segments[index]
+    child = node.static.get(segment)
+    if child is not None:
+        for result in _search(child, segments, index + 1, values):
+            yield result
+    for _, regex, child, groups in node.dynamic:
+        m = regex.fullmatch(segment)
+        if m is not None:
+            for result in _search(child, segments, index + 1, values + tuple(m.group(g) for g in groups)):
+                yield result
+    if node.path and segment:
+        value = '/'.join(segments[index:])
+        for _, regex, child, _ in node.path:
+            if child.rules and regex.fullmatch(value):
+                yield child.rules, values + (value,)
+
+
+def _convert(rule, names, values):
+    """
+    Converts the raw values with the converters of the rule
+
+    :param rule: :class:`werkzeug.routing.Rule`
+    :param names: tuple
+        Names of the variables
+    :param values: tuple
+        Raw values
+    :return: dict | None
+        None if a converter rejects a value
+    """
+    args = {}
+    try:
+        for name, value in zip(names, values):
+            args[name] = rule._converters[name].to_python(value)
+    except ValidationError:
+        return None
+    if rule.defaults:
+        args.update(rule.defaults)
+    return args
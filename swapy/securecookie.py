@@ -0,0 +1,248 @@
+import base64
+import hashlib
+import hmac
+import time
+
+from werkzeug.datastructures import CallbackDict
+
+from . import serializers
+
+#: Default secure cookie settings of a module, see :func:`swapy.secure_cookie`
+defaults = {
+    'cookie_name': 'session',
+    'serializer': 'json',
+    'max_age': None
+}
+
+
+class JsonPayload:
+    """
+    Compact JSON payloads, they are encoded with the fastest installed JSON serializer (see swapy.serializers)
+    """
+    name = 'json'
+
+    def __init__(self):
+        self._json = serializers.default
+
+    def dumps(self, obj):
+        data = self._json.dumps(obj)
+        return data.encode('utf-8') if isinstance(data, str) else data
+
+    def loads(self, data):
+        return self._json.loads(data)
+
+
+class MsgpackPayload(JsonPayload):
+    """
+    msgpack payloads, they are smaller than JSON and also keep bytes
+    """
+    name = 'msgpack'
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def dumps(self, obj):
+        return self._msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        return self._msgpack.unpackb(data, raw=False)
+
+
+payloads = {
+    'json': JsonPayload,
+    'msgpack': MsgpackPayload
+}
+
+_payloads = {}
+_signers = {}
+
+
+def payload(name='json'):
+    """
+    Returns the payload serializer with the given name, it is created once
+
+    :param name: str | JsonPayload
+        'json' or 'msgpack'
+        Default = 'json'
+    :return: JsonPayload
+    :raises ImportError: If msgpack is not installed
+    """
+    if isinstance(name, JsonPayload):
+        return name
+    serializer = _payloads.get(name)
+    if serializer is None:
+        if name not in payloads:
+            raise ValueError('Secure cookie serializer "{}" is not supported. Please use one of: {}'
+                             .format(name, ', '.join(sorted(payloads))))
+        serializer = _payloads[name] = payloads[name]()
+    return serializer
+
+
+class Signer:
+    """
+    Signs values with HMAC-SHA256
+
+    The HMAC objects of the keys are created once and copied for every value.
+    The first key signs, all keys verify. New keys are put in front and old ones are kept until their cookies expired.
+
+    :param secret_keys: str | bytes | list
+    """
+
+    def __init__(self, secret_keys):
+        if isinstance(secret_keys, (str, bytes)):
+            secret_keys = [secret_keys]
+        keys = [key.encode('utf-8') if isinstance(key, str) else key for key in secret_keys]
+        if not keys or not all(keys):
+            raise ValueError('Secret keys must not be empty')
+        self._macs = [hmac.new(key, digestmod=hashlib.sha256) for key in keys]
+
+    def _signature(self, mac, value):
+        mac = mac.copy()
+        mac.update(value)
+        return base64.urlsafe_b64encode(mac.digest())
+
+    def sign(self, value):
+        """
+        Returns the value with its signature
+
+        :param value: bytes
+        :return: bytes
+            value.signature
+        """
+        return value + b'.' + self._signature(self._macs[0], value)
+
+    def unsign(self, signed):
+        """
+        Returns the value if it was signed with one of the keys
+
+        :param signed: bytes
+        :return: bytes | None
+            None if the signature is missing or wrong
+        """
+        value, _, signature = signed.rpartition(b'.')
+        if not value:
+            return None
+        for mac in self._macs:
+            if hmac.compare_digest(signature, self._signature(mac, value)):
+                return value
+        return None
+
+
+def signer(secret_keys):
+    """
+    Returns the signer of the given keys, it is created once per keys
+
+    :param secret_keys: str | bytes | list
+    :return: Signer
+    """
+    cache_key = tuple(secret_keys) if isinstance(secret_keys, list) else secret_keys
+    signer_ = _signers.get(cache_key)
+    if signer_ is None:
+        signer_ = _signers[cache_key] = Signer(secret_keys)
+    return signer_
+
+
+def dumps(data, signer_, serializer='json'):
+    """
+    Returns the signed cookie value of the data
+    The value is base64(serialized [created, data]).base64(signature)
+
+    :param data: object
+    :param signer_: Signer
+    :param serializer: str | JsonPayload
+    :return: str
+    """
+    value = base64.urlsafe_b64encode(payload(serializer).dumps([int(time.time()), data]))
+    return signer_.sign(value).decode('ascii')
+
+
+def loads(value, signer_, serializer='json', max_age=None):
+    """
+    Returns the data of a signed cookie value
+
+    :param value: str
+    :param signer_: Signer
+    :param serializer: str | JsonPayload
+    :param max_age: int | None
+        Seconds after which a value is not accepted anymore
+    :return: object
+        None if the value is invalid or expired
+    """
+    try:
+        value = signer_.unsign(value.encode('ascii'))
+        if value is None:
+            return None
+        created, data = payload(serializer).loads(base64.urlsafe_b64decode(value))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    if max_age is not None and created + max_age < time.time():
+        return None
+    return data
+
+
+class SecureCookie(CallbackDict):
+    """
+    Dict which is stored signed in a cookie
+    The client can read the values but can't change them without the secret key.
+
+    :param data: dict | None
+    :param signer_: Signer
+    :param settings: dict
+        Secure cookie settings of the module, see :data:`defaults`
+    :param new: bool
+        True if the request had no valid cookie
+    """
+
+    def __init__(self, data=None, signer_=None, settings=None, new=True):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, data, on_update)
+        self.signer = signer_
+        self.settings = settings or defaults
+        self.new = new
+        self.modified = False
+
+    @property
+    def should_save(self):
+        """
+        True if the cookie was modified
+        """
+        return self.modified
+
+    def serialize(self):
+        """
+        Returns the signed cookie value
+
+        :return: str
+        """
+        return dumps(dict(self), self.signer, self.settings['serializer'])
+
+    @classmethod
+    def load_cookie(cls, request, signer_, settings=None):
+        """
+        Returns the secure cookie of the request or a new one if it is missing or invalid
+
+        :param request: :class:`swapy.wrappers.Request`
+        :param signer_: Signer
+        :param settings: dict | None
+        :return: SecureCookie
+        """
+        settings = settings or defaults
+        value = request.cookies.get(settings['cookie_name'])
+        if value:
+            data = loads(value, signer_, settings['serializer'], settings['max_age'])
+            if isinstance(data, dict):
+                return cls(data, signer_, settings, False)
+        return cls(None, signer_, settings)
+
+    def save_cookie(self, response, **options):
+        """
+        Sets the cookie in the response
+
+        :param response: :class:`werkzeug.wrappers.Response`
+        :param options: object
+            Arguments for response.set_cookie like path, secure or httponly
+        """
+        options.setdefault('max_age', self.settings['max_age'])
+        response.set_cookie(self.settings['cookie_name'], self.serialize(), **options)
@@ -0,0 +1,123 @@
+import json
+
+
+class JsonSerializer:
+    """
+    JSON encoder and decoder of the standard library
+
+    dumps raises TypeError for objects which can't be serialized and loads raises ValueError for invalid JSON.
+    """
+    name = 'json'
+
+    def dumps(self, obj, pretty=False):
+        """
+        Returns the JSON representation of obj
+
+        :param obj: object
+        :param pretty: bool
+            Indents the output
+        :return: str | bytes
+        """
+        if pretty:
+            return json.dumps(obj, indent=4)
+        return json.dumps(obj, separators=(',', ':'))
+
+    def loads(self, data):
+        """
+        Returns the object of a JSON document
+
+        :param data: str | bytes
+        :return: object
+        """
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonSerializer(JsonSerializer):
+    """
+    JSON encoder and decoder of orjson
+    dumps returns bytes and the same JSON as the standard library for ASCII strings.
+    Indented output and objects which orjson doesn't support (like ints with more than 64 bits) are encoded
+    with the standard library.
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def dumps(self, obj, pretty=False):
+        if not pretty:
+            try:
+                return self._orjson.dumps(obj, option=self._orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                pass
+        return JsonSerializer.dumps(self, obj, pretty)
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+
+class UjsonSerializer(JsonSerializer):
+    """
+    JSON encoder and decoder of ujson
+    Indented output and objects which ujson doesn't support are encoded with the standard library.
+    """
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def dumps(self, obj, pretty=False):
+        if not pretty:
+            try:
+                return self._ujson.dumps(obj, escape_forward_slashes=False)
+            except (OverflowError, ValueError, TypeError):
+                pass
+        return JsonSerializer.dumps(self, obj, pretty)
+
+    def loads(self, data):
+        return self._ujson.loads(data)
+
+
+serializers = {
+    'json': JsonSerializer,
+    'orjson': OrjsonSerializer,
+    'ujson': UjsonSerializer
+}
+
+
+def get(name='auto'):
+    """
+    Returns a JSON serializer
+
+    :param name: str | JsonSerializer
+        'json', 'orjson', 'ujson' or 'auto' for the fastest installed one (orjson, ujson, json)
+        Default = 'auto'
+    :return: JsonSerializer
+    :raises ImportError: If the module of the serializer is not installed
+    """
+    if isinstance(name, JsonSerializer):
+        return name
+    if name == 'auto':
+        for candidate in ('orjson', 'ujson'):
+            try:
+                return serializers[candidate]()
+            except ImportError:
+                pass
+        return JsonSerializer()
+    if name not in serializers:
+        raise ValueError('JSON serializer "{}" is not supported. Please use one of: auto, {}'
+                         .format(name, ', '.join(sorted(serializers))))
+    return serializers[name]()
+
+
+def __getattr__(name):
+    # default (the serializer which is used if a module doesn't set one) is chosen at the first use,
+    # so orjson or ujson are not imported with swapy
+    if name == 'default':
+        serializer = globals()['default'] = get()
+        return serializer
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,1083 @@
+import errno
+import logging
+import os
+import queue
+import select
+import selectors
+import signal
+import socket
+import ssl
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from email.utils import formatdate
+from urllib.parse import unquote_to_bytes
+
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge
+from werkzeug.http import HTTP_STATUS_CODES
+from werkzeug.serving import WSGIRequestHandler, BaseWSGIServer
+
+from . import hooks
+
+logger = logging.getLogger('swapy')
+
+
+class RequestHandler(WSGIRequestHandler):
+    """
+    Request handler for werkzeug's server which run() uses
+
+    It puts the connection as 'swapy.socket' into the environment, so file responses can use os.sendfile.
+    SSL connections are excluded because sendfile would bypass the encryption.
+    """
+
+    def make_environ(self):
+        environ = WSGIRequestHandler.make_environ(self)
+        if hasattr(os, 'sendfile') and not isinstance(self.connection, ssl.SSLSocket):
+            environ['swapy.socket'] = self.connection
+        return environ
+
+
+class WorkerServer(BaseWSGIServer):
+    """
+    werkzeug's single threaded server on a listening socket of the PreforkServer
+    It counts the handled requests.
+    """
+
+    def __init__(self, *args, **kwargs):
+        BaseWSGIServer.__init__(self, *args, **kwargs)
+        self.handled = 0
+
+    def process_request(self, request, client_address):
+        self.handled += 1
+        BaseWSGIServer.process_request(self, request, client_address)
+
+
+class Worker:
+    """
+    A worker process of the PreforkServer
+
+    The worker touches its heartbeat file at least every second while it waits for requests.
+    The master kills workers which don't do it for timeout seconds.
+
+    :param generation: int
+        Workers of an older generation are stopped at a graceful restart
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.pid = None
+        self._heartbeat = tempfile.TemporaryFile()
+        self.notify()
+
+    def notify(self):
+        """
+        Updates the heartbeat
+        """
+        os.utime(self._heartbeat.fileno())
+
+    def last_heartbeat(self):
+        """
+        Returns the time of the last heartbeat
+
+        :return: float
+        """
+        return os.fstat(self._heartbeat.fileno()).st_mtime
+
+    def close(self):
+        self._heartbeat.close()
+
+
+class PreforkServer:
+    """
+    Production server which forks worker processes that serve the same WSGI app
+
+    Every worker handles one request at a time, the app should be built before run() so the workers share it.
+    All workers accept from one inherited socket, so no queued connection is lost if a worker exits.
+    With SO_REUSEPORT a new server can bind the port while the old one still drains.
+
+    Signals of the master process:
+        SIGHUP: Starts new workers and stops the old ones after their current request
+        SIGTERM, SIGINT: Stops the workers after their current request and exits
+
+    :param app: callable
+        WSGI app
+    :param host: str
+    :param port: int
+    :param workers: int | None
+        Default = None (number of CPUs)
+    :param max_requests: int
+        Workers are replaced after this number of requests, 0 disables it
+        Default = 0
+    :param timeout: int | float
+        Seconds after which a silent worker is killed
+        Default = 30
+    :param reuse_port: bool
+        Sets SO_REUSEPORT on the socket if the platform supports it
+        Default = True
+    :param ssl_context: object
+        Like ssl_context of werkzeug's run_simple
+        Default = None
+    :param backlog: int
+        Default = 2048
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=5000, workers=None, max_requests=0, timeout=30,
+                 reuse_port=True, ssl_context=None, backlog=2048):
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('The pre-fork server needs os.fork which is not available on this platform')
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.reuse_port = reuse_port and hasattr(socket, 'SO_REUSEPORT')
+        self.ssl_context = ssl_context
+        self.backlog = backlog
+        self.socket = None
+        self.pid = None
+        self._children = {}
+        self._generation = 0
+        self._signals = []
+        self._alive = True
+
+    def _socket(self):
+        """
+        Returns a new listening socket which is bound to host and port
+
+        :return: :class:`socket.socket`
+        """
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        # Workers must not block in accept if another worker got the connection
+        sock.setblocking(False)
+        return sock
+
+    def run(self):
+        """
+        Starts the workers and supervises them until the server is stopped
+        """
+        self.pid = os.getpid()
+        self.socket = self._socket()
+        self.port = self.socket.getsockname()[1]
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._signal)
+        logger.info('Serving on %s:%s with %s workers', self.host, self.port, self.workers)
+        try:
+            while self._alive:
+                self._handle_signals()
+                self._reap()
+                self._kill_timed_out()
+                if self._alive:
+                    self._spawn()
+                time.sleep(0.5)
+        finally:
+            self._stop()
+            self.socket.close()
+
+    def _signal(self, sig, frame):
+        self._signals.append(sig)
+
+    def _handle_signals(self):
+        while self._signals:
+            sig = self._signals.pop(0)
+            if sig == signal.SIGHUP:
+                logger.info('Restarting workers')
+                self._generation += 1
+                self._spawn()
+                for worker in list(self._children.values()):
+                    if worker.generation < self._generation:
+                        self._kill(worker, signal.SIGTERM)
+            else:
+                self._alive = False
+
+    def _spawn(self):
+        """
+        Starts workers until there are enough of the current generation
+        """
+        current = [worker for worker in self._children.values() if worker.generation == self._generation]
+        for _ in range(self.workers - len(current)):
+            worker = Worker(self._generation)
+            pid = os.fork()
+            if pid == 0:
+                self._run_worker(worker)
+            worker.pid = pid
+            self._children[pid] = worker
+
+    def _reap(self):
+        """
+        Removes the exited workers
+        """
+        while self._children:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self._children.pop(pid, None)
+            if worker is not None:
+                worker.close()
+
+    def _kill_timed_out(self):
+        now = time.time()
+        for worker in list(self._children.values()):
+            if now - worker.last_heartbeat() > self.timeout:
+                logger.warning('Worker %s timed out', worker.pid)
+                self._kill(worker, signal.SIGKILL)
+
+    def _kill(self, worker, sig):
+        try:
+            os.kill(worker.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _stop(self, graceful_timeout=None):
+        """
+        Stops all workers, they are killed if they don't exit in time
+
+        :param graceful_timeout: int | float | None
+            Default = None (timeout)
+        """
+        if graceful_timeout is None:
+            graceful_timeout = self.timeout
+        for worker in list(self._children.values()):
+            self._kill(worker, signal.SIGTERM)
+        deadline = time.time() + graceful_timeout
+        while self._children and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for worker in list(self._children.values()):
+            self._kill(worker, signal.SIGKILL)
+        while self._children:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            worker = self._children.pop(pid, None)
+            if worker is not None:
+                worker.close()
+
+    def _run_worker(self, worker):
+        """
+        Serves requests in the forked process until it is stopped, it never returns
+
+        :param worker: Worker
+        """
+        code = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, self._stop_worker)
+            for other in self._children.values():
+                other.close()
+            server = WorkerServer(self.host, self.port, self.app, RequestHandler, ssl_context=self.ssl_context,
+                                  fd=self.socket.fileno())
+            server.timeout = min(1.0, self.timeout / 2.0)
+            while self._alive and os.getppid() == self.pid:
+                worker.notify()
+                server.handle_request()
+                if self.max_requests and server.handled >= self.max_requests:
+                    break
+            server.server_close()
+        except BaseException:
+            logger.exception('Worker %s failed', os.getpid())
+            code = 1
+        finally:
+            try:
+                hooks.fire('worker_exit')
+            except BaseException:
+                logger.exception('Worker %s failed to exit', os.getpid())
+                code = 1
+            os._exit(code)
+
+    def _stop_worker(self, sig, frame):
+        self._alive = False
+
+
+class _HTTPError(Exception):
+    """
+    Error in a request which is answered before the app is called, the connection is closed after it
+    """
+
+    def __init__(self, code):
+        Exception.__init__(self, code)
+        self.code = code
+
+
+class _Connection:
+    """
+    Client connection of the HTTPServer with the bytes which were received but not read yet
+    """
+    __slots__ = ['sock', 'address', 'buffer', 'last', 'secure']
+
+    def __init__(self, sock, address, secure):
+        self.sock = sock
+        self.address = address
+        self.buffer = bytearray()
+        self.last = time.monotonic()
+        self.secure = secure
+
+    def receive(self):
+        """
+        Receives the next bytes into the buffer
+
+        :return: bool
+            False if the client closed the connection
+        """
+        data = self.sock.recv(65536)
+        if not data:
+            return False
+        self.buffer += data
+        return True
+
+    def pending(self):
+        """
+        Returns True if there are bytes of the next request which were already received
+        """
+        return bool(self.buffer) or (self.secure and self.sock.pending() > 0)
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class _Body:
+    """
+    wsgi.input of the HTTPServer, reads the body of one request with Content-Length or chunked transfer encoding
+
+    :param connection: _Connection
+    :param length: int | None
+        None for chunked bodies
+    :param limit: int | None
+        Maximum size of chunked bodies
+    :param expect_continue: bool
+        Sends '100 Continue' at the first read
+    """
+
+    def __init__(self, connection, length, limit, expect_continue):
+        self.connection = connection
+        self.remaining = length
+        self.limit = limit
+        self.chunked = length is None
+        self.expect_continue = expect_continue
+        self.received = 0
+        self.done = length == 0
+        self._chunk = 0
+
+    def _available(self):
+        """
+        Returns the number of body bytes in the buffer, bytes are received if it is empty
+        0 means the end of the body
+
+        :raises BadRequest: If the client closed the connection before the body was sent
+        """
+        if self.done:
+            return 0
+        if self.expect_continue:
+            self.expect_continue = False
+            self.connection.sock.sendall(b'HTTP/1.1 100 Continue\r\n\r\n')
+        if self.chunked and not self._chunk:
+            self._next_chunk()
+            if self.done:
+                return 0
+        buffer = self.connection.buffer
+        if not buffer and not self.connection.receive():
+            raise BadRequest('Incomplete request body')
+        return min(len(buffer), self._chunk if self.chunked else self.remaining)
+
+    def _consume(self, size):
+        buffer = self.connection.buffer
+        data = bytes(buffer[:size])
+        del buffer[:size]
+        if self.chunked:
+            self._chunk -= size
+        else:
+            self.remaining -= size
+            self.done = self.remaining == 0
+        self.received += size
+        return data
+
+    def _line(self):
+        """
+        Returns the next line of the chunked encoding without the line break
+        """
+        buffer = self.connection.buffer
+        while True:
+            end = buffer.find(b'\r\n')
+            if end >= 0:
+                line = bytes(buffer[:end])
+                del buffer[:end + 2]
+                return line
+            if len(buffer) > 4096:
+                raise BadRequest('Invalid chunked encoding')
+            if not self.connection.receive():
+                raise BadRequest('Incomplete request body')
+
+    def _next_chunk(self):
+        """
+        Reads the size of the next chunk, the body is done after the last one
+        """
+        if self.received and self._line():
+            raise BadRequest('Invalid chunked encoding')
+        try:
+            self._chunk = int(self._line().split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            raise BadRequest('Invalid chunk size')
+        if self._chunk < 0:
+            raise BadRequest('Invalid chunk size')
+        if self._chunk == 0:
+            # Trailers are skipped
+            while self._line():
+                pass
+            self.done = True
+        elif self.limit is not None and self.received + self._chunk > self.limit:
+            raise RequestEntityTooLarge()
+
+    def read(self, size=-1):
+        """
+        :param size: int
+            Default = -1 (the whole body)
+        :return: bytes
+        """
+        if size is not None and size < 0:
+            size = None
+        parts = []
+        while size is None or size > 0:
+            available = self._available()
+            if not available:
+                break
+            data = self._consume(available if size is None else min(size, available))
+            parts.append(data)
+            if size is not None:
+                size -= len(data)
+        return b''.join(parts)
+
+    def readline(self, size=-1):
+        """
+        :param size: int
+            Default = -1 (no limit)
+        :return: bytes
+        """
+        if size is not None and size < 0:
+            size = None
+        parts = []
+        while size is None or size > 0:
+            available = self._available()
+            if not available:
+                break
+            if size is not None:
+                available = min(size, available)
+            end = self.connection.buffer.find(b'\n', 0, available)
+            data = self._consume(end + 1 if end >= 0 else available)
+            parts.append(data)
+            if end >= 0:
+                break
+            if size is not None:
+                size -= len(data)
+        return b''.join(parts)
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def drain(self, limit):
+        """
+        Reads the rest of the body, so the next request on the connection can be read
+
+        :param limit: int
+            Maximum number of bytes which are read
+        :return: bool
+            False if the rest is too large or the client didn't get '100 Continue' yet
+        """
+        if self.done:
+            return True
+        if self.expect_continue:
+            return False
+        if not self.chunked and self.remaining > limit:
+            return False
+        try:
+            while limit > 0:
+                available = self._available()
+                if not available:
+                    return True
+                limit -= len(self._consume(min(limit, available)))
+        except HTTPException:
+            return False
+        return self.done
+
+
+#: Seconds which a worker waits for the next request of a connection before it is given back to the selector
+_linger = 0.002
+
+#: Unread request bodies up to this size are read after the response, larger ones close the connection
+_drain_limit = 256 * 1024
+
+_dates = [0, '']
+
+
+def _date():
+    """
+    Returns the value of the Date header which is formatted once per second
+    """
+    now = int(time.time())
+    if now != _dates[0]:
+        _dates[:] = [now, formatdate(now, usegmt=True)]
+    return _dates[1]
+
+
+class HTTPServer:
+    """
+    Multi-threaded HTTP/1.1 server for any WSGI app
+
+    Connections are kept alive between requests. Idle connections wait in a selector of the main thread,
+    so they don't block a worker thread. A connection is handed to one of the worker threads when its next request
+    arrives. Pipelined requests are answered in order by the same thread.
+    New connections are only accepted while at most `threads` connections wait for a free worker,
+    the others wait in the listen backlog of the kernel.
+
+    Responses without Content-Length are sent with chunked transfer encoding to HTTP/1.1 clients.
+    The server puts the connection as 'swapy.socket' into the environment, so file responses can use os.sendfile.
+
+    Signals (only if run() is called in the main thread):
+        SIGTERM, SIGINT: Stops accepting, closes the idle connections and waits up to graceful_timeout
+            seconds for the running requests
+
+    :param app: callable
+        WSGI app
+    :param host: str
+    :param port: int
+    :param threads: int
+        Number of worker threads
+        Default = 16
+    :param backlog: int
+        Size of the listen backlog
+        Default = 2048
+    :param keep_alive_timeout: int | float
+        Seconds after which an idle connection is closed, 0 disables keep-alive
+        Default = 5
+    :param timeout: int | float
+        Seconds which a worker waits for the client while it reads the request or sends the response
+        Default = 30
+    :param max_header_size: int
+        Requests with more bytes in the request line and headers are rejected with 431
+        Default = 64 KiB
+    :param max_body_size: int | None
+        Requests with larger bodies are rejected with 413
+        Default = None (no limit, see swapy.uploads for limits per module)
+    :param tcp_nodelay: bool
+        Disables Nagle's algorithm, so small responses are sent without delay
+        Default = True
+    :param reuse_port: bool
+        Sets SO_REUSEPORT on the listening socket if the platform supports it
+        Default = False
+    :param socket_options: list | None
+        (level, option, value) tuples which are set on every client connection
+        Example: [(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024 * 1024)]
+        Default = None
+    :param ssl_context: :class:`ssl.SSLContext` | tuple | None
+        SSL context or (certificate file, key file) like ssl() returns
+        Default = None
+    :param graceful_timeout: int | float
+        Default = 30
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=5000, threads=16, backlog=2048, keep_alive_timeout=5,
+                 timeout=30, max_header_size=64 * 1024, max_body_size=None, tcp_nodelay=True, reuse_port=False,
+                 socket_options=None, ssl_context=None, graceful_timeout=30):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.backlog = backlog
+        self.keep_alive_timeout = keep_alive_timeout
+        self.timeout = timeout
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.tcp_nodelay = tcp_nodelay
+        self.reuse_port = reuse_port and hasattr(socket, 'SO_REUSEPORT')
+        self.socket_options = list(socket_options or ())
+        if isinstance(ssl_context, tuple):
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*ssl_context)
+            ssl_context = context
+        elif ssl_context is not None and not isinstance(ssl_context, ssl.SSLContext):
+            raise ValueError('ssl_context must be an SSLContext or a (certificate, key) tuple')
+        self.ssl_context = ssl_context
+        self.graceful_timeout = graceful_timeout
+        self.socket = None
+        self._selector = None
+        self._queue = queue.Queue()
+        self._workers = []
+        self._returned = deque()
+        self._idle = {}
+        self._stopping = False
+        self._wake_read, self._wake_write = socket.socketpair()
+        self._wake_write.setblocking(False)
+
+    def bind(self):
+        """
+        Binds the listening socket, port 0 chooses a free port which is set as port
+
+        :return: :class:`socket.socket`
+        """
+        if self.socket is None:
+            family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self.host, self.port))
+            sock.listen(self.backlog)
+            sock.setblocking(False)
+            self.socket = sock
+            self.port = sock.getsockname()[1]
+        return self.socket
+
+    def run(self):
+        """
+        Serves until SIGTERM or SIGINT
+        """
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, lambda sig, frame: self.shutdown())
+        self.bind()
+        logger.info('Serving on %s:%s with %s threads', self.host, self.port, self.threads)
+        self.serve_forever()
+
+    def shutdown(self):
+        """
+        Stops the server gracefully, it can be called from any thread and signal handlers
+        """
+        self._stopping = True
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_write.send(b'\0')
+        except OSError:
+            pass
+
+    def serve_forever(self):
+        """
+        Accepts connections and hands their requests to the workers until shutdown() is called
+        """
+        self.bind()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._wake_read, selectors.EVENT_READ)
+        self._selector.register(self.socket, selectors.EVENT_READ)
+        accepting = True
+        for i in range(self.threads):
+            worker = threading.Thread(target=self._work, name='swapy-http-{}'.format(i), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        last_sweep = time.monotonic()
+        try:
+            while not self._stopping:
+                for key, _ in self._selector.select(0.5):
+                    if key.fileobj is self.socket:
+                        self._accept()
+                    elif key.fileobj is self._wake_read:
+                        try:
+                            self._wake_read.recv(4096)
+                        except OSError:
+                            pass
+                    else:
+                        self._dispatch(key.data)
+                self._park_returned()
+                # Backpressure: connections wait in the backlog while all workers are busy
+                waiting = self._queue.qsize() >= self.threads
+                if accepting and waiting:
+                    self._selector.unregister(self.socket)
+                    accepting = False
+                elif not accepting and not waiting:
+                    self._selector.register(self.socket, selectors.EVENT_READ)
+                    accepting = True
+                now = time.monotonic()
+                if now - last_sweep >= 0.5:
+                    last_sweep = now
+                    self._close_idle(now - self.keep_alive_timeout)
+        finally:
+            self._drain()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self.socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.warning('Accept failed: %s', e)
+                return
+            try:
+                if self.tcp_nodelay and sock.family in (socket.AF_INET, socket.AF_INET6):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                for level, option, value in self.socket_options:
+                    sock.setsockopt(level, option, value)
+                sock.setblocking(False)
+                if self.ssl_context is not None:
+                    # The handshake is done by the worker at the first read
+                    sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+            except OSError:
+                sock.close()
+                continue
+            self._park(_Connection(sock, address, self.ssl_context is not None))
+
+    def _park(self, connection):
+        """
+        Waits in the selector for the next request of the connection
+        """
+        connection.last = time.monotonic()
+        try:
+            self._selector.register(connection.sock, selectors.EVENT_READ, connection)
+        except (ValueError, OSError):
+            connection.close()
+            return
+        self._idle[connection.sock] = connection
+
+    def _park_returned(self):
+        while self._returned:
+            connection = self._returned.popleft()
+            if self._stopping:
+                connection.close()
+            else:
+                self._park(connection)
+
+    def _dispatch(self, connection):
+        self._selector.unregister(connection.sock)
+        del self._idle[connection.sock]
+        self._queue.put(connection)
+
+    def _close_idle(self, before):
+        for connection in [c for c in self._idle.values() if c.last < before]:
+            self._selector.unregister(connection.sock)
+            del self._idle[connection.sock]
+            connection.close()
+
+    def _drain(self):
+        """
+        Closes the listening socket and the idle connections and waits for the running requests
+        """
+        self._stopping = True
+        self._selector.close()
+        self.socket.close()
+        for connection in self._idle.values():
+            connection.close()
+        self._idle.clear()
+        for _ in self._workers:
+            self._queue.put(None)
+        deadline = time.monotonic() + self.graceful_timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        if any(worker.is_alive() for worker in self._workers):
+            logger.warning('Stopped with running requests after %s seconds', self.graceful_timeout)
+        self._workers = []
+        while self._returned:
+            self._returned.popleft().close()
+        self._wake_read.close()
+        self._wake_write.close()
+
+    def _work(self):
+        while True:
+            connection = self._queue.get()
+            if connection is None:
+                return
+            try:
+                keep_alive = self._serve(connection)
+            except Exception:
+                logger.exception('Connection from %s failed', connection.address[0])
+                keep_alive = False
+            if keep_alive and not self._stopping:
+                self._returned.append(connection)
+                self._wake()
+            else:
+                connection.close()
+
+    def _serve(self, connection):
+        """
+        Answers the requests of a connection until no more are received
+
+        :param connection: _Connection
+        :return: bool
+            True if the connection is kept alive
+        """
+        connection.sock.settimeout(self.timeout)
+        try:
+            while True:
+                if not self._handle(connection):
+                    return False
+                if self._stopping:
+                    return True
+                if not connection.pending() and not self._linger(connection):
+                    return True
+        except (socket.timeout, ConnectionError, ssl.SSLError):
+            return False
+        except OSError as e:
+            if e.errno in (errno.EBADF, errno.ENOTCONN):
+                return False
+            raise
+
+    def _linger(self, connection):
+        """
+        Waits a moment for the next request of the connection if no other connection waits for a worker
+        Clients which send their requests one after another get them answered without the way through the selector.
+
+        :param connection: _Connection
+        :return: bool
+            True if the next request arrived
+        """
+        if not hasattr(select, 'poll') or not self._queue.empty():
+            return False
+        poll = select.poll()
+        poll.register(connection.sock, select.POLLIN)
+        return bool(poll.poll(_linger * 1000))
+
+    def _read_head(self, connection):
+        """
+        Returns the request line and the headers of the next request
+
+        :param connection: _Connection
+        :return: bytes | None
+            None if the client closed the connection
+        :raises _HTTPError: If the head is too large
+        """
+        buffer = connection.buffer
+        start = 0
+        while True:
+            # Empty lines before the request line are ignored
+            while buffer[:2] == b'\r\n':
+                del buffer[:2]
+            end = buffer.find(b'\r\n\r\n', start)
+            if end >= 0:
+                if end > self.max_header_size:
+                    raise _HTTPError(431)
+                head = bytes(buffer[:end])
+                del buffer[:end + 4]
+                return head
+            if len(buffer) > self.max_header_size:
+                raise _HTTPError(431)
+            start = max(0, len(buffer) - 3)
+            if not connection.receive():
+                if buffer:
+                    raise _HTTPError(400)
+                return None
+
+    def _environ(self, connection, head):
+        """
+        Returns the WSGI environment and the body of a request
+
+        :param connection: _Connection
+        :param head: bytes
+        :return: tuple
+            (environ, body, keep_alive)
+        :raises _HTTPError: If the request is invalid
+        """
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3 or not parts[0] or not parts[1]:
+            raise _HTTPError(400)
+        method, target, protocol = parts
+        if protocol not in ('HTTP/1.1', 'HTTP/1.0'):
+            raise _HTTPError(505 if protocol.startswith('HTTP/') else 400)
+        if target.startswith(('http://', 'https://')):
+            target = '/' + target.split('://', 1)[1].partition('/')[2]
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'REQUEST_URI': target,
+            'RAW_URI': target,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': protocol,
+            'REMOTE_ADDR': connection.address[0] if connection.address else '',
+            'REMOTE_PORT': str(connection.address[1]) if connection.address else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'https' if connection.secure else 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for line in lines[1:]:
+            name, colon, value = line.partition(':')
+            if not colon or not name or name != name.strip() or ' ' in name:
+                raise _HTTPError(400)
+            # Underscores could spoof other headers in the environment
+            if '_' in name:
+                continue
+            key = name.upper().replace('-', '_')
+            value = value.strip(' \t')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                if key in environ and environ[key] != value:
+                    raise _HTTPError(400)
+            else:
+                key = 'HTTP_' + key
+                if key in environ:
+                    value = '{},{}'.format(environ[key], value)
+            environ[key] = value
+
+        connection_header = environ.get('HTTP_CONNECTION', '').lower()
+        if protocol == 'HTTP/1.1':
+            keep_alive = 'close' not in connection_header
+        else:
+            keep_alive = 'keep-alive' in connection_header
+        keep_alive = keep_alive and self.keep_alive_timeout > 0
+
+        transfer_encoding = environ.get('HTTP_TRANSFER_ENCODING', '').lower()
+        if transfer_encoding:
+            if transfer_encoding != 'chunked' or 'CONTENT_LENGTH' in environ or protocol != 'HTTP/1.1':
+                raise _HTTPError(400)
+            length = None
+            environ['wsgi.input_terminated'] = True
+        else:
+            value = environ.get('CONTENT_LENGTH', '0') or '0'
+            if not value.isdigit():
+                raise _HTTPError(400)
+            length = int(value)
+            if self.max_body_size is not None and length > self.max_body_size:
+                raise _HTTPError(413)
+        expect = environ.get('HTTP_EXPECT', '').lower() == '100-continue' and length != 0
+        body = _Body(connection, length, self.max_body_size, expect)
+        environ['wsgi.input'] = body
+        if hasattr(os, 'sendfile') and not connection.secure:
+            environ['swapy.socket'] = connection.sock
+        return environ, body, keep_alive
+
+    def _error(self, connection, code):
+        """
+        Sends an error response and closes the connection
+        """
+        reason = HTTP_STATUS_CODES.get(code, 'Error')
+        connection.sock.sendall('HTTP/1.1 {} {}\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Length: {}\r\n'
+                                'Date: {}\r\nConnection: close\r\n\r\n{}'
+                                .format(code, reason, len(reason), _date(), reason).encode('latin-1'))
+
+    def _handle(self, connection):
+        """
+        Reads one request, calls the app and sends the response
+
+        :param connection: _Connection
+        :return: bool
+            True if the connection can be used for the next request
+        """
+        try:
+            head = self._read_head(connection)
+            if head is None:
+                return False
+            environ, body, keep_alive = self._environ(connection, head)
+        except _HTTPError as e:
+            self._error(connection, e.code)
+            return False
+        return self._respond(connection, environ, body, keep_alive)
+
+    def _respond(self, connection, environ, body, keep_alive):
+        sock = connection.sock
+        http11 = environ['SERVER_PROTOCOL'] == 'HTTP/1.1'
+        head_request = environ['REQUEST_METHOD'] == 'HEAD'
+        response = {'status': None, 'headers': None, 'sent': False, 'chunked': False, 'keep_alive': keep_alive}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info:
+                try:
+                    if response['sent']:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            elif response['status'] is not None:
+                raise AssertionError('start_response was already called')
+            response['status'] = status
+            response['headers'] = headers
+            return write
+
+        def send_head(first):
+            status = response['status']
+            if status is None:
+                raise AssertionError('The app returned before start_response was called')
+            code = int(status[:3])
+            lines = ['{} {}'.format(environ['SERVER_PROTOCOL'], status)]
+            has_length = has_date = False
+            for name, value in response['headers']:
+                lower = name.lower()
+                if lower == 'content-length':
+                    has_length = True
+                elif lower == 'date':
+                    has_date = True
+                elif lower == 'connection':
+                    if value.lower() == 'close':
+                        response['keep_alive'] = False
+                    continue
+                elif lower == 'transfer-encoding':
+                    continue
+                lines.append('{}: {}'.format(name, value))
+            if not has_date:
+                lines.append('Date: ' + _date())
+            if not has_length and not head_request and code >= 200 and code not in (204, 304):
+                if http11:
+                    response['chunked'] = True
+                    lines.append('Transfer-Encoding: chunked')
+                else:
+                    response['keep_alive'] = False
+            if self._stopping:
+                response['keep_alive'] = False
+            if not response['keep_alive']:
+                lines.append('Connection: close')
+            elif not http11:
+                lines.append('Connection: keep-alive')
+            response['sent'] = True
+            head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+            sock.sendall(head + frame(first) if first and not head_request else head)
+
+        def frame(data):
+            if response['chunked']:
+                return b'%x\r\n%s\r\n' % (len(data), data)
+            return data
+
+        def write(data):
+            if not response['sent']:
+                send_head(data)
+            elif data and not head_request:
+                sock.sendall(frame(data))
+
+        try:
+            result = self.app(environ, start_response)
+        except Exception:
+            logger.exception('Error on request %s %s', environ['REQUEST_METHOD'], environ['PATH_INFO'])
+            self._error(connection, 500)
+            return False
+        try:
+            for data in result:
+                write(data)
+            if not response['sent']:
+                send_head(b'')
+            if response['chunked']:
+                sock.sendall(b'0\r\n\r\n')
+        except (socket.timeout, ConnectionError, ssl.SSLError):
+            return False
+        except Exception:
+            logger.exception('Error on request %s %s', environ['REQUEST_METHOD'], environ['PATH_INFO'])
+            if not response['sent']:
+                self._error(connection, 500)
+            return False
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+        return response['keep_alive'] and body.drain(_drain_limit)
@@ -0,0 +1,385 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from werkzeug.contrib.sessions import SessionStore as _SessionStore, FilesystemSessionStore as _FilesystemSessionStore
+
+from . import hooks, securecookie
+
+logger = logging.getLogger('swapy')
+
+
+class SessionStore(_SessionStore):
+    """
+    Base class for all swapy session stores
+
+    A store opens the session of a request and commits it into the response.
+    Server side stores keep the data and only send the session id in the 'session_id' cookie.
+    Subclasses have to implement get, save and delete like werkzeug's SessionStore.
+    """
+    cookie_name = 'session_id'
+
+    def open(self, req):
+        """
+        Returns the session of the given request or a new one
+
+        :param req: :class:`swapy.wrappers.Request`
+        :return: Session
+        """
+        sid = req.cookies.get(self.cookie_name)
+        if sid is None:
+            return self.new()
+        return self.get(sid)
+
+    def commit(self, req, session, response):
+        """
+        Saves the session if it was modified and sets the session cookie
+
+        :param req: :class:`swapy.wrappers.Request`
+        :param session: Session
+        :param response: :class:`werkzeug.wrappers.Response`
+        """
+        if session.should_save:
+            self.save(session)
+            response.set_cookie(self.cookie_name, session.sid)
+
+
+class FilesystemSessionStore(SessionStore, _FilesystemSessionStore):
+    """
+    Stores every session as pickle file in the temp directory (werkzeug's FilesystemSessionStore)
+    """
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Keeps the sessions of this process in memory
+
+    The least recently used sessions are removed if there are more than max_entries.
+    Sessions expire ttl seconds after their last use.
+
+    :param max_entries: int
+        Default = 10000
+    :param ttl: int | float
+        Seconds until a session expires
+        Default = 3600
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600, session_class=None):
+        SessionStore.__init__(self, session_class)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return self.new()
+            if entry[0] < time.monotonic():
+                del self._sessions[sid]
+                return self.new()
+            self._sessions.move_to_end(sid)
+            self._sessions[sid] = (time.monotonic() + self.ttl, entry[1])
+        return self.session_class(dict(entry[1]), sid, False)
+
+    def save(self, session):
+        with self._lock:
+            self._sessions[session.sid] = (time.monotonic() + self.ttl, dict(session))
+            self._sessions.move_to_end(session.sid)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session):
+        with self._lock:
+            self._sessions.pop(session.sid, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Stores the sessions as JSON in a SQLite database in WAL mode
+
+    Writes are collected and written in one transaction if batch_size sessions are pending
+    or flush_interval seconds are over. Pending sessions are also returned by get.
+    A background thread writes them every flush_interval seconds, so other processes see them without more traffic,
+    and deletes the expired sessions every cleanup_interval seconds.
+    They are written at exit, in workers of the PreforkServer by the 'worker_exit' hook.
+    Every process opens its own connection and starts its own thread at the first use,
+    so the store can be created before workers are forked.
+
+    :param path: str
+        Path to the database file
+        Default = 'swapy_sessions.sqlite3' in the temp directory
+    :param ttl: int | float | None
+        Seconds until a session expires
+        Default = None (never)
+    :param batch_size: int
+        Default = 100
+    :param flush_interval: int | float
+        Default = 1.0
+    :param cleanup_interval: int | float
+        Seconds between two deletions of the expired sessions
+        Default = 60
+    """
+
+    def __init__(self, path=None, ttl=None, batch_size=100, flush_interval=1.0, cleanup_interval=60,
+                 session_class=None):
+        SessionStore.__init__(self, session_class)
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(), 'swapy_sessions.sqlite3')
+        self.path = path
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cleanup_interval = cleanup_interval
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._last_cleanup = time.monotonic()
+        self._lock = threading.RLock()
+        self._pid = None
+        self._connection = None
+        self._stopped = None
+        # Connections of the parent process, a forked child must neither use nor close them
+        self._inherited = []
+        atexit.register(self.flush)
+        hooks.register('worker_exit', self.flush)
+        if hasattr(os, 'register_at_fork'):
+            # A lock which another thread held at the fork would never be released in the child
+            ref = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _after_fork(self):
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        """
+        Returns the connection of this process, it is opened at the first use after the start or a fork
+
+        :return: sqlite3.Connection
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    if self._connection is not None:
+                        # The sessions which are pending in the parent are written by the parent
+                        self._inherited.append(self._connection)
+                        self._pending = {}
+                    connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    connection.execute('PRAGMA journal_mode=WAL')
+                    connection.execute('PRAGMA synchronous=NORMAL')
+                    connection.execute('CREATE TABLE IF NOT EXISTS sessions '
+                                       '(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL)')
+                    connection.execute('CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)')
+                    self._connection, self._pid = connection, os.getpid()
+                    self._stopped = threading.Event()
+                    threading.Thread(target=_maintain, args=(weakref.ref(self), self._stopped, self.flush_interval),
+                                     name='swapy-sessions', daemon=True).start()
+        return self._connection
+
+    def cleanup(self):
+        """
+        Deletes the expired sessions from the database
+
+        :return: int
+            Number of deleted sessions
+        """
+        connection = self._connect()
+        with self._lock:
+            self._last_cleanup = time.monotonic()
+            return connection.execute('DELETE FROM sessions WHERE expires < ?', (time.time(),)).rowcount
+
+    def _maintain(self):
+        """
+        Flushes the pending sessions and deletes the expired ones if cleanup_interval seconds are over
+        """
+        self.flush()
+        if time.monotonic() - self._last_cleanup >= self.cleanup_interval:
+            self.cleanup()
+
+    def get(self, sid):
+        connection = self._connect()
+        with self._lock:
+            if sid in self._pending:
+                data = self._pending[sid]
+                if data is None:
+                    return self.new()
+                return self.session_class(json.loads(data[0]), sid, False)
+            row = connection.execute('SELECT data, expires FROM sessions WHERE sid = ?', (sid,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return self.new()
+        return self.session_class(json.loads(row[0]), sid, False)
+
+    def save(self, session):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        data = json.dumps(dict(session), separators=(',', ':'))
+        self._connect()
+        with self._lock:
+            self._pending[session.sid] = (data, expires)
+            self._flush_if_due()
+
+    def delete(self, session):
+        self._connect()
+        with self._lock:
+            self._pending[session.sid] = None
+            self._flush_if_due()
+
+    def _flush_if_due(self):
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all pending sessions into the database
+        """
+        with self._lock:
+            if not self._pending:
+                self._last_flush = time.monotonic()
+                return
+            connection = self._connect()
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            if not pending:
+                return
+            saves = [(sid, item[0], item[1]) for sid, item in pending.items() if item is not None]
+            deletes = [(sid,) for sid, item in pending.items() if item is None]
+            with connection:
+                connection.execute('BEGIN')
+                if saves:
+                    connection.executemany('INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)',
+                                           saves)
+                if deletes:
+                    connection.executemany('DELETE FROM sessions WHERE sid = ?', deletes)
+
+    def close(self):
+        """
+        Flushes the pending sessions and closes the database
+        """
+        atexit.unregister(self.flush)
+        hooks.remove('worker_exit', self.flush)
+        self.flush()
+        if self._pid == os.getpid():
+            self._stopped.set()
+            self._connection.close()
+            self._connection = self._pid = None
+
+
+def _maintain(ref, stopped, interval):
+    """
+    Runs the maintenance of a SQLiteSessionStore every interval seconds until it is closed or removed
+
+    :param ref: weakref.ref
+        Reference to the store, the thread doesn't keep it alive
+    :param stopped: threading.Event
+    :param interval: int | float
+    """
+    while not stopped.wait(interval):
+        store = ref()
+        if store is None:
+            return
+        try:
+            store._maintain()
+        except Exception:
+            logger.exception('Session store maintenance failed')
+        del store
+
+
+class CookieSessionStore(SessionStore):
+    """
+    Keeps the whole session as signed payload in a cookie, nothing is stored on the server
+
+    The session data is readable by the client but can't be changed without the secret key.
+    It is signed like req.secure_cookie (see :mod:`swapy.securecookie`).
+
+    :param secret_key: str | list | None
+        If it is None the 'secret_key' of the environment is used
+        A list rotates the keys, the first one signs and all of them verify
+        Default = None
+    :param cookie_name: str
+        Default = 'session_data'
+    :param max_age: int | None
+        Seconds after which a signed session is not accepted anymore
+        Default = None
+    :param serializer: str
+        'json' or 'msgpack'
+        Default = 'json'
+    """
+
+    def __init__(self, secret_key=None, cookie_name='session_data', max_age=None, serializer='json',
+                 session_class=None):
+        SessionStore.__init__(self, session_class)
+        self.secret_key = secret_key
+        self.cookie_name = cookie_name
+        self.max_age = max_age
+        self.serializer = securecookie.payload(serializer)
+
+    def new(self):
+        return self.session_class({}, None, True)
+
+    def open(self, req):
+        value = req.cookies.get(self.cookie_name)
+        if not value:
+            return self.new()
+        data = securecookie.loads(value, self._signer(req), self.serializer, self.max_age)
+        if not isinstance(data, dict):
+            return self.new()
+        return self.session_class(data, None, False)
+
+    def commit(self, req, session, response):
+        if session.should_save:
+            response.set_cookie(self.cookie_name, securecookie.dumps(dict(session), self._signer(req), self.serializer),
+                                max_age=self.max_age)
+
+    def _signer(self, req):
+        """
+        Returns the signer of the secret key
+
+        :param req: :class:`swapy.wrappers.Request`
+        :return: :class:`swapy.securecookie.Signer`
+        """
+        key = self.secret_key
+        if key is None:
+            key = req.state.environment.get('secret_key')
+        if not key:
+            raise Exception('\'secret_key\' value must be set in environment or passed to the CookieSessionStore')
+        return securecookie.signer(key)
+
+
+stores = {
+    'filesystem': FilesystemSessionStore,
+    'memory': MemorySessionStore,
+    'sqlite': SQLiteSessionStore,
+    'cookie': CookieSessionStore
+}
+
+
+def create(store='filesystem', **options):
+    """
+    Returns a session store
+
+    :param store: str | dict | SessionStore
+        'filesystem', 'memory', 'sqlite' or 'cookie'
+        A dict contains the name as 'store' and the options of the store
+        Example: {'store': 'memory', 'max_entries': 1000, 'ttl': 600}
+    :param options: object
+        Arguments for the store class
+    :return: SessionStore
+    """
+    if isinstance(store, SessionStore):
+        return store
+    if isinstance(store, dict):
+        options = dict(store, **options)
+        store = options.pop('store', 'filesystem')
+    if store not in stores:
+        raise ValueError('Session store "{}" is not supported. Please use one of: {}'
+                         .format(store, ', '.join(sorted(stores))))
+    return stores[store](**options)
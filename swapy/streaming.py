@@ -0,0 +1,185 @@
+from . import serializers
+from .wrappers import Response
+
+
+class Stream:
+    """
+    Iterable body of a streamed response
+
+    Every item of the iterable is encoded and sent as soon as it is produced, nothing is buffered.
+    close() is called by the server when the response is finished or the client disconnected.
+    It closes the iterable (a generator gets GeneratorExit, so its finally blocks run) and calls the close hooks.
+
+    :param iterable: iterable
+    :param encode: function | None
+        Converts an item into str or bytes
+        Default = None
+    :param on_close: function | None
+        Called without arguments when the stream is closed
+        Default = None
+    """
+
+    def __init__(self, iterable, encode=None, on_close=None):
+        self.iterable = iterable
+        self.encode = encode
+        self.on_close = [on_close] if on_close is not None else []
+        self.closed = False
+
+    def __iter__(self):
+        encode = self.encode
+        for item in self.iterable:
+            chunk = encode(item) if encode is not None else item
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield chunk
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            close = getattr(self.iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            for callback in self.on_close:
+                callback()
+
+
+class StreamResponse(Response):
+    """
+    Response which sends its content chunk by chunk
+    The content is a :class:`Stream`, the response has no Content-Length.
+
+    :param iterable: iterable
+    :param code: int
+        Default = 200
+    :param headers: dict | None
+    :param mimetype: str
+        Default = 'application/octet-stream'
+    :param encode: function | None
+    :param on_close: function | None
+    """
+    __slots__ = []
+
+    def __init__(self, iterable, code=200, headers=None, mimetype='application/octet-stream', encode=None,
+                 on_close=None):
+        Response.__init__(self, Stream(iterable, encode, on_close), code, headers)
+        self.headers.setdefault('Content-Type', mimetype)
+
+    def on_close(self, f):
+        """
+        Adds a function which is called when the stream is closed
+
+        :param f: function
+        :return: function
+            Returns f
+        """
+        self.content.on_close.append(f)
+        return f
+
+
+def stream(iterable, mimetype='application/octet-stream', code=200, headers=None, on_close=None):
+    """
+    Returns a response which sends the items of an iterable as they are produced
+    The items must be str or bytes.
+
+    :param iterable: iterable
+    :param mimetype: str
+        Default = 'application/octet-stream'
+    :param code: int
+        Default = 200
+    :param headers: dict | None
+    :param on_close: function | None
+        Called when the response is finished or the client disconnected
+        Default = None
+    :return: StreamResponse
+    """
+    return StreamResponse(iterable, code, headers, mimetype, on_close=on_close)
+
+
+def ndjson(iterable, code=200, headers=None, on_close=None, serializer=None):
+    """
+    Returns a response which sends every item as one line of JSON (newline delimited JSON)
+
+    :param iterable: iterable
+    :param code: int
+        Default = 200
+    :param headers: dict | None
+    :param on_close: function | None
+    :param serializer: :class:`swapy.serializers.JsonSerializer` | None
+        Default = None (swapy.serializers.default)
+    :return: StreamResponse
+    """
+    serializer = serializer or serializers.default
+
+    def encode(item):
+        line = serializer.dumps(item)
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        return line + b'\n'
+    return StreamResponse(iterable, code, headers, 'application/x-ndjson', encode, on_close)
+
+
+def format_event(data=None, event=None, id=None, retry=None, serializer=None):
+    """
+    Returns a Server-Sent Event as text
+    data which is not str is serialized as JSON, every line of it gets an own 'data:' field
+
+    :param data: object
+    :param event: str | None
+    :param id: str | int | None
+    :param retry: int | None
+        Milliseconds until the client reconnects
+    :param serializer: :class:`swapy.serializers.JsonSerializer` | None
+    :return: str
+    """
+    lines = []
+    if id is not None:
+        lines.append('id: {}'.format(id))
+    if event is not None:
+        lines.append('event: {}'.format(event))
+    if retry is not None:
+        lines.append('retry: {}'.format(int(retry)))
+    if data is not None:
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        elif not isinstance(data, str):
+            data = (serializer or serializers.default).dumps(data)
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+        lines.extend('data: {}'.format(line) for line in data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse(iterable, headers=None, on_close=None, serializer=None):
+    """
+    Returns a response which sends the items as Server-Sent Events (text/event-stream)
+
+    Items can be:
+        str, bytes or other objects which are sent as data (others as JSON)
+        dict with the keys 'data', 'event', 'id' and 'retry'
+
+    Example:
+        def events():
+            yield {'event': 'progress', 'data': {'done': 10}}
+            yield 'finished'
+        return sse(events())
+
+    :param iterable: iterable
+    :param headers: dict | None
+    :param on_close: function | None
+    :param serializer: :class:`swapy.serializers.JsonSerializer` | None
+    :return: StreamResponse
+    """
+    headers = dict(headers or {})
+    headers.setdefault('Cache-Control', 'no-cache')
+    # Proxies like nginx must not buffer the events
+    headers.setdefault('X-Accel-Buffering', 'no')
+
+    def encode(item):
+        if isinstance(item, dict):
+            return format_event(item.get('data'), item.get('event'), item.get('id'), item.get('retry'), serializer)
+        return format_event(item, serializer=serializer)
+    return StreamResponse(iterable, 200, headers, 'text/event-stream', encode, on_close)
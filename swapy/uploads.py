@@ -0,0 +1,255 @@
+from tempfile import SpooledTemporaryFile
+
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.wsgi import get_content_length
+
+#: Default upload settings of a module, see :func:`swapy.uploads`
+defaults = {
+    'max_content_length': None,
+    'max_form_memory': None,
+    'spool_size': 512 * 1024,
+    'spool_dir': None
+}
+
+_max_header_size = 16 * 1024
+
+
+def spooled_file(settings):
+    """
+    Returns a file which is kept in memory until it has spool_size bytes and is written to spool_dir after that
+
+    :param settings: dict
+        Upload settings of the module
+    :return: :class:`tempfile.SpooledTemporaryFile`
+    """
+    return SpooledTemporaryFile(max_size=settings['spool_size'], mode='wb+', dir=settings['spool_dir'])
+
+
+class Part:
+    """
+    Part of a multipart body which is read while it is consumed
+
+    Iterating over the part yields the chunks of its content.
+    A part must be consumed before the next one, the rest of it is skipped otherwise.
+
+    name: str | None
+        Name of the form field
+    filename: str | None
+        Name of the uploaded file or None for other fields
+    content_type: str | None
+    headers: dict
+        Headers of the part with lower case names
+    """
+
+    def __init__(self, reader, headers):
+        self._reader = reader
+        self.headers = headers
+        disposition, options = parse_options_header(headers.get('content-disposition', ''))
+        self.name = options.get('name')
+        self.filename = options.get('filename')
+        self.content_type = headers.get('content-type')
+        self.done = False
+
+    @property
+    def is_file(self):
+        return self.filename is not None
+
+    def __iter__(self):
+        while not self.done:
+            chunk = self._reader.read_part()
+            if chunk is None:
+                self.done = True
+            elif chunk:
+                yield chunk
+
+    def read(self):
+        """
+        Returns the whole content of the part
+        Fields which are no files are limited by max_form_memory
+
+        :return: bytes
+        """
+        limit = None if self.is_file else self._reader.max_memory
+        chunks = []
+        size = 0
+        for chunk in self:
+            size += len(chunk)
+            if limit is not None and size > limit:
+                raise RequestEntityTooLarge()
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def text(self, charset='utf-8'):
+        """
+        Returns the content of the part as text
+
+        :param charset: str
+        :return: str
+        """
+        return self.read().decode(charset, 'replace')
+
+    def save(self, destination):
+        """
+        Writes the content of the part into a file without keeping it in memory
+
+        :param destination: str | file
+            Path or file object which is opened for binary writing
+        :return: int
+            Number of written bytes
+        """
+        if isinstance(destination, str):
+            with open(destination, 'wb') as f:
+                return self.save(f)
+        size = 0
+        for chunk in self:
+            destination.write(chunk)
+            size += len(chunk)
+        return size
+
+    def skip(self):
+        for _ in self:
+            pass
+
+
+class MultipartReader:
+    """
+    Parses a multipart body from a stream and yields its parts
+    Only chunk_size bytes and the current headers are held in memory.
+
+    :param stream: file
+        The input stream of the request
+    :param boundary: bytes
+    :param chunk_size: int
+        Default = 64 KiB
+    :param max_memory: int | None
+        Limit for fields which are no files
+    :param max_length: int | None
+        Limit for the whole body
+    """
+
+    def __init__(self, stream, boundary, chunk_size=64 * 1024, max_memory=None, max_length=None):
+        self.stream = stream
+        self.delimiter = b'--' + boundary
+        self.marker = b'\r\n' + self.delimiter
+        self.chunk_size = max(chunk_size, len(self.marker) * 2)
+        self.max_memory = max_memory
+        self.max_length = max_length
+        self._buffer = b''
+        self._read = 0
+        self._eof = False
+        self._end = False
+
+    def _fill(self):
+        """
+        Reads the next chunk of the stream into the buffer
+
+        :return: bool
+            False at the end of the stream
+        """
+        if self._eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._read += len(chunk)
+        if self.max_length is not None and self._read > self.max_length:
+            raise RequestEntityTooLarge()
+        self._buffer += chunk
+        return True
+
+    def _read_until(self, separator, limit):
+        """
+        Returns the data until the separator and removes both from the buffer
+
+        :param separator: bytes
+        :param limit: int
+            Maximum size of the data
+        :return: bytes
+        """
+        while True:
+            index = self._buffer.find(separator)
+            if index != -1:
+                data = self._buffer[:index]
+                self._buffer = self._buffer[index + len(separator):]
+                return data
+            if len(self._buffer) > limit:
+                raise BadRequest('Invalid multipart body')
+            if not self._fill():
+                raise BadRequest('Unexpected end of multipart body')
+
+    def _headers(self):
+        """
+        Reads the headers of the next part
+
+        :return: dict
+        """
+        headers = {}
+        for line in self._read_until(b'\r\n\r\n', _max_header_size).split(b'\r\n'):
+            if not line:
+                continue
+            name, _, value = line.decode('utf-8', 'replace').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+    def read_part(self):
+        """
+        Returns the next chunk of the current part or None at its end
+
+        :return: bytes | None
+        """
+        if self._end:
+            self._end = False
+            return None
+        while True:
+            index = self._buffer.find(self.marker)
+            if index != -1:
+                data = self._buffer[:index]
+                self._buffer = self._buffer[index + len(self.marker):]
+                if data:
+                    # The end of the part is returned at the next call
+                    self._end = True
+                    return data
+                return None
+            # The end of the buffer could be the beginning of the marker
+            keep = len(self.marker) - 1
+            if len(self._buffer) > keep:
+                data = self._buffer[:-keep]
+                self._buffer = self._buffer[-keep:]
+                return data
+            if not self._fill():
+                raise BadRequest('Unexpected end of multipart body')
+
+    def __iter__(self):
+        self._read_until(self.delimiter, self.chunk_size + _max_header_size)
+        while True:
+            while len(self._buffer) < 2:
+                if not self._fill():
+                    raise BadRequest('Unexpected end of multipart body')
+            if self._buffer.startswith(b'--'):
+                return
+            self._read_until(b'\r\n', _max_header_size)
+            part = Part(self, self._headers())
+            yield part
+            part.skip()
+
+
+def stream_parts(req, chunk_size=64 * 1024):
+    """
+    Yields the parts of a multipart/form-data request while the body is read
+
+    :param req: :class:`swapy.wrappers.Request`
+    :param chunk_size: int
+    :return: generator
+    """
+    settings = req.upload_settings
+    content_type, options = parse_options_header(req.environ.get('CONTENT_TYPE', ''))
+    if not content_type.startswith('multipart/') or not options.get('boundary'):
+        raise BadRequest('Expected a multipart body')
+    if settings['max_content_length'] is not None and (get_content_length(req.environ) or 0) > \
+            settings['max_content_length']:
+        raise RequestEntityTooLarge()
+    reader = MultipartReader(req.stream, options['boundary'].encode('latin-1'), chunk_size,
+                             settings['max_form_memory'], settings['max_content_length'])
+    return iter(reader)
@@ -1,6 +1,16 @@
 from werkzeug.wrappers import BaseRequest
-from werkzeug.contrib.securecookie import SecureCookie
-import json
+from werkzeug.exceptions import BadRequest
+import inspect
+
+import time
+
+from . import serializers, uploads, hooks, securecookie
+
+_missing = object()
+
+_REQUEST_NAMES = ('req', 'request')
+_POSITIONAL = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+_VARIADIC = (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD)
 
 
 def response_from(args):
@@ -20,6 +30,146 @@ def response_from(args):
         return Response(args)
 
 
+def handler_signature(f):
+    """
+    Returns the signature of a route function
+    Decorators which only pass (*args, **kwargs) through are skipped. The wrapped function is taken from
+    __wrapped__ (functools.wraps) or, for decorators without it, from the closure if it holds exactly one function.
+
+    :param f: function
+    :return: inspect.Signature | None
+        None if the signature can't be inspected
+    """
+    target = f
+    while True:
+        try:
+            signature = inspect.signature(target, follow_wrapped=False)
+        except (TypeError, ValueError):
+            return None
+        params = signature.parameters.values()
+        if not params or not all(p.kind in _VARIADIC for p in params):
+            return signature
+        wrapped = getattr(target, '__wrapped__', None)
+        if wrapped is None:
+            wrapped = _closure_function(target)
+        if wrapped is None:
+            return signature
+        target = wrapped
+
+
+def _closure_function(f):
+    """
+    Returns the only function in the closure of f or None
+
+    :param f: function
+    :return: function | None
+    """
+    functions = [cell.cell_contents for cell in getattr(f, '__closure__', None) or ()
+                 if _is_function(cell)]
+    return functions[0] if len(functions) == 1 else None
+
+
+def _is_function(cell):
+    try:
+        contents = cell.cell_contents
+    except ValueError:
+        # Empty cell
+        return False
+    return inspect.isfunction(contents) or inspect.ismethod(contents)
+
+
+def adapt(f, url_args=None):
+    """
+    Returns a function which receives the request and calls f with the arguments f asks for
+
+    The signature of f is inspected once:
+    - A parameter named 'req' or 'request' (or the first positional one which is no url argument) gets the request
+    - Parameters named like url arguments get the value of the url argument
+    - **kwargs gets all remaining url arguments
+    - A function without parameters is called without arguments
+    - A function with only (*args, **kwargs) whose wrapped function can't be found (see :func:`handler_signature`)
+      or without an inspectable signature gets the request
+
+    :param f: function
+    :param url_args: set | None
+        Names of the url arguments of the route
+        If it is None they are taken from the first request
+    :return: function
+    """
+    signature = handler_signature(f)
+    if signature is None:
+        return f
+    params = list(signature.parameters.values())
+    if not params:
+        def call(req):
+            return f()
+        return call
+    if len(params) == 1 and params[0].kind in _POSITIONAL and params[0].name in _REQUEST_NAMES:
+        return f
+    if params[0].kind == inspect.Parameter.VAR_POSITIONAL and all(p.kind in _VARIADIC for p in params):
+        return f
+    if url_args is None:
+        adapted = []
+
+        def call(req):
+            if not adapted:
+                adapted.append(_adapt(f, params, set(req.url_args or ())))
+            return adapted[0](req)
+        return call
+    return _adapt(f, params, set(url_args))
+
+
+def _adapt(f, params, url_args):
+    """
+    Builds the call adapter for the given parameters of f
+
+    :param f: function
+    :param params: list
+        Parameters of f
+    :param url_args: set
+        Names of the url arguments
+    :return: function
+    """
+    request = None
+    positional = False
+    names = []
+    keywords = False
+    for i, p in enumerate(params):
+        if p.kind == inspect.Parameter.VAR_KEYWORD:
+            keywords = True
+        elif p.kind == inspect.Parameter.VAR_POSITIONAL:
+            if request is None and i == 0:
+                request, positional = p.name, True
+        elif p.name in url_args:
+            names.append(p.name)
+        elif request is None and (p.name in _REQUEST_NAMES or (i == 0 and p.kind in _POSITIONAL)):
+            request, positional = p.name, i == 0 and p.kind in _POSITIONAL
+    names = tuple(names)
+
+    if request is None and not names and not keywords:
+        def call(req):
+            return f()
+    elif positional and not names and not keywords:
+        call = f
+    elif not keywords:
+        def call(req):
+            kwargs = {name: req.url_args[name] for name in names}
+            if positional:
+                return f(req, **kwargs)
+            if request is not None:
+                kwargs[request] = req
+            return f(**kwargs)
+    else:
+        def call(req):
+            kwargs = dict(req.url_args)
+            if positional:
+                return f(req, **kwargs)
+            if request is not None:
+                kwargs[request] = req
+            return f(**kwargs)
+    return call
+
+
 class Request(BaseRequest):
     """
     Request class which inherits from werkzeug's request class
@@ -28,44 +178,156 @@ class Request(BaseRequest):
     Example:
         request = Request('content', 200, {'my_header': 'value'})
     """
-    session = None
+    _session = None
+    _preloaded_session = None
     _secure_cookie = None
+    session_store = None
     state = None
     url_args = None
+    endpoint = None
+
+    @property
+    def session(self):
+        """
+        Returns the session of the request
+        It is opened from the session store at the first access
+
+        :return: Session
+        """
+        if self._session is None:
+            session = self._preloaded_session
+            self._session = session if session is not None else self.open_session()
+        return self._session
+
+    def open_session(self):
+        """
+        Returns the session of the request from the session store
+        req.session calls it at the first access. asgi_app() calls it in the thread pool before an async route
+        if the request has a session cookie, so the store isn't read on the event loop.
+
+        :return: Session
+        """
+        if self.session_store is None:
+            # The default store is created at the first session, so modules without sessions don't import it
+            from .sessions import FilesystemSessionStore
+            if self.state.session_store is None:
+                self.state.session_store = FilesystemSessionStore()
+            self.session_store = self.state.session_store
+        if hooks.registry['session']:
+            start = time.perf_counter()
+            session = self.session_store.open(self)
+            hooks.fire('session', self, 'open', time.perf_counter() - start)
+            return session
+        return self.session_store.open(self)
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    _json = _missing
+
+    @property
+    def serializer(self):
+        """
+        Returns the JSON serializer of the module
+
+        :return: :class:`swapy.serializers.JsonSerializer`
+        """
+        if self.state is not None and self.state.json is not None:
+            return self.state.json
+        return serializers.default
 
     @property
     def json(self):
         """
-        Returns dict from json string if available
+        Returns the parsed JSON body
+        The body is only parsed at the first access, an empty body is an empty dict
+
+        :return: object
+        :raises BadRequest: If the body is no valid JSON
+        """
+        if self._json is _missing:
+            data = self.get_data(cache=True)
+            if not data:
+                self._json = {}
+            else:
+                try:
+                    self._json = self.serializer.loads(data)
+                except ValueError:
+                    raise BadRequest('The request body is no valid JSON')
+        return self._json
+
+    @property
+    def upload_settings(self):
+        """
+        Returns the upload settings of the module (see :func:`swapy.uploads`)
 
         :return: dict
         """
-        try:
-            content = json.loads(self.data.decode())
-        except json.JSONDecodeError:
-            content = {}
-        return content
+        if self.state is not None:
+            return self.state.uploads
+        return uploads.defaults
+
+    @property
+    def max_content_length(self):
+        return self.upload_settings['max_content_length']
+
+    @property
+    def max_form_memory_size(self):
+        return self.upload_settings['max_form_memory']
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        """
+        Returns the file for an uploaded file of req.files
+        It is kept in memory up to spool_size bytes and written to spool_dir after that
+        """
+        return uploads.spooled_file(self.upload_settings)
+
+    def stream_parts(self, chunk_size=64 * 1024):
+        """
+        Yields the parts of a multipart/form-data body while it is read
+        Large uploads can be processed without holding them in memory.
+        Every part must be consumed before the next one, req.form and req.files are empty afterwards.
+
+        Example:
+            for part in req.stream_parts():
+                if part.is_file:
+                    part.save(os.path.join(upload_dir, secure_filename(part.filename)))
+                else:
+                    fields[part.name] = part.text()
+
+        :param chunk_size: int
+            Default = 64 KiB
+        :return: generator
+            Yields :class:`swapy.uploads.Part` objects
+        :raises BadRequest: If the body is no valid multipart body
+        :raises RequestEntityTooLarge: If the body exceeds max_content_length
+        """
+        return uploads.stream_parts(self, chunk_size)
 
     @property
     def secure_cookie(self):
         """
-        Returns the secure cookie object from werkzeug
+        Returns the secure cookie of the request
 
-        :return: SecureCookie
+        :return: :class:`swapy.securecookie.SecureCookie`
         """
         return self.get_secure_cookie()
 
     def get_secure_cookie(self):
         """
-        Returns the secure cookie object from werkzeug
+        Returns the secure cookie of the request
+        It is loaded at the first access and signed with the 'secret_key' of the environment.
+        A list of keys rotates them, the first one signs and all of them verify.
 
-        :return: SecureCookie
+        :return: :class:`swapy.securecookie.SecureCookie`
         """
-        secret_key = self.state.environment.get('secret_key')
-        if not secret_key:
-            raise Exception('\'secret_key\' value must be set in environment')
-        if not self._secure_cookie:
-            self._secure_cookie = SecureCookie.load_cookie(self, secret_key=secret_key.encode())
+        if self._secure_cookie is None:
+            secret_key = self.state.environment.get('secret_key')
+            if not secret_key:
+                raise Exception('\'secret_key\' value must be set in environment')
+            self._secure_cookie = securecookie.SecureCookie.load_cookie(self, securecookie.signer(secret_key),
+                                                                        self.state.secure_cookie)
         return self._secure_cookie
 
 
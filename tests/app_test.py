@@ -8,7 +8,8 @@ if os.path.exists('../swapy/__init__.py'):
     sys.path.append(os.path.abspath('../'))
 else:
     sys.path.append(os.path.abspath('./'))
-from swapy import on_get, run, file, redirect, config, app, on_post, on_put, render
+from swapy import on_get, run, file, redirect, config, app, on_post, on_put, render, precompile_templates
+from swapy import _utils
 from swapy.middlewares import JsonException, ExpectKeysMiddleware, HtmlMiddleware
 from swapy.wrappers import Response
 from swapy.testing import client
@@ -175,6 +176,28 @@ def test_html_render():
     assert b'Hello swapy!' in r.data
 
 
+def test_render_cached():
+    c.get('html')
+    env = _utils.template_environment(os.path.dirname(os.path.realpath(__file__)))
+    template = env.get_template('shared/index.html')
+    c.get('html')
+    assert env.get_template('shared/index.html') is template
+
+
+def test_precompile_templates():
+    import tempfile
+    directory = tempfile.mkdtemp()
+    os.mkdir(os.path.join(directory, 'static'))
+    for name, content in [('page.tpl', '{{ text }}'), ('broken.tpl', '{% broken'),
+                          ('static/asset.tpl', '{{ not a template')]:
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(content)
+    _utils.state('precompile_test').shared.append((os.path.join(directory, 'static'), '/static'))
+    assert _utils.precompile_templates(directory, ['tpl']) == 1
+    # shared/index.html is in the shared directory of this module
+    assert isinstance(precompile_templates(extensions=['html']), int)
+
+
 def test_not_found():
     r = c.get('something')
     assert r.status_code == 404
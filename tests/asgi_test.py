@@ -0,0 +1,145 @@
+import os
+import sys
+import asyncio
+import threading
+from functools import wraps
+
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+
+import swapy
+from swapy.wrappers import response_from
+
+
+def async_middleware(f):
+    @wraps(f)
+    async def handle(req):
+        res = response_from(await f(req))
+        res.headers['X-Async'] = 'yes'
+        return res
+    return handle
+
+
+def sync_middleware(f):
+    @wraps(f)
+    def handle(req):
+        res = response_from(f(req))
+        res.headers['X-Thread'] = threading.current_thread().name
+        return res
+    return handle
+
+
+swapy.use(sync_middleware, async_middleware)
+
+
+@swapy.on_get('async/<name>')
+async def hello(name):
+    await asyncio.sleep(0)
+    return 'Hello {}'.format(name)
+
+
+@swapy.on_post('async_echo')
+async def echo(req):
+    return str(req.json['a'])
+
+
+@swapy.on_get('sync')
+def sync():
+    return threading.current_thread().name
+
+
+@swapy.on_get('blocking', blocking=True)
+def blocking():
+    return threading.current_thread().name
+
+
+@swapy.on_get('blocking_async', blocking=True)
+async def blocking_async():
+    await asyncio.sleep(0)
+    return threading.current_thread().name
+
+
+@swapy.on_get('async_counter')
+async def counter(req):
+    req.session['count'] = req.session.get('count', 0) + 1
+    return str(req.session['count'])
+
+
+app = swapy.asgi_app()
+
+
+def call(method, path, body=b'', headers=()):
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': list(headers),
+             'http_version': '1.1'}
+    asyncio.run(app(scope, receive, send))
+    headers = dict((k.decode(), v.decode()) for k, v in sent[0]['headers'])
+    return sent[0]['status'], headers, b''.join(m.get('body', b'') for m in sent[1:])
+
+
+def test_async_handler():
+    status, headers, body = call('GET', '/async/swapy')
+    assert status == 200
+    assert body == b'Hello swapy'
+    assert headers['x-async'] == 'yes'
+    assert headers['x-thread'].startswith('swapy')
+
+
+def test_async_json():
+    status, _, body = call('POST', '/async_echo', b'{"a":1}', [(b'content-type', b'application/json')])
+    assert status == 200
+    assert body == b'1'
+
+
+def test_sync_handler_in_pool():
+    status, headers, body = call('GET', '/sync')
+    assert status == 200
+    assert body.startswith(b'swapy')
+    assert headers['x-async'] == 'yes'
+
+
+def test_blocking_in_pool():
+    for path in ('/blocking', '/blocking_async'):
+        status, headers, body = call('GET', path)
+        assert status == 200
+        assert body.startswith(b'swapy-blocking')
+        assert headers['x-async'] == 'yes'
+
+
+def test_async_session():
+    _, headers, body = call('GET', '/async_counter')
+    assert body == b'1'
+    cookie = headers['set-cookie'].split(';')[0].encode()
+    _, _, body = call('GET', '/async_counter', headers=[(b'cookie', cookie)])
+    assert body == b'2'
+
+
+def test_not_found():
+    status, _, _ = call('GET', '/missing')
+    assert status == 404
+
+
+def test_lifespan():
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    lifespan = swapy.asgi.ASGIApp(__name__)
+    asyncio.run(lifespan({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+
+import swapy
+from swapy.testing import client
+from swapy.cache import cached, invalidate, ResponseCache
+from swapy.wrappers import Request
+from werkzeug.test import EnvironBuilder
+
+calls = {'count': 0, 'user': 0, 'slow': 0}
+
+
+@swapy.on_get('count')
+@cached(ttl=30)
+def count():
+    calls['count'] += 1
+    return str(calls['count'])
+
+
+@swapy.on_get('user/<id>')
+@cached(ttl=30, vary=['Accept'])
+def user(id):
+    calls['user'] += 1
+    return '{}:{}'.format(id, calls['user'])
+
+
+@swapy.on_get('slow')
+@cached(ttl=30)
+def slow():
+    calls['slow'] += 1
+    time.sleep(0.2)
+    return 'slow'
+
+
+@swapy.on_get('cookie')
+@cached(ttl=30)
+def cookie():
+    res = swapy.Response(str(time.time()))
+    res.set_cookies({'a': 'b'})
+    return res
+
+
+@swapy.on_get('int_header')
+@cached(ttl=30)
+def int_header():
+    return 'x', 200, {'X-N': 5}
+
+
+@swapy.on_get('login/<name>')
+def login(req, name):
+    req.session['name'] = name
+
+
+@swapy.on_get('whoami')
+@cached(ttl=30)
+def whoami(req):
+    return req.session.get('name', 'nobody')
+
+
+app = swapy.app()
+c = client(app)
+
+
+def test_cached():
+    assert c.get('count').data == b'1'
+    assert c.get('count').data == b'1'
+    assert c.get('count?page=2').data == b'2'
+
+
+def test_int_header():
+    r = c.get('int_header')
+    assert r.status_code == 200 and r.headers['X-N'] == '5'
+    assert c.get('int_header').headers['X-N'] == '5'
+
+
+def test_no_cache():
+    first = c.get('count').data
+    refreshed = c.get('count', headers={'Cache-Control': 'no-cache'}).data
+    assert refreshed != first
+    assert c.get('count').data == refreshed
+
+
+def test_vary_and_invalidate():
+    a = c.get('user/1').data
+    assert c.get('user/1').data == a
+    assert c.get('user/1', headers={'Accept': 'application/json'}).data != a
+    b = c.get('user/2').data
+    assert invalidate(user, id='1') == 2
+    assert c.get('user/1').data != a
+    assert c.get('user/2').data == b
+
+
+def test_single_flight():
+    threads = [threading.Thread(target=lambda: client(app).get('slow')) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls['slow'] == 1
+
+
+def test_single_flight_async():
+    async_calls = []
+
+    @cached(ttl=30, cache=ResponseCache())
+    async def slow_async():
+        async_calls.append(1)
+        await asyncio.sleep(0.1)
+        return 'slow'
+
+    def request():
+        req = Request(EnvironBuilder('/slow_async').get_environ())
+        req.endpoint, req.url_args = 'slow_async', {}
+        return req
+
+    async def run():
+        return await asyncio.gather(*[slow_async(request()) for _ in range(5)])
+
+    responses = asyncio.run(run())
+    assert [r.content for r in responses] == ['slow'] * 5
+    assert len(async_calls) == 1
+
+
+def test_session_not_cached():
+    alice, bob = client(app), client(app)
+    alice.get('login/alice')
+    bob.get('login/bob')
+    assert alice.get('whoami').data == b'alice'
+    assert bob.get('whoami').data == b'bob'
+
+
+def test_cookies_not_cached():
+    assert c.get('cookie').data != c.get('cookie').data
+
+
+def test_lru_bytes():
+    cache = ResponseCache(max_bytes=1000)
+    for i in range(10):
+        cache.set(('e', (), i), swapy.cache.Entry(swapy.Response('x' * 100), 30, 'e', ()))
+    assert cache.size <= 1000
+    assert cache.get(('e', (), 0)) is None
+    assert cache.get(('e', (), 9)) is not None
+
+
+def test_size_in_bytes():
+    ascii_entry = swapy.cache.Entry(swapy.Response('e' * 100), 30, 'e', ())
+    utf8_entry = swapy.cache.Entry(swapy.Response('é' * 100), 30, 'e', ())
+    assert utf8_entry.size - ascii_entry.size == 100
@@ -0,0 +1,100 @@
+import sys
+import os
+import gzip
+import shutil
+import tempfile
+import zlib
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+import swapy
+from swapy.middlewares import CompressionMiddleware, JsonMiddleware
+from swapy.testing import client
+
+assets = tempfile.mkdtemp()
+with open(os.path.join(assets, 'app.js'), 'w') as f:
+    f.write('console.log("swapy");\n' * 100)
+
+swapy.use(CompressionMiddleware(min_size=100))
+swapy.shared(assets, 'assets')
+
+text = 'Hello swapy! ' * 100
+
+
+@swapy.on_get('text')
+def large():
+    return text
+
+
+@swapy.on_get('small')
+def small():
+    return 'small'
+
+
+@swapy.on_get('stream')
+def stream():
+    return (chunk for chunk in ['a' * 10, 'b' * 10])
+
+
+@swapy.on_get('json')
+@JsonMiddleware
+def json():
+    return {'items': list(range(100))}
+
+
+c = client(swapy.app())
+
+
+def test_gzip():
+    r = c.get('text', headers={'Accept-Encoding': 'gzip'})
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert r.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(r.data).decode() == text
+
+
+def test_deflate():
+    r = c.get('text', headers={'Accept-Encoding': 'deflate'})
+    assert r.headers['Content-Encoding'] == 'deflate'
+    assert zlib.decompress(r.data).decode() == text
+
+
+def test_not_accepted():
+    r = c.get('text', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in r.headers
+    assert r.headers['Vary'] == 'Accept-Encoding'
+    assert r.data.decode() == text
+
+
+def test_min_size():
+    r = c.get('small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in r.headers
+
+
+def test_stream():
+    r = c.get('stream', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Length' not in r.headers
+    assert gzip.decompress(r.data) == b'a' * 10 + b'b' * 10
+
+
+def test_json():
+    r = c.get('json', headers={'Accept-Encoding': 'gzip'})
+    assert r.headers['Content-Type'] == 'application/json'
+    assert r.headers['Content-Encoding'] == 'gzip'
+
+
+def test_precompressed_static():
+    assert swapy.precompress(formats=['gzip']) == 1
+    r = c.get('/assets/app.js', headers={'Accept-Encoding': 'gzip, br'})
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert r.headers['Content-Type'].endswith('javascript')
+    assert b'console.log' in gzip.decompress(r.data)
+    r = c.get('/assets/app.js')
+    assert 'Content-Encoding' not in r.headers
+    assert r.headers['Vary'] == 'Accept-Encoding'
+    assert swapy.precompress(formats=['gzip']) == 0
+
+
+def teardown_module():
+    shutil.rmtree(assets)
@@ -55,3 +55,46 @@ def test_secure_cookie():
     c.get('set_secure_cookie')
     r = c.get('get_secure_cookie')
     assert r.data == b'value'
+
+
+def test_env_parse_copies_data():
+    data = {'key': 'value', 'production': {'key': 'prod'}, 'development': {'key': 'dev'}}
+    env = swapy._utils.Environment(swapy._utils.State())
+    env.parse(data)
+    assert 'production' in data
+    assert env.get('key') == 'prod'
+
+
+def test_env_runtime_switch():
+    state = swapy._utils.State()
+    env = swapy._utils.Environment(state)
+    env.parse({'key': 'value', 'development': {'key': 'dev'}, 'production': {'key': 'prod'}})
+    assert env.get('key') == 'prod'
+    state.debug = True
+    assert env.get('key') == 'dev'
+    env.set('key', 'changed', 'development')
+    assert env.get('key') == 'changed'
+
+
+def test_env_single_runtime_not_merged():
+    state = swapy._utils.State()
+    env = swapy._utils.Environment(state)
+    env.parse({'key': 'value', 'development': {'key': 'dev'}})
+    assert env.get('key') == 'value'
+    state.debug = True
+    assert env.get('key') == 'value'
+    env.set('key', 'prod', 'production')
+    assert env.get('key') == 'dev'
+
+
+def test_env_snapshot():
+    env = swapy._utils.Environment(swapy._utils.State())
+    env.set('key', 'value')
+    snapshot = env.snapshot()
+    env.set('key', 'other')
+    assert snapshot['key'] == 'value'
+    try:
+        snapshot['key'] = 'x'
+        assert False
+    except TypeError:
+        pass
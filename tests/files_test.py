@@ -0,0 +1,207 @@
+import sys
+import os
+import tempfile
+import pytest
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+import swapy
+from swapy.testing import client
+
+swapy.shared(True)
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'favicon.png'), 'rb') as f:
+    data = f.read()
+
+
+@swapy.on_get('favicon')
+def favicon():
+    return swapy.send_file('favicon.png', cache_control=60)
+
+
+@swapy.on_get('download')
+def download():
+    return swapy.file('favicon.png', name='icon.png')
+
+
+c = client(swapy.app())
+
+
+def test_send_file():
+    r = c.get('favicon')
+    assert r.data == data
+    assert r.headers['Content-Type'] == 'image/png'
+    assert r.headers['Cache-Control'] == 'public, max-age=60'
+    assert r.headers['Accept-Ranges'] == 'bytes'
+    assert 'Content-Disposition' not in r.headers
+
+
+def test_attachment():
+    r = c.get('download')
+    assert r.headers['Content-Disposition'] == 'attachment;filename=icon.png'
+
+
+def test_if_none_match():
+    etag = c.get('favicon').headers['ETag']
+    r = c.get('favicon', headers={'If-None-Match': etag})
+    assert r.status_code == 304
+    assert r.data == b''
+
+
+def test_if_modified_since():
+    last_modified = c.get('favicon').headers['Last-Modified']
+    assert c.get('favicon', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+
+def test_range():
+    r = c.get('favicon', headers={'Range': 'bytes=10-19'})
+    assert r.status_code == 206
+    assert r.data == data[10:20]
+    assert r.headers['Content-Range'] == 'bytes 10-19/{}'.format(len(data))
+
+
+def test_suffix_range():
+    r = c.get('favicon', headers={'Range': 'bytes=-5'})
+    assert r.data == data[-5:]
+
+
+def test_multiple_ranges():
+    r = c.get('favicon', headers={'Range': 'bytes=0-1,5-6'})
+    assert r.status_code == 206
+    assert r.headers['Content-Type'].startswith('multipart/byteranges; boundary=')
+    assert int(r.headers['Content-Length']) == len(r.data)
+    assert data[0:2] in r.data and data[5:7] in r.data
+
+
+def test_unsatisfiable_range():
+    r = c.get('favicon', headers={'Range': 'bytes={}-'.format(len(data) + 10)})
+    assert r.status_code == 416
+    assert r.headers['Content-Range'] == 'bytes */{}'.format(len(data))
+
+
+def test_if_range_mismatch():
+    r = c.get('favicon', headers={'Range': 'bytes=0-1', 'If-Range': '"other"'})
+    assert r.status_code == 200
+    assert r.data == data
+
+
+def test_shared_range():
+    r = c.get('/shared/myFile.png', headers={'Range': 'bytes=0-3'})
+    assert r.status_code == 206
+    assert len(r.data) == 4
+
+
+def test_shared_not_modified():
+    etag = c.get('/shared/myFile.png').headers['ETag']
+    assert c.get('/shared/myFile.png', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_shared_missing():
+    assert c.get('/shared/missing.png').status_code == 404
+
+
+def test_file_wrapper():
+    wrapped = []
+
+    def file_wrapper(f, block_size):
+        wrapped.append(f)
+        return iter(lambda: f.read(block_size), b'')
+    r = c.get('favicon', environ_overrides={'wsgi.file_wrapper': file_wrapper})
+    assert r.data == data
+    assert len(wrapped) == 1
+    wrapped[0].close()
+
+
+def test_sendfile_server():
+    import threading
+    from http.client import HTTPConnection
+    from werkzeug.serving import make_server
+    from swapy.serving import RequestHandler
+
+    server = make_server('127.0.0.1', 0, swapy.app(), request_handler=RequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        connection = HTTPConnection('127.0.0.1', server.server_port)
+        connection.request('GET', '/favicon')
+        assert connection.getresponse().read() == data
+        connection = HTTPConnection('127.0.0.1', server.server_port)
+        connection.request('GET', '/favicon', headers={'Range': 'bytes=3-9'})
+        assert connection.getresponse().read() == data[3:10]
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def test_changed_file():
+    from swapy.files import FileResponse
+
+    path = os.path.join(tempfile.mkdtemp(), 'changing.txt')
+    with open(path, 'wb') as f:
+        f.write(b'0123456789')
+    response = FileResponse(path)
+    with open(path, 'ab') as f:
+        f.write(b'appended')
+    assert b''.join(response.content) == b'0123456789'
+    with open(path, 'wb') as f:
+        f.write(b'01234')
+    with pytest.raises(OSError):
+        b''.join(response.content)
+
+
+@pytest.mark.skipif(not hasattr(os, 'sendfile'), reason='needs os.sendfile')
+def test_sendfile_short():
+    import socket
+    from swapy.files import _sendfile
+
+    path = os.path.join(tempfile.mkdtemp(), 'short.txt')
+    with open(path, 'wb') as f:
+        f.write(b'0123456789')
+    left, right = socket.socketpair()
+    try:
+        with open(path, 'rb') as f:
+            with pytest.raises(OSError):
+                _sendfile(left, f, 0, 20)
+        assert right.recv(20) == b'0123456789'
+    finally:
+        left.close()
+        right.close()
+
+
+def test_raw_file_stream():
+    content, code, headers = swapy.raw_file('favicon.png', stream=True)
+    assert b''.join(content) == data
+
+
+def test_shared_cached():
+    r = c.get('/shared/myFile.png')
+    assert r.status_code == 200
+    assert r.headers['Cache-Control'] == 'public, max-age=43200'
+    assert c.get('/shared/myFile.png').data == r.data
+    assert c.head('/shared/myFile.png').data == b''
+
+
+def test_static_url():
+    url = swapy.static_url('myFile.png')
+    assert url.startswith('/shared/myFile.') and url.endswith('.png') and len(url) == len('/shared/myFile.png') + 9
+    assert swapy.static_url('/shared/myFile.png') == url
+    r = c.get(url)
+    assert r.status_code == 200
+    assert r.data == c.get('/shared/myFile.png').data
+    assert r.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert c.get('/shared/myFile.00000000.png').status_code == 404
+
+
+def test_static_index():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared', 'late.txt')
+    with open(path, 'w') as f:
+        f.write('late')
+    try:
+        assert c.get('/shared/late.txt').status_code == 404
+        swapy.refresh_shared()
+        assert c.get('/shared/late.txt').data == b'late'
+    finally:
+        os.remove(path)
+        swapy.refresh_shared()
@@ -0,0 +1,59 @@
+import json
+import os
+import sys
+import tempfile
+
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+
+import swapy
+from swapy import _utils
+from swapy.testing import client
+
+swapy.shared(True)
+
+
+@swapy.on_get('users/<int:id>')
+def user(id):
+    return str(id)
+
+
+def test_duplicate():
+    try:
+        swapy.on_get('users/<int:id>')(lambda id: id)
+    except Exception as e:
+        assert 'already exists' in str(e)
+    else:
+        assert False
+    swapy.on_post('users/<int:id>')(lambda id: id)
+
+
+def test_freeze():
+    snapshot = os.path.join(tempfile.mkdtemp(), 'app.snapshot')
+    c = client(swapy.freeze(snapshot, gc_freeze=False))
+    assert c.get('/users/5').data == b'5'
+    assert c.get(swapy.static_url('myFile.png')).status_code == 200
+    assert os.path.exists(snapshot)
+    try:
+        swapy.on_get('late')(lambda: 'late')
+    except Exception as e:
+        assert 'frozen' in str(e)
+    else:
+        assert False
+
+    state = _utils.state(__name__)
+    url = swapy.static_url('myFile.png')
+    state.static = None
+    assert _utils.load_snapshot(__name__, snapshot, _utils.route_signature(__name__))
+    assert state.static.files and state.static._hashes
+    assert swapy.static_url('myFile.png') == url
+    assert not _utils.load_snapshot(__name__, snapshot, [])
+    # The snapshot is plain JSON, invalid files are ignored
+    with open(snapshot) as f:
+        assert json.load(f)['version'] == _utils.snapshot_version
+    with open(snapshot, 'w') as f:
+        f.write('not json')
+    assert not _utils.load_snapshot(__name__, snapshot, _utils.route_signature(__name__))
@@ -0,0 +1,183 @@
+import sys
+import os
+import asyncio
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+import swapy
+from swapy.testing import client
+from swapy.middlewares import HtmlMiddleware, CorsMiddleware
+
+calls = []
+
+
+@swapy.on_get('no-args')
+def no_args():
+    return 'no args'
+
+
+@swapy.on_get('request')
+def request(req):
+    return req.method
+
+
+@swapy.on_get('user/<int:id>')
+def user(id):
+    return str(id + 1)
+
+
+@swapy.on_get('user/<int:id>/<name>')
+def user_name(req, name, id):
+    return '{} {} {}'.format(req.method, name, id)
+
+
+@swapy.on_get('kwargs/<a>/<b>')
+def kwargs(**args):
+    return ','.join(sorted(args.values()))
+
+
+@swapy.on_get('wrapped')
+@HtmlMiddleware
+def wrapped():
+    return 'wrapped'
+
+
+@swapy.on_get('cors')
+@CorsMiddleware
+def cors():
+    return 'cors'
+
+
+@swapy.on_get('type-error')
+def type_error():
+    calls.append(1)
+    raise TypeError('broken')
+
+
+def opaque(f):
+    # Decorator without functools.wraps, the signature of the handler is hidden
+    def handle(*args, **kwargs):
+        calls.append('opaque')
+        return f(*args, **kwargs)
+    return handle
+
+
+@swapy.on_get('opaque')
+@opaque
+def opaque_no_args():
+    return 'opaque'
+
+
+@swapy.on_get('opaque-request')
+@opaque
+def opaque_request(req):
+    return req.method
+
+
+@swapy.on_get('opaque/<int:id>')
+@opaque
+def opaque_url_args(id):
+    return str(id + 1)
+
+
+@swapy.on_get('opaque-type-error')
+@opaque
+def opaque_type_error():
+    raise TypeError('f() takes 0 positional arguments but 1 was given')
+
+
+def unknown(f):
+    # The closure has two functions, so the wrapped one is unknown and it gets the request
+    def log(*args):
+        calls.append('unknown')
+
+    def handle(*args, **kwargs):
+        log()
+        return f(*args, **kwargs)
+    return handle
+
+
+@swapy.on_get('unknown')
+@unknown
+def unknown_request(req):
+    return req.method
+
+
+loops = []
+
+
+@swapy.on_get('loop')
+async def loop():
+    loops.append(asyncio.get_running_loop())
+    return 'loop'
+
+
+c = client(swapy.app())
+
+
+def test_no_args():
+    assert c.get('no-args').data == b'no args'
+
+
+def test_request():
+    assert c.get('request').data == b'GET'
+
+
+def test_url_args():
+    assert c.get('user/41').data == b'42'
+
+
+def test_request_and_url_args():
+    assert c.get('user/1/swapy').data == b'GET swapy 1'
+
+
+def test_var_keyword():
+    assert c.get('kwargs/x/y').data == b'x,y'
+
+
+def test_wrapped():
+    r = c.get('wrapped')
+    assert r.data == b'wrapped'
+    assert r.headers['Content-Type'] == 'text/html'
+
+
+def test_cors_without_request():
+    r = c.get('cors')
+    assert r.data == b'cors'
+    assert r.headers['Access-Control-Allow-Origin'] == '*'
+
+
+def test_type_error_called_once():
+    del calls[:]
+    r = c.get('type-error')
+    assert r.status_code == 500
+    assert len(calls) == 1
+
+
+def test_opaque_decorator():
+    del calls[:]
+    assert c.get('opaque').data == b'opaque'
+    assert calls == ['opaque']
+    assert c.get('opaque-request').data == b'GET'
+    assert c.get('opaque/41').data == b'42'
+
+
+def test_opaque_type_error_called_once():
+    del calls[:]
+    assert c.get('opaque-type-error').status_code == 500
+    assert calls == ['opaque']
+
+
+def test_unknown_wrapped_gets_request():
+    del calls[:]
+    assert c.get('unknown').data == b'GET'
+    assert calls == ['unknown']
+
+
+def test_async_handler_reuses_loop():
+    del loops[:]
+    c.get('loop')
+    c.get('loop')
+    assert loops[0] is loops[1]
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules which are only needed by templates, sessions, secure cookies, async handlers and the servers
+lazy = ['jinja2', 'asyncio', 'sqlite3', 'pickle', 'concurrent.futures',
+        'werkzeug.contrib.sessions', 'werkzeug.contrib.securecookie', 'orjson', 'ujson',
+        'swapy.serving', 'swapy.asgi', 'swapy.cache', 'swapy.sessions']
+
+# Milliseconds which import swapy may take in total on top of the import of the werkzeug package.
+# werkzeug's __init__ imports werkzeug.serving (with ssl and http.server) and werkzeug.test in every release,
+# so that part is paid by every werkzeug application and can't be deferred by swapy.
+budget = 50
+
+
+def python(*args):
+    return subprocess.run([sys.executable] + list(args), cwd=_root, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+
+def test_lazy_modules():
+    code = 'import sys, swapy; print(",".join(m for m in {!r} if m in sys.modules))'.format(lazy)
+    assert python('-c', code).stdout.strip() == ''
+
+
+def test_lazy_modules_on_access():
+    code = 'import sys, swapy; swapy.cache; swapy.serializers.default; print("swapy.cache" in sys.modules)'
+    assert python('-c', code).stdout.strip() == 'True'
+
+
+def import_times():
+    """
+    Returns the cumulative import time of every module of 'import swapy' in microseconds
+    """
+    times = {}
+    for line in python('-X', 'importtime', '-c', 'import swapy').stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            times[parts[2].strip()] = int(parts[1])
+    return times
+
+
+def test_import_time():
+    # Everything swapy imports counts, also the stdlib and werkzeug modules which werkzeug's __init__ doesn't load
+    # The best of three runs is taken, so a busy machine doesn't fail the test
+    total = min(times['swapy'] - times['werkzeug'] for times in (import_times() for _ in range(3)))
+    assert 0 < total < budget * 1000
@@ -7,6 +7,7 @@ if os.path.exists('../swapy/__init__.py'):
 else:
     sys.path.append(os.path.abspath('./'))
 import swapy
+from swapy import serializers
 from swapy.middlewares import JsonMiddleware
 from swapy.testing import client
 
@@ -29,6 +30,16 @@ def test_list():
     return [1, 2]
 
 
+@swapy.on_post('echo')
+def echo(req):
+    return {'same': req.json is req.json, 'body': req.json}
+
+
+@swapy.on_get('int-keys')
+def int_keys(req):
+    return {1: 'one', 'big': 2 ** 70}
+
+
 @swapy.on('routes')
 def ret_routes():
     return swapy.routes()
@@ -58,3 +69,46 @@ def test_app_file_json():
 def test_json_list():
     r = c.get('json-list')
     assert json.loads(r.data.decode()) == [1, 2]
+
+
+def test_compact():
+    r = c.get('json')
+    assert r.data == b'{"message":"hi"}'
+
+
+def test_request_json_cached():
+    r = c.post('echo', data=json.dumps({'a': 1}), headers={'Content-Type': 'application/json'})
+    assert json.loads(r.data.decode()) == {'same': True, 'body': {'a': 1}}
+
+
+def test_request_json_empty():
+    r = c.post('echo')
+    assert json.loads(r.data.decode())['body'] == {}
+
+
+def test_request_json_invalid():
+    r = c.post('echo', data='{invalid', headers={'Content-Type': 'application/json'})
+    assert r.status_code == 400
+
+
+def test_stdlib_serializer():
+    swapy.json_serializer('json')
+    r = c.get('json')
+    assert r.data == b'{"message":"hi"}'
+    swapy.json_serializer('auto')
+
+
+def test_int_keys():
+    r = c.get('int-keys')
+    assert r.status_code == 200
+    assert r.data == b'{"1":"one","big":1180591620717411303424}'
+
+
+def test_serializers_same_output():
+    data = {'a': [1, 2.5, None, True], 2: 'two', 'url': 'a/b'}
+    for name in ('json', 'auto'):
+        serializer = serializers.get(name)
+        compact, pretty = serializer.dumps(data), serializer.dumps(data, True)
+        assert (compact.decode() if isinstance(compact, bytes) else compact) == \
+            '{"a":[1,2.5,null,true],"2":"two","url":"a/b"}'
+        assert pretty == json.dumps(data, indent=4)
@@ -0,0 +1,75 @@
+import os
+import sys
+
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+
+import swapy
+from swapy.testing import client
+from swapy.ext import metrics
+from werkzeug.exceptions import BadRequest
+
+metrics.init()
+events = []
+
+
+@swapy.hook('after_handler')
+def record(req, response):
+    events.append((req.path, response.status_code))
+
+
+@swapy.on_get('users/<id>')
+def user(id):
+    return id
+
+
+@swapy.on_get('broken')
+def broken():
+    raise BadRequest()
+
+
+@swapy.on_get('session')
+def session(req):
+    req.session['visits'] = req.session.get('visits', 0) + 1
+    return str(req.session['visits'])
+
+
+c = client(swapy.app())
+
+
+def test_hooks():
+    del events[:]
+    c.get('/users/1')
+    assert events == [('/users/1', 200)]
+    assert 'record' not in swapy.hooks.registry['response_sent']
+
+
+def test_unknown_hook():
+    try:
+        swapy.hook('unknown')(lambda: None)
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_metrics():
+    metrics.reset()
+    # The responses must be closed to be counted
+    for url in ('/users/1', '/users/2', '/broken', '/missing', '/session'):
+        c.get(url, buffered=True)
+    res = c.get('/metrics')
+    assert res.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = res.data.decode()
+    assert 'swapy_requests_total{endpoint="metrics_test.user:GET",method="GET",status="200"} 2' in text
+    assert 'swapy_requests_total{endpoint="metrics_test.broken:GET",method="GET",status="400"} 1' in text
+    assert 'swapy_requests_total{endpoint="<unmatched>",method="GET",status="404"} 1' in text
+    assert 'swapy_request_duration_seconds_count{endpoint="metrics_test.user:GET",method="GET"} 2' in text
+    assert 'swapy_request_duration_seconds_bucket{endpoint="metrics_test.user:GET",method="GET",le="+Inf"} 2' in text
+    assert 'swapy_exceptions_total{endpoint="metrics_test.broken:GET",exception="BadRequest"} 1' in text
+    assert 'swapy_session_duration_seconds_count{action="commit"} 1' in text
+    # The metrics request itself is in flight while it is exported
+    assert 'swapy_requests_in_flight 1' in text
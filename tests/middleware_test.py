@@ -0,0 +1,51 @@
+import sys
+import os
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+import swapy
+from swapy.testing import client
+from swapy.wrappers import response_from
+
+wrapped = []
+
+
+def counting_middleware(f):
+    wrapped.append(f)
+
+    def handle(*args, **kwargs):
+        return f(*args, **kwargs)
+    return handle
+
+
+def upper_middleware(f):
+    def handle(*args, **kwargs):
+        response = response_from(f(*args, **kwargs))
+        response.content = response.content.upper()
+        return response
+    return handle
+
+
+swapy.use(counting_middleware)
+
+
+@swapy.on_get('hello')
+def hello():
+    return 'hello'
+
+
+c = client(swapy.app())
+
+
+def test_middleware_compiled_once():
+    count = len(wrapped)
+    for _ in range(3):
+        assert c.get('hello').data == b'hello'
+    assert len(wrapped) == count
+
+
+def test_use_after_build():
+    swapy.use(upper_middleware)
+    assert c.get('hello').data == b'HELLO'
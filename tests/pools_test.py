@@ -0,0 +1,68 @@
+import os
+import sys
+import threading
+
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+
+import swapy
+from swapy.testing import client
+from swapy.middlewares import BlockingMiddleware
+
+started = threading.Event()
+release = threading.Event()
+
+swapy.pool('reports', max_workers=1, max_queue=0, retry_after=5)
+
+
+@swapy.on_get('thread', blocking=True)
+def thread():
+    return threading.current_thread().name
+
+
+@swapy.on_get('report', blocking='reports')
+def report():
+    started.set()
+    release.wait(5)
+    return 'report'
+
+
+@swapy.on_get('middleware')
+@BlockingMiddleware(pool='reports')
+def middleware():
+    return threading.current_thread().name
+
+
+app = swapy.app()
+c = client(app)
+
+
+def test_blocking_route():
+    r = c.get('thread')
+    assert r.data.startswith(b'swapy-blocking')
+
+
+def test_blocking_middleware():
+    r = c.get('middleware')
+    assert r.data.startswith(b'swapy-reports')
+
+
+def test_saturated_pool():
+    results = []
+    t = threading.Thread(target=lambda: results.append(client(app).get('report')))
+    t.start()
+    try:
+        assert started.wait(5)
+        r = c.get('report')
+        assert r.status_code == 503
+        assert r.headers['Retry-After'] == '5'
+    finally:
+        release.set()
+        t.join()
+    assert results[0].data == b'report'
+    stats = swapy.pool_stats()['reports']
+    assert stats['rejected'] == 1
+    assert stats['queued'] == 0 and stats['running'] == 0
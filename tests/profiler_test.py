@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import pytest
+
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+
+import swapy
+from swapy.testing import client
+from swapy import _utils
+from swapy.ext import profiler
+
+profiler.init(token='secret')
+
+
+def slow_middleware(f):
+    def handle(*args, **kwargs):
+        busy()
+        return f(*args, **kwargs)
+    return handle
+
+
+# Added after the profiler, it is still profiled
+swapy.use(slow_middleware)
+
+
+def busy():
+    end = time.perf_counter() + 0.05
+    while time.perf_counter() < end:
+        pass
+
+
+@swapy.on_get('slow')
+def slow():
+    busy()
+    return 'done'
+
+
+c = client(swapy.app())
+
+
+def control(**data):
+    return c.post('/profiler', data=data, headers={'X-Profiler-Token': 'secret'})
+
+
+def test_token():
+    assert c.get('/profiler').status_code == 403
+    assert c.get('/profiler?token=wrong').status_code == 403
+    assert c.get('/profiler?token=secret').status_code == 200
+
+
+def test_sampling():
+    assert control(rate='1', mode='sampling', interval='0.001').status_code == 200
+    c.delete('/profiler?token=secret')
+    assert c.get('/slow').data == b'done'
+    control(enabled='0')
+    stacks = c.get('/profiler/flamegraph?token=secret').data.decode()
+    assert 'profiler_test.slow:GET;' in stacks
+    assert 'busy (profiler_test.py' in stacks
+    assert 'busy (profiler_test.py' in c.get('/profiler?token=secret&endpoint=profiler_test.slow:GET').data.decode()
+
+
+def test_cprofile():
+    control(rate='1', mode='cprofile')
+    c.delete('/profiler?token=secret')
+    c.get('/slow')
+    control(enabled='0')
+    assert profiler.profiler.endpoints() == {'profiler_test.slow:GET': 1}
+    names = [item[0] for item in profiler.profiler.top(50, 'profiler_test.slow:GET')]
+    assert any(name.startswith('busy (profiler_test.py') for name in names)
+    assert any(name.startswith('handle (profiler_test.py') for name in names)
+    assert profiler.profiler.collapsed() == ''
+
+
+def test_no_token():
+    exec('from swapy.ext import profiler\nprofiler.init()', {'__name__': 'profiler_open'})
+    assert _utils.state('profiler_open').routes == {}
+    assert profiler.profiler.middleware in _utils.state('profiler_open').middlewares
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_sampling_after_fork():
+    forked = profiler.Profiler()
+    forked.start(1, 'sampling', 0.001)
+    pid = os.fork()
+    if pid == 0:
+        # Like a worker of the PreforkServer, the sampler thread of the parent doesn't exist here
+        code = 1
+        try:
+            forked.middleware(busy)()
+            if 'busy (profiler_test.py' in forked.collapsed():
+                code = 0
+        finally:
+            os._exit(code)
+    forked.stop()
+    assert os.waitpid(pid, 0)[1] == 0
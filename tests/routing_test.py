@@ -0,0 +1,114 @@
+import sys
+import os
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+import swapy
+from swapy.routing import RadixRouter
+from swapy.testing import client
+from werkzeug.exceptions import NotFound, MethodNotAllowed
+from werkzeug.routing import Map, Rule, BuildError
+
+swapy.router('radix')
+
+
+@swapy.on_get()
+def root():
+    return 'root'
+
+
+@swapy.on_get('users/<int:id>')
+def user(id):
+    return 'user {}'.format(id)
+
+
+@swapy.on_get('users/me')
+def me():
+    return 'me'
+
+
+@swapy.on_post('users/<name>')
+def create(name):
+    return 'created {}'.format(name)
+
+
+@swapy.on_get('files/<path:path>')
+def files(path):
+    return path
+
+
+c = client(swapy.app())
+
+rules = ['/', '/users/<int:id>', '/users/me', '/users/<name>', '/users/<int:id>/posts/<int:post>',
+         '/files/<path:path>', '/img/item-<int:id>.png', '/price/<float:value>', '/docs/', '/a/<path:p>/edit']
+paths = ['/', '', '/users/1', '/users/1/', '/users/me', '/users/bob', '/users/1/posts/2', '/users/x/posts/2',
+         '/files/a/b/c.txt', '/files/', '/img/item-7.png', '/img/item-x.png', '/price/1.5', '/price/1',
+         '/docs', '/docs/', '/a/b/c/edit', '/missing', '/users//1', '/users/1//']
+
+
+def match(adapter, path, method):
+    try:
+        return adapter(path, method)
+    except NotFound:
+        return 404
+    except MethodNotAllowed as e:
+        return 405, sorted(e.valid_methods)
+
+
+def test_same_as_werkzeug():
+    url_map = Map([Rule(rule, endpoint=rule, methods=['GET'] if i % 2 else ['POST'], strict_slashes=False)
+                   for i, rule in enumerate(rules)])
+    router = RadixRouter(url_map)
+    for path in paths:
+        for method in ('GET', 'POST', 'HEAD'):
+            expected = match(lambda p, m: url_map.bind('localhost').match(p, m), path, method)
+            assert match(router.match, path, method) == expected, (path, method)
+
+
+def test_app_static_before_dynamic():
+    assert c.get('users/me').data == b'me'
+    assert c.get('users/42').data == b'user 42'
+
+
+def test_app_root():
+    assert c.get('').data == b'root'
+
+
+def test_app_path():
+    assert c.get('files/a/b.txt').data == b'a/b.txt'
+
+
+def test_app_not_found():
+    assert c.get('nothing').status_code == 404
+
+
+def test_app_method_not_allowed():
+    assert c.get('users/bob').status_code == 405
+    assert c.post('users/bob').data == b'created bob'
+
+
+def test_app_rebuilds_router():
+    @swapy.on_get('late')
+    def late():
+        return 'late'
+    assert c.get('late').data == b'late'
+
+
+def test_endpoints():
+    assert swapy._utils.endpoints(user) == ['routing_test.user:GET']
+    assert swapy._utils.find_route('routing_test.create:POST')['handler'] is create
+    assert swapy._utils.find_route('/files/:path')['handler'] is files
+
+
+def test_url_for():
+    assert swapy.url_for(root) == '/'
+    assert swapy.url_for(user, id=5) == '/users/5'
+    assert swapy.url_for('routing_test.files:GET', path='a/b.txt', v=2) == '/files/a/b.txt?v=2'
+    try:
+        swapy.url_for(user)
+    except BuildError:
+        pass
+    else:
+        assert False
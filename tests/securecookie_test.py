@@ -0,0 +1,79 @@
+import os
+import sys
+
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+
+import swapy
+from swapy import securecookie
+from swapy.testing import client
+
+swapy.environment({'secret_key': ['new', 'old']})
+swapy.secure_cookie(cookie_name='signed', max_age=3600)
+
+
+@swapy.on_get('set')
+def set_value(req):
+    req.secure_cookie['visits'] = req.secure_cookie.get('visits', 0) + 1
+    return str(req.secure_cookie['visits'])
+
+
+@swapy.on_get('get')
+def get_value(req):
+    return str(req.secure_cookie.get('visits'))
+
+
+c = client(swapy.app())
+
+
+def test_sign_and_verify():
+    signer = securecookie.signer('key')
+    value = securecookie.dumps({'a': 1}, signer)
+    assert securecookie.loads(value, signer) == {'a': 1}
+    assert securecookie.signer('key') is signer
+
+
+def test_rejects_tampering():
+    signer = securecookie.signer('key')
+    payload, signature = securecookie.dumps({'admin': False}, signer).rsplit('.', 1)
+    assert securecookie.loads(payload + '.' + signature[::-1], signer) is None
+    assert securecookie.loads(payload, signer) is None
+    assert securecookie.loads(securecookie.dumps({'admin': True}, securecookie.signer('other')), signer) is None
+
+
+def test_key_rotation():
+    old = securecookie.dumps({'a': 1}, securecookie.signer('old'))
+    rotated = securecookie.signer(['new', 'old'])
+    assert securecookie.loads(old, rotated) == {'a': 1}
+    assert securecookie.loads(securecookie.dumps({'a': 1}, rotated), securecookie.signer('new')) == {'a': 1}
+
+
+def test_max_age():
+    signer = securecookie.signer('key')
+    value = securecookie.dumps({'a': 1}, signer)
+    assert securecookie.loads(value, signer, max_age=60) == {'a': 1}
+    assert securecookie.loads(value, signer, max_age=-1) is None
+
+
+def test_request_cookie():
+    assert c.get('set').data == b'1'
+    assert c.get('set').data == b'2'
+    assert c.get('get').data == b'2'
+
+
+def test_request_cookie_signed_with_old_key():
+    cookie_client = client(swapy.app())
+    cookie_client.set_cookie('localhost', 'signed', securecookie.dumps({'visits': 5}, securecookie.signer('old')))
+    assert cookie_client.get('set').data == b'6'
+
+
+def test_unknown_serializer():
+    try:
+        swapy.secure_cookie(serializer='pickle')
+    except ValueError:
+        pass
+    else:
+        assert False
@@ -0,0 +1,181 @@
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.request import urlopen
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root)
+
+import swapy  # noqa: E402
+from swapy.serving import HTTPServer  # noqa: E402
+
+
+@swapy.on_get('port')
+def remote_port(req):
+    return req.environ['REMOTE_PORT']
+
+
+@swapy.on_post('echo')
+def echo(req):
+    return req.get_data()
+
+
+@swapy.on_get('file')
+def file():
+    return swapy.file(os.path.join(root, 'tests', 'favicon.png'))
+
+script = '''
+import os
+import sys
+sys.path.insert(0, {root!r})
+import swapy
+
+
+@swapy.on_get('pid')
+def pid():
+    return str(os.getpid())
+
+
+swapy.serve(port={port}, workers=2, max_requests=3)
+'''
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def get(port):
+    with urlopen('http://127.0.0.1:{}/pid'.format(port), timeout=5) as r:
+        return r.read().decode()
+
+
+def wait(port):
+    deadline = time.time() + 10
+    while True:
+        try:
+            return get(port)
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_prefork_server():
+    port = free_port()
+    p = subprocess.Popen([sys.executable, '-c', script.format(root=root, port=port)])
+    try:
+        wait(port)
+        pids = set(get(port) for _ in range(12))
+        # Workers are replaced after 3 requests
+        assert len(pids) >= 3
+        assert str(p.pid) not in pids
+        p.send_signal(signal.SIGHUP)
+        time.sleep(0.5)
+        wait(port)
+        p.send_signal(signal.SIGTERM)
+        assert p.wait(10) == 0
+    finally:
+        if p.poll() is None:
+            p.kill()
+
+
+def start_server(**options):
+    server = HTTPServer(swapy.app(), port=0, threads=2, **options)
+    server.bind()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+def raw_request(port, data):
+    sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+    sock.sendall(data)
+    received = b''
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        received += chunk
+    sock.close()
+    return received
+
+
+def test_http_server_keep_alive():
+    server, thread = start_server()
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+        ports = set()
+        for _ in range(5):
+            connection.request('GET', '/port')
+            r = connection.getresponse()
+            assert r.status == 200
+            ports.add(r.read())
+        # All requests used the same connection
+        assert len(ports) == 1
+        connection.request('POST', '/echo', body=b'hello')
+        assert connection.getresponse().read() == b'hello'
+        connection.request('POST', '/echo', body=iter([b'chunked ', b'body']), encode_chunked=True)
+        assert connection.getresponse().read() == b'chunked body'
+        connection.request('GET', '/file')
+        r = connection.getresponse()
+        with open(os.path.join(root, 'tests', 'favicon.png'), 'rb') as f:
+            assert r.read() == f.read()
+        connection.close()
+    finally:
+        server.shutdown()
+        thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_http_server_pipelining():
+    server, thread = start_server()
+    try:
+        request = b'GET /port HTTP/1.1\r\nHost: localhost\r\n\r\n'
+        close = b'POST /echo HTTP/1.1\r\nHost: localhost\r\nContent-Length: 4\r\nConnection: close\r\n\r\nlast'
+        response = raw_request(server.port, request * 3 + close)
+        assert response.count(b'HTTP/1.1 200 OK') == 4
+        assert response.endswith(b'last')
+        assert b'Connection: close' in response
+    finally:
+        server.shutdown()
+        thread.join(5)
+
+
+def test_http_server_limits():
+    server, thread = start_server(max_header_size=1024, max_body_size=10)
+    try:
+        response = raw_request(server.port, b'GET /port HTTP/1.1\r\nX-Large: ' + b'a' * 2048 + b'\r\n\r\n')
+        assert response.startswith(b'HTTP/1.1 431 ')
+        response = raw_request(server.port, b'POST /echo HTTP/1.1\r\nContent-Length: 11\r\n\r\n')
+        assert response.startswith(b'HTTP/1.1 413 ')
+        response = raw_request(server.port, b'GET /port HTTP/2.0\r\n\r\n')
+        assert response.startswith(b'HTTP/1.1 505 ')
+    finally:
+        server.shutdown()
+        thread.join(5)
+
+
+def test_http_server_idle_timeout():
+    server, thread = start_server(keep_alive_timeout=0.2)
+    try:
+        sock = socket.create_connection(('127.0.0.1', server.port), timeout=5)
+        sock.sendall(b'GET /port HTTP/1.1\r\n\r\n')
+        assert sock.recv(65536).startswith(b'HTTP/1.1 200 OK')
+        # The server closes the idle connection
+        assert sock.recv(65536) == b''
+        sock.close()
+    finally:
+        server.shutdown()
+        thread.join(5)
@@ -0,0 +1,149 @@
+import sys
+import os
+import tempfile
+import time
+import pytest
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+import swapy
+from swapy import hooks
+from swapy.sessions import MemorySessionStore, SQLiteSessionStore
+from swapy.testing import client
+
+swapy.config({
+    'session': {'store': 'memory', 'max_entries': 2}
+})
+swapy.set_env('secret_key', 'secret')
+
+
+@swapy.on_get('stateless')
+def stateless():
+    return 'ok'
+
+
+@swapy.on_get('set/<value>')
+def set_value(req, value):
+    req.session['key'] = value
+
+
+@swapy.on_get('get')
+def get_value(req):
+    return req.session.get('key', 'none')
+
+
+c = client(swapy.app())
+
+
+def test_no_session_without_access():
+    r = client(swapy.app()).get('stateless')
+    assert 'Set-Cookie' not in r.headers
+
+
+def test_memory_session():
+    c.get('set/memory')
+    assert c.get('get').data == b'memory'
+
+
+def test_memory_eviction():
+    store = MemorySessionStore(max_entries=2)
+    sessions = [store.new() for _ in range(3)]
+    for session in sessions:
+        session['key'] = 'value'
+        store.save(session)
+    assert len(store) == 2
+    assert store.get(sessions[0].sid).new
+    assert store.get(sessions[2].sid)['key'] == 'value'
+
+
+def test_memory_ttl():
+    store = MemorySessionStore(ttl=-1)
+    session = store.new()
+    session['key'] = 'value'
+    store.save(session)
+    assert store.get(session.sid).new
+
+
+def test_sqlite_store():
+    path = os.path.join(tempfile.mkdtemp(), 'sessions.sqlite3')
+    store = SQLiteSessionStore(path, batch_size=10)
+    session = store.new()
+    session['key'] = 'value'
+    store.save(session)
+    assert store.get(session.sid)['key'] == 'value'
+    store.close()
+    assert SQLiteSessionStore(path).get(session.sid)['key'] == 'value'
+
+
+def test_sqlite_store_timed_flush():
+    path = os.path.join(tempfile.mkdtemp(), 'sessions.sqlite3')
+    store = SQLiteSessionStore(path, batch_size=100, flush_interval=0.05)
+    session = store.new()
+    session['key'] = 'value'
+    store.save(session)
+    other = SQLiteSessionStore(path)
+    for _ in range(100):
+        if not other.get(session.sid).new:
+            break
+        time.sleep(0.02)
+    assert other.get(session.sid)['key'] == 'value'
+    store.close()
+    other.close()
+
+
+def test_sqlite_store_cleanup():
+    path = os.path.join(tempfile.mkdtemp(), 'sessions.sqlite3')
+    store = SQLiteSessionStore(path, ttl=-1)
+    session = store.new()
+    session['key'] = 'value'
+    store.save(session)
+    store.flush()
+    assert store.cleanup() == 1
+    assert store.cleanup() == 0
+    store.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_sqlite_store_forked():
+    path = os.path.join(tempfile.mkdtemp(), 'sessions.sqlite3')
+    store = SQLiteSessionStore(path, batch_size=100, flush_interval=3600)
+    parent = store.new()
+    parent['key'] = 'parent'
+    store.save(parent)
+    store.flush()
+    pid = os.fork()
+    if pid == 0:
+        # Exits like a worker of the PreforkServer, atexit functions don't run
+        code = 1
+        try:
+            if store.get(parent.sid)['key'] == 'parent':
+                session = store.new()
+                session.sid = 'child'
+                session['key'] = 'child'
+                store.save(session)
+                hooks.fire('worker_exit')
+                code = 0
+        finally:
+            os._exit(code)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert store.get('child')['key'] == 'child'
+    store.close()
+
+
+def test_cookie_store():
+    swapy.session_store('cookie')
+    cookie_client = client(swapy.app())
+    r = cookie_client.get('set/cookie')
+    assert 'session_data=' in r.headers['Set-Cookie']
+    assert cookie_client.get('get').data == b'cookie'
+    swapy.session_store('memory')
+
+
+def test_cookie_store_rejects_tampering():
+    swapy.session_store('cookie')
+    cookie_client = client(swapy.app())
+    cookie_client.set_cookie('localhost', 'session_data', 'eyJhIjoxfQ.invalid')
+    assert cookie_client.get('get').data == b'none'
+    swapy.session_store('memory')
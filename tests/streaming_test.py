@@ -0,0 +1,100 @@
+import os
+import sys
+import zlib
+
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+
+import swapy
+from swapy.testing import client
+from swapy.middlewares import JsonMiddleware
+from swapy.compression import compress_response
+
+closed = []
+
+
+def numbers():
+    try:
+        for i in range(3):
+            yield i
+    finally:
+        closed.append('generator')
+
+
+@swapy.on_get('stream')
+def stream():
+    return swapy.stream((str(i) for i in range(3)), 'text/plain')
+
+
+@swapy.on_get('ndjson')
+def ndjson():
+    return swapy.ndjson({'i': i} for i in numbers())
+
+
+@swapy.on_get('sse')
+def sse():
+    return swapy.sse(['hello', {'event': 'update', 'id': 1, 'data': {'a': 1}}, 'two\nlines'])
+
+
+@swapy.on_get('json_generator')
+@JsonMiddleware
+def json_generator():
+    return ({'i': i} for i in range(2))
+
+
+@swapy.on_get('hook')
+def hook():
+    return swapy.stream(numbers_text(), on_close=lambda: closed.append('hook'))
+
+
+def numbers_text():
+    for i in numbers():
+        yield str(i)
+
+
+c = client(swapy.app())
+
+
+def test_stream():
+    r = c.get('stream')
+    assert r.data == b'012'
+    assert r.headers['Content-Type'] == 'text/plain'
+    assert 'Content-Length' not in r.headers
+
+
+def test_ndjson():
+    r = c.get('ndjson')
+    assert r.headers['Content-Type'] == 'application/x-ndjson'
+    assert r.data == b'{"i":0}\n{"i":1}\n{"i":2}\n'
+
+
+def test_sse():
+    r = c.get('sse')
+    assert r.headers['Content-Type'] == 'text/event-stream'
+    assert r.headers['Cache-Control'] == 'no-cache'
+    assert r.data == b'data: hello\n\nid: 1\nevent: update\ndata: {"a":1}\n\ndata: two\ndata: lines\n\n'
+
+
+def test_json_middleware_generator():
+    r = c.get('json_generator')
+    assert r.data == b'{"i":0}\n{"i":1}\n'
+
+
+def test_close_on_disconnect():
+    del closed[:]
+    r = c.get('hook', buffered=False)
+    iterator = iter(r.response)
+    assert next(iterator) == b'0'
+    r.close()
+    assert 'generator' in closed and 'hook' in closed
+
+
+def test_compressed_stream():
+    response = compress_response(swapy.stream(iter(['a' * 10, 'b' * 10]), 'text/plain'), 'gzip')
+    chunks = list(response.content)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(chunks) == 3
+    assert zlib.decompress(b''.join(chunks), 31) == b'a' * 10 + b'b' * 10
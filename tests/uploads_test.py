@@ -0,0 +1,66 @@
+import hashlib
+import io
+import os
+import sys
+
+# Only for testing
+if os.path.exists('../swapy/__init__.py'):
+    sys.path.append(os.path.abspath('../'))
+else:
+    sys.path.append(os.path.abspath('./'))
+
+import swapy
+from swapy.testing import client
+
+swapy.uploads(max_content_length=1024 * 1024, max_form_memory=1024, spool_size=1024)
+
+
+@swapy.on_post('stream')
+def stream(req):
+    result = []
+    for part in req.stream_parts(chunk_size=100):
+        if part.is_file:
+            digest = hashlib.sha256()
+            for chunk in part:
+                digest.update(chunk)
+            result.append('{}={}:{}'.format(part.name, part.filename, digest.hexdigest()))
+        else:
+            result.append('{}={}'.format(part.name, part.text()))
+    return '\n'.join(result)
+
+
+@swapy.on_post('form')
+def form(req):
+    f = req.files['file']
+    return '{}:{}'.format(type(f.stream).__name__, f.stream._rolled)
+
+
+c = client(swapy.app())
+data = os.urandom(300000) + b'\r\n--' + os.urandom(5000)
+
+
+def test_stream_parts():
+    r = c.post('stream', data={'name': 'swapy', 'file': (io.BytesIO(data), 'data.bin'), 'other': 'x'})
+    assert r.status_code == 200
+    assert sorted(r.data.decode().split('\n')) == ['file=data.bin:' + hashlib.sha256(data).hexdigest(),
+                                                   'name=swapy', 'other=x']
+
+
+def test_field_limit():
+    r = c.post('stream', data={'name': 'x' * 2000}, content_type='multipart/form-data')
+    assert r.status_code == 413
+
+
+def test_content_length_limit():
+    r = c.post('stream', data={'file': (io.BytesIO(b'x' * (1024 * 1024 + 1)), 'big.bin')})
+    assert r.status_code == 413
+
+
+def test_spooled_files():
+    r = c.post('form', data={'file': (io.BytesIO(data), 'data.bin')})
+    assert r.data == b'SpooledTemporaryFile:True'
+
+
+def test_no_multipart():
+    r = c.post('stream', data='text')
+    assert r.status_code == 400